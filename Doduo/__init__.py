@@ -5,18 +5,63 @@ Doduo library: reads configs from Doduo/configs/ and models
 from Doduo/dumps/ to serve a Flask API at port 5000.
 """
 
-from gensim.models import KeyedVectors
-import numpy as np
-import spacy
+from threading import Lock
 
-from Doduo.config import ROOT_DIR, EMB_MODEL_FILE
+from Doduo.config import (
+    ROOT_DIR,
+    EMB_STORE_FILE,
+    EMB_SUBSET_FILE,
+    SPACY_MODEL,
+)
+from Doduo.embeddings import EmbeddingStore, SubsetStore
 
 
-# Model imports
-nlp = spacy.load("en_core_web_md")
-word_model = KeyedVectors.load_word2vec_format(
-    ROOT_DIR + "dumps/" + EMB_MODEL_FILE, binary=False
-)
+# Models are loaded on first use through get_nlp() and get_word_model().
+_models = {}
+_models_lock = Lock()
+
+
+def get_nlp():
+    """
+    Get the Spacy language model, loading it on first use.
+    """
+    if "nlp" not in _models:
+        with _models_lock:
+            if "nlp" not in _models:
+                import spacy
+
+                _models["nlp"] = spacy.load(SPACY_MODEL)
+    return _models["nlp"]
+
+
+def get_word_model():
+    """
+    Get the Numberbatch EmbeddingStore, opening it on first use.
+    The store is written once from the Numberbatch dump by
+    `python3.6 -m Doduo convert`. If EMB_SUBSET_FILE is set, the pruned
+    subset store is opened instead, backed by the full store.
+    """
+    if "word_model" not in _models:
+        with _models_lock:
+            if "word_model" not in _models:
+                store_path = ROOT_DIR + "dumps/" + EMB_STORE_FILE
+                try:
+                    if EMB_SUBSET_FILE is None:
+                        store = EmbeddingStore.open(store_path)
+                    else:
+                        store = SubsetStore(
+                            EmbeddingStore.open(
+                                ROOT_DIR + "dumps/" + EMB_SUBSET_FILE
+                            ),
+                            store_path,
+                        )
+                    _models["word_model"] = store
+                except FileNotFoundError:
+                    raise ConfigException(
+                        "Embedding store not found, "
+                        "run `python3.6 -m Doduo convert`."
+                    )
+    return _models["word_model"]
 
 
 def intersect(a, b):
@@ -35,7 +80,30 @@ class InvalidUsage(Exception):
     Catches invalid API calls.
     """
 
-    pass
+    status_code = 400
+
+    def __init__(self, message, status_code=None, payload=None):
+        """
+        Args:
+            message (str):     error message returned to the client.
+            status_code (int): HTTP status code, 400 by default.
+            payload (dict):    extra fields of the error response.
+        """
+        Exception.__init__(self, message)
+        self.message = message
+        if status_code is not None:
+            self.status_code = status_code
+        self.payload = payload
+
+    def to_dict(self):
+        """
+        Returns:
+            Dictionary body of the error response.
+        """
+        body = dict(self.payload or ())
+        body["success"] = False
+        body["error"] = self.message
+        return body
 
 
 class ConfigException(Exception):
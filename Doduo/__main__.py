@@ -1,12 +1,419 @@
 """
 Doduo/Doduo
 
-Bring up the Doduo Flask API by calling `python3.6 -m Doduo`.
+Bring up the Doduo Flask API by calling `python3.6 -m Doduo`. It is
+served by Gunicorn when installed (see Doduo.wsgi), or by Flask's
+development server with `--dev`.
+
+Other commands:
+    `python3.6 -m Doduo convert`: convert the Numberbatch text dump
+                                  into a binary embedding store.
+    `python3.6 -m Doduo match`:   match a JSON lines corpus of queries
+                                  into a JSON lines file of results.
+    `python3.6 -m Doduo compile`: compile a config into an artifact
+                                  the server can load at startup.
+    `python3.6 -m Doduo subset`:  cut the embedding store down to the
+                                  serving vocabulary.
+    `python3.6 -m Doduo quantize`: quantize the embedding store and
+                                   count the soft match verdicts that
+                                   flip on a corpus.
+    `python3.6 -m Doduo profile`: rank the costliest patterns of a
+                                  config over a replay of queries.
+    `python3.6 -m Doduo synthesize`: generate a random config and
+                                     parses to measure matching on.
 """
 
-from Doduo.server import app
+import argparse
+import logging
+import os
+import sys
+
+from Doduo.config import (
+    ROOT_DIR,
+    EMB_MODEL_FILE,
+    EMB_STORE_FILE,
+    EMB_STORE_DTYPE,
+    CONFIG_FILE,
+    PARSE_BATCH_SIZE,
+    MATCH_PROCESSES,
+    SERVE_HOST,
+    SERVE_PORT,
+    SERVE_THREADS,
+    SERVE_KEEPALIVE,
+    SERVE_TIMEOUT,
+)
+from Doduo.embeddings import STORE_DTYPES
+from Doduo.profiler import PROFILE_COUNTERS
+
+
+def serve(args):
+    """ Start the Flask API, with Gunicorn unless asked not to. """
+    if not args.dev:
+        try:
+            from Doduo import wsgi
+        except ImportError:
+            print("Gunicorn not installed, using the development server.")
+        else:
+            print("Server running at {}:{}".format(args.host, args.port))
+            wsgi.serve(
+                args.host,
+                args.port,
+                threads=args.threads,
+                keepalive=args.keepalive,
+                timeout=args.timeout,
+            )
+            return
+
+    from Doduo.server import app
+
+    print("Server running at {}:{}".format(args.host, args.port))
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+def convert(args):
+    """ Convert a word2vec text dump into a binary embedding store. """
+    from Doduo.embeddings import convert_word2vec
+
+    n = convert_word2vec(args.input, args.output, dtype=args.dtype)
+    print("Wrote {} word vectors to {}".format(n, args.output))
+
+
+def match(args):
+    """ Match a JSON lines corpus of queries against the config. """
+    from Doduo.matcher import Matcher
+    from Doduo.pool import MatcherPool
+    from Doduo.stream import match_jsonl, resume_jsonl
+
+    # Append to the results when resuming part way through the input,
+    # after their last complete line.
+    mode = "w"
+    if args.offset:
+        with open(args.output, "a+b") as output_file:
+            resume_jsonl(output_file, args.offset)
+        mode = "a"
+
+    pool = MatcherPool(Matcher(args.config), args.workers)
+    with open(args.input, "rb") as input_file:
+        with open(args.output, mode) as output_file:
+            with pool:
+                n = match_jsonl(
+                    pool,
+                    input_file,
+                    output_file,
+                    template_ids=args.templates,
+                    batch_size=args.batch_size,
+                    offset=args.offset,
+                )
+    print("Matched {} queries into {}".format(n, args.output), file=sys.stderr)
+
+
+def compile_config(args):
+    """ Compile a config into a binary artifact. """
+    from Doduo.matcher import Matcher
+
+    output = args.output
+    if output is None:
+        output = (
+            ROOT_DIR + "dumps/" + os.path.splitext(args.config)[0] + ".doduo"
+        )
+    Matcher(args.config).save(output)
+    print("Compiled {} into {}".format(args.config, output))
+
+
+def profile(args):
+    """ Rank the costliest patterns of a config over a query replay. """
+    import json
+
+    from Doduo.matcher import Matcher
+    from Doduo.profiler import profile_jsonl, format_report
+
+    matcher = Matcher(args.config, profile=True)
+    with open(args.input, "rb") as input_file:
+        n = profile_jsonl(matcher, input_file, args.templates, args.batch_size)
+    rows = matcher.profiler.report(args.sort, args.top)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print("Profiled {} queries against {}".format(n, args.config))
+    print(format_report(rows))
+
+
+def synthesize(args):
+    """ Write a synthetic config, and a JSON lines corpus of parses. """
+    import json
+
+    from Doduo.synthetic import SyntheticGenerator, dump
+
+    generator = SyntheticGenerator(
+        depth=args.depth,
+        branching=args.branching,
+        optional_ratio=args.optional_ratio,
+        soft_ratio=args.soft_ratio,
+        vocab_size=args.vocab_size,
+        seed=args.seed,
+    )
+    config = generator.templates(args.templates, args.patterns)
+    with open(args.output, "w") as f:
+        dump(config, f)
+    print("Wrote {} templates to {}".format(args.templates, args.output))
+    if args.trees:
+        trees_output = os.path.splitext(args.output)[0] + ".jsonl"
+        with open(trees_output, "w") as f:
+            for tokens in generator.trees(
+                config, args.trees, args.match_ratio
+            ):
+                record = {
+                    "query": " ".join(token[0] for token in tokens),
+                    "tokens": tokens,
+                }
+                f.write(json.dumps(record) + "\n")
+        print("Wrote {} parses to {}".format(args.trees, trees_output))
+
+
+def corpus_words(args):
+    """ Read the words of the --freq lists and --queries replays. """
+    from Doduo.subset import frequency_words, query_words
+
+    words = set()
+    for path in args.freq or []:
+        with open(path, "r", encoding="utf-8") as f:
+            words.update(frequency_words(f, args.top))
+    for path in args.queries or []:
+        with open(path, "rb") as f:
+            words.update(query_words(f))
+    return words
+
+
+def subset(args):
+    """ Cut the embedding store down to the serving vocabulary. """
+    from Doduo.embeddings import EmbeddingStore
+    from Doduo.subset import seed_words, build_subset
+
+    words = corpus_words(args)
+    for config in args.config:
+        words.update(seed_words(config))
+
+    store = EmbeddingStore.open(args.store)
+    n = build_subset(store, words, args.output)
+    print(
+        "Wrote {} of {} word vectors to {}".format(n, len(store), args.output)
+    )
+
+
+def quantize(args):
+    """ Quantize the embedding store and validate its verdicts. """
+    from Doduo.embeddings import EmbeddingStore, quantize_store
+    from Doduo.quantize import compare_verdicts
+    from Doduo.subset import soft_match_seeds
+
+    store = EmbeddingStore.open(args.store)
+    output = args.output or "{}.{}".format(args.store, args.dtype)
+    quantize_store(store, output, args.dtype)
+    quantized = EmbeddingStore.open(output)
+
+    def nbytes(s):
+        scales = 0 if s.scales is None else s.scales.nbytes
+        return s.vectors.nbytes + scales
+
+    print(
+        "Wrote {} word vectors to {} ({:.1f} MB, {:.1f}x smaller)".format(
+            len(quantized),
+            output,
+            nbytes(quantized) / 2**20,
+            nbytes(store) / nbytes(quantized),
+        )
+    )
+
+    words = corpus_words(args)
+    if not words:
+        return
+    seed_lists = [
+        seeds for config in args.config for seeds in soft_match_seeds(config)
+    ]
+    report = compare_verdicts(store, quantized, seed_lists, words)
+    print(
+        "{flips} of {decisions} soft match verdicts flipped over {words} "
+        "words and {models} models ({gained} gained, {lost} lost, "
+        "{positives} reference positives)".format(**report)
+    )
+    for model in report["flipped_models"]:
+        print(
+            "  {}: {}".format(
+                ", ".join(model["seeds"]), ", ".join(model["flipped"])
+            )
+        )
+
+
+def add_corpus_arguments(parser):
+    """ Add the arguments of a corpus of words to a parser. """
+    parser.add_argument(
+        "--freq", nargs="+", help="frequency lists, one word per line"
+    )
+    parser.add_argument(
+        "--top", type=int, default=None, help="words read per frequency list"
+    )
+    parser.add_argument(
+        "--queries", nargs="+", help="JSON lines replays of logged queries"
+    )
+
+
+def add_serve_arguments(parser):
+    """ Add the arguments of the serve command to a parser. """
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--threads", type=int, default=SERVE_THREADS)
+    parser.add_argument("--keepalive", type=int, default=SERVE_KEEPALIVE)
+    parser.add_argument("--timeout", type=int, default=SERVE_TIMEOUT)
+    parser.add_argument(
+        "--dev",
+        action="store_true",
+        help="use Flask's development server instead of Gunicorn",
+    )
+    parser.set_defaults(func=serve)
+
+
+def build_parser():
+    """ Build the command line argument parser. """
+    parser = argparse.ArgumentParser(prog="Doduo")
+    add_serve_arguments(parser)
+    commands = parser.add_subparsers()
+
+    serve_parser = commands.add_parser("serve", help="start the Flask API")
+    add_serve_arguments(serve_parser)
+
+    convert_parser = commands.add_parser(
+        "convert", help="convert word embeddings to a binary store"
+    )
+    convert_parser.add_argument(
+        "--input", default=ROOT_DIR + "dumps/" + EMB_MODEL_FILE
+    )
+    convert_parser.add_argument(
+        "--output", default=ROOT_DIR + "dumps/" + EMB_STORE_FILE
+    )
+    convert_parser.add_argument(
+        "--dtype", default=EMB_STORE_DTYPE, choices=STORE_DTYPES
+    )
+    convert_parser.set_defaults(func=convert)
+
+    match_parser = commands.add_parser(
+        "match", help="match a JSON lines corpus of queries"
+    )
+    match_parser.add_argument("--input", required=True)
+    match_parser.add_argument("--output", required=True)
+    match_parser.add_argument("--config", default=CONFIG_FILE)
+    match_parser.add_argument("--templates", nargs="+", default=None)
+    match_parser.add_argument(
+        "--batch-size", type=int, default=PARSE_BATCH_SIZE
+    )
+    match_parser.add_argument("--workers", type=int, default=MATCH_PROCESSES)
+    match_parser.add_argument(
+        "--offset",
+        type=int,
+        default=0,
+        help="input byte offset to resume from",
+    )
+    match_parser.set_defaults(func=match)
+
+    compile_parser = commands.add_parser(
+        "compile", help="compile a config into a binary artifact"
+    )
+    compile_parser.add_argument("--config", default=CONFIG_FILE)
+    compile_parser.add_argument(
+        "--output", default=None, help="defaults to dumps/<config>.doduo"
+    )
+    compile_parser.set_defaults(func=compile_config)
+
+    profile_parser = commands.add_parser(
+        "profile", help="rank the costliest patterns over a query replay"
+    )
+    profile_parser.add_argument("--input", required=True)
+    profile_parser.add_argument("--config", default=CONFIG_FILE)
+    profile_parser.add_argument("--templates", nargs="+", default=None)
+    profile_parser.add_argument(
+        "--batch-size", type=int, default=PARSE_BATCH_SIZE
+    )
+    profile_parser.add_argument(
+        "--sort", default="seconds", choices=PROFILE_COUNTERS
+    )
+    profile_parser.add_argument(
+        "--top", type=int, default=20, help="number of patterns reported"
+    )
+    profile_parser.add_argument(
+        "--json", action="store_true", help="print the report as JSON"
+    )
+    profile_parser.set_defaults(func=profile)
+
+    subset_parser = commands.add_parser(
+        "subset", help="cut the embedding store to the serving vocabulary"
+    )
+    subset_parser.add_argument(
+        "--store", default=ROOT_DIR + "dumps/" + EMB_STORE_FILE
+    )
+    subset_parser.add_argument(
+        "--output", default=ROOT_DIR + "dumps/" + EMB_STORE_FILE + ".subset"
+    )
+    add_corpus_arguments(subset_parser)
+    subset_parser.add_argument(
+        "--config", nargs="+", default=[CONFIG_FILE], help="configs to seed"
+    )
+    subset_parser.set_defaults(func=subset)
+
+    quantize_parser = commands.add_parser(
+        "quantize", help="quantize the embedding store and validate it"
+    )
+    quantize_parser.add_argument(
+        "--store", default=ROOT_DIR + "dumps/" + EMB_STORE_FILE
+    )
+    quantize_parser.add_argument(
+        "--output", default=None, help="defaults to <store>.<dtype>"
+    )
+    quantize_parser.add_argument(
+        "--dtype", default="int8", choices=STORE_DTYPES
+    )
+    add_corpus_arguments(quantize_parser)
+    quantize_parser.add_argument(
+        "--config", nargs="+", default=[CONFIG_FILE], help="configs to check"
+    )
+    quantize_parser.set_defaults(func=quantize)
+
+    synthesize_parser = commands.add_parser(
+        "synthesize", help="generate a random config and parses"
+    )
+    synthesize_parser.add_argument(
+        "--output",
+        required=True,
+        help="config file to write, e.g. configs/synthetic_500.yml",
+    )
+    synthesize_parser.add_argument("--templates", type=int, default=100)
+    synthesize_parser.add_argument(
+        "--patterns", type=int, default=2, help="patterns per template"
+    )
+    synthesize_parser.add_argument("--depth", type=int, default=3)
+    synthesize_parser.add_argument("--branching", type=int, default=2)
+    synthesize_parser.add_argument("--optional-ratio", type=float, default=0.2)
+    synthesize_parser.add_argument(
+        "--soft-ratio",
+        type=float,
+        default=0.0,
+        help="synthetic soft match words are not in Numberbatch",
+    )
+    synthesize_parser.add_argument("--vocab-size", type=int, default=1000)
+    synthesize_parser.add_argument(
+        "--trees",
+        type=int,
+        default=0,
+        help="number of parses written next to the config",
+    )
+    synthesize_parser.add_argument("--match-ratio", type=float, default=0.5)
+    synthesize_parser.add_argument("--seed", type=int, default=0)
+    synthesize_parser.set_defaults(func=synthesize)
+
+    return parser
 
 
 if __name__ == "__main__":
-    print("Server running at localhost:5000")
-    app.run(host="0.0.0.0", port=5000)
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(name)s: %(message)s"
+    )
+    args = build_parser().parse_args()
+    args.func(args)
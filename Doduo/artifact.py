@@ -0,0 +1,171 @@
+"""
+Doduo/Doduo.artifact
+
+Binary format of compiled Matcher artifacts, written by
+`python3.6 -m Doduo compile`. An artifact holds the fully compiled
+templates (predicates, soft match models and the pattern index), so
+loading it skips YAML parsing and soft match model fitting.
+
+Layout: the ARTIFACT_MAGIC bytes, then a pickled header dictionary
+(format version, config file name and hash, embedding store) and the
+pickled payload. Artifacts are pickles: only load trusted files.
+
+Soft match models are fitted on the embedding store's vectors, so an
+artifact is refused when the store it was compiled against differs
+from the store currently configured: in name, dtype, shape, or content
+(its vocabulary, row scales and a sample of its vector rows).
+"""
+
+import os
+import pickle
+from hashlib import sha1
+
+import numpy as np
+
+from Doduo.config import ROOT_DIR, EMB_STORE_FILE, EMB_SUBSET_FILE
+from Doduo.embeddings import EmbeddingStore
+from Doduo import ConfigException
+
+
+ARTIFACT_MAGIC = b"DODUOART"
+# Bumped whenever the pickled classes or the header change
+# incompatibly.
+ARTIFACT_VERSION = 3
+# Number of evenly strided vector rows hashed into a store's
+# fingerprint, along with its whole vocabulary.
+FINGERPRINT_ROWS = 1024
+
+
+def config_hash(config_file):
+    """
+    Args:
+        config_file (str): config file name, under configs/, or None.
+    Returns:
+        Hex SHA-1 digest of the config file, or None if missing.
+    """
+    if config_file is None:
+        return None
+    try:
+        with open(ROOT_DIR + "configs/" + config_file, "rb") as f:
+            return sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def store_fingerprint(store):
+    """
+    Args:
+        store (EmbeddingStore): store to fingerprint.
+    Returns:
+        Hex SHA-1 digest of the store's vocabulary, row scales and
+        FINGERPRINT_ROWS evenly strided vector rows.
+    """
+    digest = sha1()
+    digest.update(np.ascontiguousarray(store.vocab))
+    step = max(1, len(store) // FINGERPRINT_ROWS)
+    digest.update(np.ascontiguousarray(store.vectors[::step]))
+    if store.scales is not None:
+        digest.update(np.ascontiguousarray(store.scales))
+    return digest.hexdigest()
+
+
+def store_signature():
+    """
+    Returns:
+        Tuple of the (name, vector dtype, vector shape, fingerprint) of
+        the configured embedding store and subset store, all but the
+        name being None if the store is missing, and the subset None
+        if not set.
+    """
+    signature = []
+    for name in (EMB_STORE_FILE, EMB_SUBSET_FILE):
+        if name is None:
+            signature.append(None)
+            continue
+        try:
+            store = EmbeddingStore.open(ROOT_DIR + "dumps/" + name)
+        except (OSError, ValueError):
+            signature.append((name, None, None, None))
+            continue
+        signature.append(
+            (
+                name,
+                store.dtype,
+                store.vectors.shape,
+                store_fingerprint(store),
+            )
+        )
+    return tuple(signature)
+
+
+def write_artifact(path, config_file, payload):
+    """
+    Write an artifact, replacing any previous file atomically.
+
+    Args:
+        path (str):        artifact file path.
+        config_file (str): name of the config file compiled, or None.
+        payload:           picklable compiled templates.
+    """
+    header = {
+        "version": ARTIFACT_VERSION,
+        "config_file": config_file,
+        "config_hash": config_hash(config_file),
+        "emb_store": store_signature(),
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(ARTIFACT_MAGIC)
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def read_artifact(path, config_file=None):
+    """
+    Read an artifact, checking its format version and embedding store.
+
+    Args:
+        path (str):        artifact file path.
+        config_file (str): if set, also check the artifact was compiled
+                           from the current contents of this config.
+    Returns:
+        (header, payload) tuple.
+    Raises:
+        ConfigException: if the artifact is missing, invalid, of
+                         another format version, compiled against
+                         another embedding store or stale.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(ARTIFACT_MAGIC)) != ARTIFACT_MAGIC:
+                raise ConfigException(
+                    "'{}' is not a Doduo artifact.".format(path)
+                )
+            header = pickle.load(f)
+            if header.get("version") != ARTIFACT_VERSION:
+                raise ConfigException(
+                    "Artifact '{}' has format version {}, expected {}; "
+                    "recompile it.".format(
+                        path, header.get("version"), ARTIFACT_VERSION
+                    )
+                )
+            if header["emb_store"] != store_signature():
+                raise ConfigException(
+                    "Artifact '{}' was compiled against another embedding "
+                    "store; recompile it.".format(path)
+                )
+            if config_file is not None and (
+                header["config_file"] != config_file
+                or header["config_hash"] != config_hash(config_file)
+            ):
+                raise ConfigException(
+                    "Artifact '{}' is stale for config '{}'; "
+                    "recompile it.".format(path, config_file)
+                )
+            payload = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError) as e:
+        raise ConfigException(
+            "Artifact '{}' could not be read: {}".format(path, e)
+        )
+    return header, payload
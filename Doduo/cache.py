@@ -0,0 +1,134 @@
+"""
+Doduo/Doduo.cache
+
+Bounded caches shared by the matching pipeline.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+# Counters of LRUCache.stats, summed by merge_stats.
+COUNTERS = ("size", "maxsize", "hits", "misses", "evictions", "expirations")
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded least-recently-used cache that counts
+    its hits, misses, evictions and expirations. Entries optionally
+    expire a fixed time after they were inserted.
+    """
+
+    def __init__(self, maxsize, ttl=None, clock=monotonic):
+        """
+        Args:
+            maxsize (int):    maximum number of entries held. A maxsize
+                              of 0 disables the cache.
+            ttl (float):      seconds an entry stays valid, or None for
+                              no expiry.
+            clock (callable): time source, in seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Map of keys to (value, expiry time or None) pairs.
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        """
+        Look up a key, marking it as recently used.
+
+        Args:
+            key (hashable): cache key.
+            default:        value returned on a miss.
+        Returns:
+            The cached value, or default on a miss.
+        """
+        with self._lock:
+            try:
+                value, expiry = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expiry is not None and self.clock() >= expiry:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Insert a value, evicting the least recently used entries
+        past maxsize.
+
+        Args:
+            key (hashable): cache key.
+            value:          value to cache.
+        """
+        if self.maxsize <= 0:
+            return
+        expiry = None if self.ttl is None else self.clock() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expiry)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """ Drop all entries and reset the counters. """
+        with self._lock:
+            self._data.clear()
+            self.reset_stats()
+
+    def reset_stats(self):
+        """ Reset the counters, keeping the entries. """
+        self.hits = self.misses = 0
+        self.evictions = self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        Returns:
+            Dictionary of the cache's size and counters.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def merge_stats(stats_list):
+    """
+    Sum the statistics of caches of the same kind, e.g. the copies of
+    a cache held by several processes.
+
+    Args:
+        stats_list (list): dictionaries returned by LRUCache.stats.
+    Returns:
+        Dictionary of the summed statistics.
+    """
+    merged = {name: 0 for name in COUNTERS}
+    for stats in stats_list:
+        for name in COUNTERS:
+            merged[name] += stats[name]
+    lookups = merged["hits"] + merged["misses"]
+    merged["hit_rate"] = merged["hits"] / lookups if lookups else 0.0
+    return merged
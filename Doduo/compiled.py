@@ -0,0 +1,230 @@
+"""
+Doduo/Doduo.compiled
+
+Integer-coded predicate programs compiled from Template blueprints.
+Each Template vertex compiles its constraints into a Predicate of
+frozensets of label ids and words, so testing a sentence token
+against it takes a few O(1) set lookups.
+"""
+
+from Doduo.labels import label_id, label_name
+
+
+def names(ids):
+    """
+    Args:
+        ids (iterable): label ids.
+    Returns:
+        Frozenset of the label names.
+    """
+    return frozenset(map(label_name, ids))
+
+
+class Predicate:
+    """
+    Compiled node constraints of a single Template vertex.
+
+    A token passes if its dependency label is in `rels` (when set) and,
+    if any match constraint is set, it passes at least one of them:
+    its word is in `exact`, its NER or POS label is in `ner`, its POS
+    label is in `pos`, or the soft match model accepts it.
+    """
+
+    __slots__ = (
+        "rels",
+        "exact",
+        "case_sensitive",
+        "ner",
+        "pos",
+        "soft",
+        "constrained",
+    )
+
+    def __init__(
+        self,
+        rels=None,
+        exact_match=None,
+        case_sensitive=False,
+        ner_match=None,
+        pos_match=None,
+        soft_match=None,
+    ):
+        """
+        Args:
+            rels (list):            valid relationships with parents.
+            exact_match (list):     strings to exactly match against.
+            case_sensitive (bool):  enforce case sensitivity of exact_match?
+            ner_match (list):       valid named entity tags.
+            pos_match (list):       valid part of sentence tags.
+            soft_match (callable):  soft match model, or None.
+        """
+        self.rels = frozenset(label_id(x) for x in rels) if rels else None
+        if case_sensitive:
+            self.exact = frozenset(exact_match or [])
+        else:
+            self.exact = frozenset(x.lower() for x in exact_match or [])
+        self.case_sensitive = case_sensitive
+        self.ner = frozenset(label_id(x) for x in ner_match or [])
+        self.pos = frozenset(label_id(x) for x in pos_match or [])
+        self.soft = soft_match
+        self.constrained = bool(
+            self.exact or self.ner or self.pos or self.soft is not None
+        )
+
+    def __getstate__(self):
+        # Label ids are only meaningful within a process, so labels
+        # are pickled by name.
+        return {
+            "rels": names(self.rels) if self.rels is not None else None,
+            "exact": self.exact,
+            "case_sensitive": self.case_sensitive,
+            "ner": names(self.ner),
+            "pos": names(self.pos),
+            "soft": self.soft,
+            "constrained": self.constrained,
+        }
+
+    def __setstate__(self, state):
+        rels = state["rels"]
+        self.rels = (
+            frozenset(map(label_id, rels)) if rels is not None else None
+        )
+        self.exact = state["exact"]
+        self.case_sensitive = state["case_sensitive"]
+        self.ner = frozenset(map(label_id, state["ner"]))
+        self.pos = frozenset(map(label_id, state["pos"]))
+        self.soft = state["soft"]
+        self.constrained = state["constrained"]
+
+    def test(self, sentence, i):
+        """
+        Test a sentence token against the predicate.
+
+        Args:
+            sentence (Sentence): parsed query sentence.
+            i (int):             index of the token.
+        Returns:
+            Boolean of whether the token passes.
+        """
+        if self.rels is not None and sentence.dep[i] not in self.rels:
+            return False
+        if not self.constrained:
+            return True
+        if self.case_sensitive:
+            if sentence.words[i] in self.exact:
+                return True
+        elif sentence.lower[i] in self.exact:
+            return True
+        pos = sentence.pos[i]
+        if pos in self.pos or pos in self.ner or sentence.ent[i] in self.ner:
+            return True
+        return self.soft is not None and self.soft(sentence.words[i])
+
+    def signature(self):
+        """
+        Returns:
+            Hashable tuple identifying the predicate's constraints.
+            Predicates with equal signatures accept the same tokens.
+        """
+        soft = None
+        if self.soft is not None:
+            soft = getattr(self.soft, "model_id", id(self.soft))
+        return (
+            self.rels,
+            self.exact,
+            self.case_sensitive,
+            self.ner,
+            self.pos,
+            soft,
+        )
+
+    def describe(self):
+        """
+        Returns:
+            Dictionary of the predicate's constraints with label names.
+        """
+        return {
+            "rels": sorted(label_name(x) for x in self.rels or []),
+            "exact_match": sorted(self.exact),
+            "case_sensitive": self.case_sensitive,
+            "ner_match": sorted(label_name(x) for x in self.ner),
+            "pos_match": sorted(label_name(x) for x in self.pos),
+            "soft_match": self.soft is not None,
+        }
+
+
+class CompiledPattern:
+    """
+    Flattened, inspectable program of a Template tree.
+
+    Vertices are numbered in pre-order: `predicates[n]` holds the
+    compiled constraints of vertex n, `children[n]` the vertex numbers
+    of its children and `optional[n]` whether it may go unmatched.
+    """
+
+    def __init__(self, template):
+        """
+        Args:
+            template (Template): root of the compiled Template tree.
+        """
+        self.template = template
+        self.nodes = []
+        self.predicates = []
+        self.children = []
+        self.optional = []
+
+        def __flatten(node):
+            n = len(self.nodes)
+            self.nodes.append(node)
+            self.predicates.append(node.predicate)
+            self.children.append([])
+            self.optional.append(node.optional)
+            self.children[n] = [__flatten(child) for child in node.children]
+            return n
+
+        __flatten(template)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def test(self, sentence, i, node=0):
+        """
+        Test a sentence token against a single vertex's predicate.
+
+        Args:
+            sentence (Sentence): parsed query sentence.
+            i (int):             index of the token.
+            node (int):          vertex number, the root by default.
+        Returns:
+            Boolean of whether the token passes.
+        """
+        return self.predicates[node].test(sentence, i)
+
+    def match(self, sentence, i):
+        """
+        Match the whole pattern against the subtree of a token.
+
+        Args:
+            sentence (Sentence): parsed query sentence.
+            i (int):             index of the candidate token.
+        Returns:
+            List of slot assignments, or False.
+        """
+        return self.template.match_at(sentence, i)
+
+    def describe(self):
+        """
+        Returns:
+            List of dictionaries describing each vertex in pre-order.
+        """
+        return [
+            dict(
+                predicate.describe(),
+                children=children,
+                optional=optional,
+                slot_name=node.slot_name,
+            )
+            for node, predicate, children, optional in zip(
+                self.nodes, self.predicates, self.children, self.optional
+            )
+        ]
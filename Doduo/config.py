@@ -7,14 +7,123 @@ Doduo configuration settings.
 import os
 
 
-# File name of the default config file.
+# File name of the default config file, overridden by the
+# DODUO_CONFIG environment variable.
 # TODO: Change this to point to your config!
-CONFIG_FILE = "beer.yml"
+CONFIG_FILE = os.environ.get("DODUO_CONFIG", "beer.yml")
+# Compiled artifact of the config to load at startup instead of the
+# YAML, from the DODUO_ARTIFACT environment variable (None: no
+# artifact). Stale artifacts are ignored in favour of the YAML.
+ARTIFACT_FILE = os.environ.get("DODUO_ARTIFACT")
+# Seconds between checks of the config file for changes to hot-reload
+# (None: only reload through the admin endpoint).
+CONFIG_RELOAD_INTERVAL = None
+# Seconds the matching workers of a replaced config keep serving
+# in-flight requests before being stopped.
+CONFIG_RELOAD_GRACE = 120
+# Token required by the admin endpoints in the X-Admin-Token header,
+# from the DODUO_ADMIN_TOKEN environment variable (None: the admin
+# endpoints are disabled).
+ADMIN_TOKEN = os.environ.get("DODUO_ADMIN_TOKEN")
+# Multiprocessing start method of the worker pools of reloaded configs.
+# Reloads run alongside request threads, whose held locks a forked
+# worker would inherit held, so their workers are not forked from the
+# server but started afresh, sent the compiled Matcher and warmed up
+# before the pool is swapped in.
+RELOAD_START_METHOD = "forkserver"
 
-# File name of the word embedding file.
+# Name of the Spacy language model.
+SPACY_MODEL = "en_core_web_md"
+
+# File name of the word embedding text dump.
 EMB_MODEL_FILE = "numberbatch-en-17.06.txt.gz"
+# Path prefix (under dumps/) of the converted binary embedding store,
+# overridden by the DODUO_EMB_STORE environment variable, e.g. to serve
+# a quantized store.
+EMB_STORE_FILE = os.environ.get("DODUO_EMB_STORE", "numberbatch-en-17.06")
+# Path prefix (under dumps/) of a pruned subset of the store to serve
+# from, falling back to the full store, from the DODUO_EMB_SUBSET
+# environment variable (None: serve the full store).
+EMB_SUBSET_FILE = os.environ.get("DODUO_EMB_SUBSET")
+# Dtype used when converting the embedding dump ("float32", "float16"
+# or "int8").
+EMB_STORE_DTYPE = "float32"
 # The default cosine distance to permit.
 SLACK_DEFAULT = 0.1
+# Soft match sample sets larger than this are searched through an
+# approximate nearest-neighbour (random-projection LSH) index.
+SOFT_INDEX_THRESHOLD = 2048
+# Number of hash tables in the soft match LSH index.
+SOFT_INDEX_TABLES = 8
+# Target number of samples per LSH bucket.
+SOFT_INDEX_BUCKET_SIZE = 8
+# Number of normalized word embeddings cached per process.
+EMBED_CACHE_SIZE = 65536
+# Number of (soft model, word) membership verdicts cached per process.
+SOFT_VERDICT_CACHE_SIZE = 262144
+
+# Number of texts Spacy parses per batch in Matcher.match_many.
+PARSE_BATCH_SIZE = 256
+# Number of processes Spacy parses batches with (1: in-process).
+PARSE_PROCESSES = 1
+
+# Number of worker processes matching requests (1: in-process).
+MATCH_PROCESSES = 1
+# Seconds a new pool's workers may take to load their models.
+WORKER_START_TIMEOUT = 300
+# Seconds between the statistics reports a busy matching worker sends
+# to the server, read by /stats and /metrics.
+STATS_REPORT_INTERVAL = 1.0
+
+# Number of parsed queries cached per process, and seconds before a
+# cached parse expires (None: never).
+PARSE_CACHE_SIZE = 4096
+PARSE_CACHE_TTL = None
+# Number of Matcher.match results cached per process (0: disabled),
+# and seconds before cached results expire (None: never).
+MATCH_CACHE_SIZE = 0
+MATCH_CACHE_TTL = None
+
+# Serving: bind address, request threads, seconds to keep idle
+# connections alive and seconds before a stuck worker is restarted.
+SERVE_HOST = "0.0.0.0"
+SERVE_PORT = 5000
+SERVE_THREADS = 8
+SERVE_KEEPALIVE = 5
+SERVE_TIMEOUT = 120
+
+# Record stage latency histograms and counters, served at /metrics,
+# unless the DODUO_METRICS environment variable is "0". Timing every
+# pattern of every template is costlier, and enabled separately.
+METRICS_ENABLED = os.environ.get("DODUO_METRICS", "1") != "0"
+METRICS_PATTERNS = False
+# Upper bounds (seconds) of the latency histogram buckets.
+METRICS_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+# Matching search bounds. If MATCH_FIRST_ONLY, each template stops at
+# its first successful match and reports no alternatives.
+MATCH_FIRST_ONLY = False
+# Maximum number of alternatives reported per template (None: no bound).
+MAX_ALTERNATIVES = None
+# Drop duplicate slot assignments from each template's results.
+DEDUPE_MATCHES = False
+# Maximum number of hypotheses kept per template vertex (None: no bound).
+MAX_HYPOTHESES = None
 
 # Root directory.
 if os.path.exists("/.dockerenv"):
@@ -0,0 +1,394 @@
+"""
+Doduo/Doduo.embeddings
+
+Binary, memory-mapped word embedding store. The Numberbatch text dump
+is converted once into a row-normalized vector matrix and a sorted
+vocabulary index (both `.npy` files). Opening the store maps both
+files read-only through `np.memmap`, so startup is near-instant and
+worker processes share the pages through the OS page cache.
+
+Convert a dump by calling:
+    `python3.6 -m Doduo convert [--dtype float16]`
+
+Quantized stores cut memory per worker: float16 halves the matrix and
+int8 quarters it. int8 rows are stored with a per-row float32 scale
+(a third `.npy` file), chosen so that dequantized rows are norm-1.
+Quantize an existing store, and count the soft match verdicts that
+flip against it (see Doduo.quantize), by calling:
+    `python3.6 -m Doduo quantize --dtype int8`
+
+A SubsetStore serves a pruned store cut to the serving vocabulary
+(see Doduo.subset), falling back lazily to the full store.
+"""
+
+import gzip
+import os
+from threading import Lock
+
+import numpy as np
+
+
+# Suffixes of the files composing a store.
+VECTORS_SUFFIX = ".vectors.npy"
+VOCAB_SUFFIX = ".vocab.npy"
+SCALES_SUFFIX = ".scales.npy"
+
+# Supported dtypes for the stored vector matrix.
+STORE_DTYPES = ("float32", "float16", "int8")
+# Stored dtypes whose rows carry a per-row scale.
+SCALED_DTYPES = ("int8",)
+
+
+class EmbeddingStore:
+    """
+    Read-only word embedding store backed by memory-mapped arrays.
+
+    Rows of the vector matrix are norm-1 and ordered to match the
+    sorted vocabulary index, so a word lookup is a binary search over
+    the vocabulary followed by a row read. Quantized int8 rows are
+    multiplied back by their scale on lookup.
+    """
+
+    def __init__(self, vectors, vocab, scales=None):
+        """
+        Args:
+            vectors (np.ndarray): (n, dim) matrix of norm-1 word vectors,
+                                  or of quantized rows if scales is set.
+            vocab (np.ndarray):   sorted (n,) array of utf-8 encoded words.
+            scales (np.ndarray):  (n,) array of row scales, or None.
+        """
+        if len(vectors) != len(vocab):
+            raise ValueError("Vector and vocabulary sizes do not match.")
+        if scales is not None and len(scales) != len(vocab):
+            raise ValueError("Scale and vocabulary sizes do not match.")
+        self.vectors = vectors
+        self.vocab = vocab
+        self.scales = scales
+
+    @classmethod
+    def open(cls, path):
+        """
+        Memory-map a store written by `convert_word2vec`.
+
+        Args:
+            path (str): store path, without the file suffixes.
+        Returns:
+            EmbeddingStore instance.
+        """
+        vectors = np.load(path + VECTORS_SUFFIX, mmap_mode="r")
+        vocab = np.load(path + VOCAB_SUFFIX, mmap_mode="r")
+        scales = None
+        if vectors.dtype.name in SCALED_DTYPES:
+            scales = np.load(path + SCALES_SUFFIX, mmap_mode="r")
+        return cls(vectors, vocab, scales)
+
+    @property
+    def dtype(self):
+        """ Name of the stored vector dtype. """
+        return self.vectors.dtype.name
+
+    @property
+    def dim(self):
+        """ Dimensionality of the word vectors. """
+        return self.vectors.shape[1]
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def index(self, word):
+        """
+        Find the row of a word in the store.
+
+        Args:
+            word (str): word to look up.
+        Returns:
+            Integer row index, or -1 if the word is out of vocabulary.
+        """
+        key = word.encode("utf-8")
+        if len(key) > self.vocab.dtype.itemsize:
+            return -1
+        i = int(np.searchsorted(self.vocab, key))
+        if i < len(self.vocab) and self.vocab[i] == key:
+            return i
+        return -1
+
+    def get(self, word, default=None):
+        """
+        Look up the vector of a word.
+
+        Args:
+            word (str): word to look up.
+            default:    value returned if the word is out of vocabulary.
+        Returns:
+            Row of the vector matrix, or default.
+        """
+        i = self.index(word)
+        if i < 0:
+            return default
+        return self.row(i)
+
+    def row(self, i):
+        """
+        Read a row of the vector matrix.
+
+        Args:
+            i (int): row index.
+        Returns:
+            (dim,) norm-1 vector, dequantized to float32 for scaled
+            stores and as stored otherwise.
+        """
+        if self.scales is None:
+            return self.vectors[i]
+        return self.vectors[i].astype(np.float32) * self.scales[i]
+
+    def __contains__(self, word):
+        return self.index(word) >= 0
+
+    def __getitem__(self, word):
+        i = self.index(word)
+        if i < 0:
+            raise KeyError(word)
+        return self.row(i)
+
+
+class SubsetStore:
+    """
+    Pruned EmbeddingStore backed by the full store it was cut from.
+
+    Lookups go to the small subset store first. Words missing from it
+    fall back to the full store, which is only opened on the first
+    such miss, so deployments whose traffic stays within the subset
+    never map the full store at all.
+    """
+
+    def __init__(self, subset, fallback_path):
+        """
+        Args:
+            subset (EmbeddingStore): pruned store.
+            fallback_path (str):     path of the full store, without the
+                                     file suffixes, or None.
+        """
+        self.subset = subset
+        self.fallback_path = fallback_path
+        self._fallback = None
+        self._lock = Lock()
+
+    @property
+    def dim(self):
+        """ Dimensionality of the word vectors. """
+        return self.subset.dim
+
+    def __len__(self):
+        return len(self.subset)
+
+    def fallback(self):
+        """
+        Get the full store, opening it on first use.
+
+        Returns:
+            The full EmbeddingStore, or None if it is unavailable.
+        """
+        if self._fallback is None:
+            with self._lock:
+                if self._fallback is None:
+                    store = False
+                    if self.fallback_path is not None:
+                        try:
+                            store = EmbeddingStore.open(self.fallback_path)
+                        except FileNotFoundError:
+                            pass
+                    self._fallback = store
+        return self._fallback or None
+
+    def get(self, word, default=None):
+        """
+        Look up the vector of a word, see EmbeddingStore.get.
+        """
+        vec = self.subset.get(word)
+        if vec is None:
+            fallback = self.fallback()
+            if fallback is not None:
+                vec = fallback.get(word)
+        return default if vec is None else vec
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def __getitem__(self, word):
+        vec = self.get(word)
+        if vec is None:
+            raise KeyError(word)
+        return vec
+
+
+def subset_store(store, words, dst_path):
+    """
+    Write the rows of a store's words to a new, pruned store.
+
+    Args:
+        store (EmbeddingStore): store to cut the subset from.
+        words (iterable):       words to keep. Words missing from the
+                                store are skipped.
+        dst_path (str):         store path to write, without the file
+                                suffixes.
+    Returns:
+        Number of words written.
+    """
+    # Sorted rows of a sorted vocabulary keep the subset sorted.
+    rows = sorted({i for i in (store.index(w) for w in words) if i >= 0})
+    rows = np.array(rows, dtype=np.int64)
+    np.save(dst_path + VOCAB_SUFFIX, np.asarray(store.vocab[rows]))
+    np.save(dst_path + VECTORS_SUFFIX, np.asarray(store.vectors[rows]))
+    if store.scales is not None:
+        np.save(dst_path + SCALES_SUFFIX, np.asarray(store.scales[rows]))
+    return len(rows)
+
+
+def quantize(vecs, dtype):
+    """
+    Quantize norm-1 vectors into a stored dtype.
+
+    int8 rows are scaled so their largest component maps to 127, and
+    their scale is the inverse norm of the rounded row, so that scaled
+    rows are exactly norm-1 and dot products stay cosine similarities.
+
+    Args:
+        vecs (np.ndarray): (k, dim) matrix of norm-1 vectors.
+        dtype (str):       one of STORE_DTYPES.
+    Returns:
+        Tuple of the (k, dim) quantized matrix and the (k,) float32
+        row scales, None for unscaled dtypes.
+    """
+    if dtype not in SCALED_DTYPES:
+        return vecs.astype(dtype), None
+    vecs = np.asarray(vecs, dtype=np.float32)
+    peak = np.max(np.abs(vecs), axis=1, keepdims=True)
+    peak[peak == 0] = 1
+    rows = np.rint(vecs * (127 / peak)).astype(np.int8)
+    norms = np.linalg.norm(rows.astype(np.float32), axis=1)
+    norms[norms == 0] = 1
+    return rows, (1 / norms).astype(np.float32)
+
+
+def _write_rows(dst_path, source, order, dtype, source_scales=None):
+    """
+    Write the rows of a matrix in the given order to a store's vector
+    (and scale) files, quantized into dtype, one chunk at a time.
+
+    Args:
+        dst_path (str):             store path, without the file suffixes.
+        source (np.ndarray):        (n, dim) matrix of norm-1 vectors, or
+                                    of quantized rows.
+        order (np.ndarray):         (n,) row order to write.
+        dtype (str):                one of STORE_DTYPES.
+        source_scales (np.ndarray): (n,) row scales of a quantized
+                                    source, or None.
+    """
+    n, dim = len(order), source.shape[1]
+    out = np.lib.format.open_memmap(
+        dst_path + VECTORS_SUFFIX, mode="w+", dtype=dtype, shape=(n, dim)
+    )
+    scales = None
+    if dtype in SCALED_DTYPES:
+        scales = np.lib.format.open_memmap(
+            dst_path + SCALES_SUFFIX, mode="w+", dtype=np.float32, shape=(n,)
+        )
+    for start in range(0, n, 65536):
+        chunk = order[start : start + 65536]
+        vecs = source[chunk]
+        if source_scales is not None:
+            vecs = vecs.astype(np.float32) * source_scales[chunk, None]
+        rows, row_scales = quantize(vecs, dtype)
+        out[start : start + len(chunk)] = rows
+        if scales is not None:
+            scales[start : start + len(chunk)] = row_scales
+    out.flush()
+    if scales is not None:
+        scales.flush()
+
+
+def quantize_store(store, dst_path, dtype):
+    """
+    Write a quantized copy of a store.
+
+    Args:
+        store (EmbeddingStore): store to quantize.
+        dst_path (str):         store path to write, without the file
+                                suffixes.
+        dtype (str):            one of STORE_DTYPES.
+    Returns:
+        Number of words written.
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError("Unsupported store dtype '{}'.".format(dtype))
+    np.save(dst_path + VOCAB_SUFFIX, np.asarray(store.vocab))
+    order = np.arange(len(store))
+    _write_rows(dst_path, store.vectors, order, dtype, store.scales)
+    return len(store)
+
+
+def _read_word2vec_text(src_path):
+    """
+    Lazily read a (possibly gzipped) word2vec text file.
+
+    Args:
+        src_path (str): path to the word2vec text file.
+    Returns:
+        Tuple of (count, dim, generator of (word, vector) pairs).
+    """
+    opener = gzip.open if src_path.endswith(".gz") else open
+    f = opener(src_path, "rt", encoding="utf-8")
+    count, dim = (int(x) for x in f.readline().split())
+
+    def __rows():
+        with f:
+            for line in f:
+                parts = line.rstrip().split(" ")
+                if len(parts) != dim + 1:
+                    continue
+                yield parts[0], np.asarray(parts[1:], dtype=np.float32)
+
+    return count, dim, __rows()
+
+
+def convert_word2vec(src_path, dst_path, dtype="float32"):
+    """
+    Convert a word2vec text dump into a binary EmbeddingStore.
+    Vectors are normalized to norm 1 and rows sorted by word.
+
+    Args:
+        src_path (str): path to the (gzipped) word2vec text dump.
+        dst_path (str): store path to write, without the file suffixes.
+        dtype (str):    one of STORE_DTYPES.
+    Returns:
+        Number of words written.
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError("Unsupported store dtype '{}'.".format(dtype))
+
+    count, dim, rows = _read_word2vec_text(src_path)
+
+    # Stage the normalized vectors in file order in a temporary
+    # memory-mapped file to avoid holding the whole matrix in memory.
+    tmp_path = dst_path + ".tmp.npy"
+    staged = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=np.float32, shape=(count, dim)
+    )
+    words = []
+    for word, vec in rows:
+        if len(words) == count:
+            break
+        norm = np.linalg.norm(vec)
+        staged[len(words)] = vec / norm if norm > 0 else vec
+        words.append(word.encode("utf-8"))
+    n = len(words)
+
+    # Write the sorted vocabulary and the matching vector rows.
+    vocab = np.array(words, dtype=np.bytes_)
+    order = np.argsort(vocab, kind="mergesort")
+    np.save(dst_path + VOCAB_SUFFIX, vocab[order])
+    _write_rows(dst_path, staged, order, dtype)
+
+    del staged
+    os.remove(tmp_path)
+    return n
@@ -0,0 +1,155 @@
+"""
+Doduo/Doduo.index
+
+Inverted index from root-vertex constraints to the patterns whose
+root could match a token, so the Matcher only tries plausible
+patterns at each location of a sentence.
+"""
+
+from collections import defaultdict
+
+from Doduo.labels import label_id, label_name
+from Doduo.template import Template
+
+
+# Every token annotation a pattern may test.
+ANNOTATIONS = ("dep", "pos", "ent")
+
+# Attributes of PatternIndex keyed by label id.
+LABEL_TABLES = ("by_pos", "by_ent", "by_dep")
+
+
+class PatternIndex:
+    """
+    Root-anchor index over the patterns of a set of templates.
+
+    Every pattern gets an integer key. Patterns are filed under the
+    features their root predicate accepts: exact words, POS/NER labels,
+    or (for roots with only a relationship constraint) dependency
+    labels. Roots without an indexable constraint, roots using soft
+    matching and non-Template patterns are tried at every token. The
+    index only narrows the candidates: each candidate is still tested
+    against its full predicate while matching.
+
+    The index also records which token annotations its patterns
+    test, so unused Spacy pipes can be skipped while parsing.
+    """
+
+    def __init__(self, templates):
+        """
+        Args:
+            templates (dict): map of template ids to lists of patterns.
+        """
+        # patterns[key] is the (template_id, pattern) pair of a key,
+        # and keys[template_id] the keys of a template's patterns.
+        self.patterns = []
+        self.keys = {}
+        self.by_lower = defaultdict(list)
+        self.by_word = defaultdict(list)
+        self.by_pos = defaultdict(list)
+        self.by_ent = defaultdict(list)
+        self.by_dep = defaultdict(list)
+        self.wildcard = []
+        # Token annotations ("dep", "pos", "ent") the patterns test.
+        self.annotations = {"dep"}
+
+        for template_id, patterns in templates.items():
+            self.keys[template_id] = []
+            for pattern in patterns:
+                key = len(self.patterns)
+                self.patterns.append((template_id, pattern))
+                self.keys[template_id].append(key)
+                self.__add(key, pattern)
+
+    def __add(self, key, pattern):
+        """ File a pattern key under the features of its root. """
+        if not isinstance(pattern, Template):
+            self.wildcard.append(key)
+            self.annotations.update(ANNOTATIONS)
+            return
+
+        # NER constraints also accept POS labels, see Predicate.test.
+        for node_predicate in pattern.compile().predicates:
+            if node_predicate.pos or node_predicate.ner:
+                self.annotations.add("pos")
+            if node_predicate.ner:
+                self.annotations.add("ent")
+
+        predicate = pattern.predicate
+        if predicate.constrained and predicate.soft is None:
+            if predicate.case_sensitive:
+                by_text = self.by_word
+            else:
+                by_text = self.by_lower
+            for word in predicate.exact:
+                by_text[word].append(key)
+            for label in predicate.pos | predicate.ner:
+                self.by_pos[label].append(key)
+            for label in predicate.ner:
+                self.by_ent[label].append(key)
+        elif not predicate.constrained and predicate.rels is not None:
+            for label in predicate.rels:
+                self.by_dep[label].append(key)
+        else:
+            self.wildcard.append(key)
+
+    def __getstate__(self):
+        # Label ids are only meaningful within a process, so the label
+        # tables are pickled by label name.
+        state = dict(self.__dict__)
+        for table in LABEL_TABLES:
+            state[table] = {
+                label_name(label): keys for label, keys in state[table].items()
+            }
+        return state
+
+    def __setstate__(self, state):
+        for table in LABEL_TABLES:
+            state[table] = defaultdict(
+                list,
+                {label_id(name): keys for name, keys in state[table].items()},
+            )
+        self.__dict__.update(state)
+
+    def candidates(self, sentence, i):
+        """
+        Find the pattern keys whose root could match a token.
+
+        Args:
+            sentence (Sentence): parsed query sentence.
+            i (int):             index of the token.
+        Returns:
+            Set of pattern keys.
+        """
+        keys = set(self.wildcard)
+        for table, feature in (
+            (self.by_lower, sentence.lower[i]),
+            (self.by_word, sentence.words[i]),
+            (self.by_pos, sentence.pos[i]),
+            (self.by_ent, sentence.ent[i]),
+            (self.by_dep, sentence.dep[i]),
+        ):
+            found = table.get(feature)
+            if found:
+                keys.update(found)
+        return keys
+
+    def positions(self, sentence, allowed=None):
+        """
+        Find the tokens at which each pattern should be tried.
+
+        Args:
+            sentence (Sentence): parsed query sentence.
+            allowed (set):       if set, only consider these pattern keys.
+        Returns:
+            Dictionary from pattern keys to lists of token indices,
+            in the sentence's tree pre-order.
+        """
+        positions = defaultdict(list)
+        for i in sentence.preorder:
+            keys = self.candidates(sentence, i)
+            if allowed is not None:
+                keys &= allowed
+            for key in keys:
+                positions[key].append(i)
+        return positions
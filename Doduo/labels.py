@@ -0,0 +1,47 @@
+"""
+Doduo/Doduo.labels
+
+Interns lowercase POS/NER/dependency labels into small integer ids
+shared by parsed sentences and compiled templates.
+"""
+
+from threading import Lock
+
+
+# LABELS[i] is the label with id i. The empty label (no NER tag)
+# always has id 0.
+LABELS = [""]
+_label_ids = {"": 0}
+_labels_lock = Lock()
+
+
+def label_id(label):
+    """
+    Get the id of a label, interning it on first use.
+
+    Args:
+        label (str): label string, compared case insensitively.
+    Returns:
+        Integer id of the label.
+    """
+    label = label.lower()
+    try:
+        return _label_ids[label]
+    except KeyError:
+        with _labels_lock:
+            if label not in _label_ids:
+                LABELS.append(label)
+                _label_ids[label] = len(LABELS) - 1
+            return _label_ids[label]
+
+
+def label_name(i):
+    """
+    Get the lowercase label string of a label id.
+
+    Args:
+        i (int): label id.
+    Returns:
+        Label string.
+    """
+    return LABELS[i]
@@ -5,12 +5,84 @@ Compiles pattern blueprints from `Doduo/configs/` and handles
 all query matching requests.
 """
 
+import logging
+from time import perf_counter
+
 from yaml import load, YAMLError
 
-from Doduo.query import parse_query
-from Doduo.template import Template
-from Doduo.config import ROOT_DIR
-from Doduo import ConfigException, InvalidUsage
+from Doduo.query import parse_query, parse_queries, check_query, Query
+from Doduo.query import parse_cache, unused_pipes
+from Doduo.soft_match import embed_cache, verdict_cache
+from Doduo.template import Template, MatchContext
+from Doduo.index import PatternIndex
+from Doduo.slots import freeze
+from Doduo.cache import LRUCache
+from Doduo.artifact import write_artifact, read_artifact
+from Doduo.profiler import Profiler
+from Doduo.config import (
+    ROOT_DIR,
+    PARSE_BATCH_SIZE,
+    PARSE_PROCESSES,
+    MATCH_FIRST_ONLY,
+    MAX_ALTERNATIVES,
+    DEDUPE_MATCHES,
+    MAX_HYPOTHESES,
+    MATCH_CACHE_SIZE,
+    MATCH_CACHE_TTL,
+)
+from Doduo import ConfigException, InvalidUsage, get_nlp, get_word_model
+from Doduo import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateMap(dict):
+    """
+    Map of template ids to lists of patterns, counting its changes so
+    a Matcher rebuilds its index only when the templates change. Lists
+    of patterns must be replaced, not modified in place.
+    """
+
+    __slots__ = ("changes",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.changes = 0
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.changes += 1
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.changes += 1
+
+    def pop(self, *args):
+        self.changes += 1
+        return super().pop(*args)
+
+    def popitem(self):
+        self.changes += 1
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self.changes += 1
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.changes += 1
+
+    def clear(self):
+        super().clear()
+        self.changes += 1
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),), self.changes)
+
+    def __setstate__(self, changes):
+        self.changes = changes
 
 
 class Matcher:
@@ -22,14 +94,66 @@ class Matcher:
     templates.
     """
 
-    def __init__(self, config_file=None):
+    def __init__(
+        self,
+        config_file=None,
+        first_match_only=MATCH_FIRST_ONLY,
+        max_alternatives=MAX_ALTERNATIVES,
+        dedupe=DEDUPE_MATCHES,
+        max_hypotheses=MAX_HYPOTHESES,
+        cache_size=MATCH_CACHE_SIZE,
+        cache_ttl=MATCH_CACHE_TTL,
+        profile=False,
+    ):
         """
         Args:
-            config_file (str): Config file to locate template blueprints in.
-                               If None, no templates will be loaded.
+            config_file (str):       Config file to locate template
+                                     blueprints in. If None, no templates
+                                     will be loaded.
+            first_match_only (bool): stop each template's search at its
+                                     first successful match.
+            max_alternatives (int):  maximum number of alternatives
+                                     reported per template, or None.
+            dedupe (bool):           drop duplicate slot assignments.
+            max_hypotheses (int):    maximum number of hypotheses kept
+                                     per template vertex, or None.
+            cache_size (int):        number of match results cached,
+                                     0 to disable the results cache.
+            cache_ttl (float):       seconds before cached results
+                                     expire, or None.
+            profile (bool):          record the cost of every pattern
+                                     in self.profiler.
         Returns:
             None
         """
+        # Bounds of the matching search.
+        self.first_match_only = first_match_only
+        self.max_alternatives = max_alternatives
+        self.dedupe = dedupe
+        self.max_hypotheses = max_hypotheses
+
+        # Set of matching options (e.g. "soft_match") used by the config.
+        self.options = set()
+
+        # Root-anchor index of self.templates, built on first match and
+        # rebuilt whenever the templates change: the TemplateMap and its
+        # change count the index was built from.
+        self._index = None
+        self._indexed_templates = None
+        self._templates = TemplateMap()
+        # Version of the templates, bumped whenever the index is rebuilt.
+        self.version = 0
+
+        # Cache of match results keyed by (query text, template
+        # ids, templates version).
+        self.results_cache = LRUCache(cache_size, ttl=cache_ttl)
+
+        # Per-pattern profile of the matching work, if profiling.
+        self.profiler = Profiler() if profile else None
+
+        # Name of the config file the templates were loaded from.
+        self.config_file = config_file
+
         # By default, allow Matcher to be created with no preloaded templates.
         if config_file is None:
             self.templates = {}
@@ -55,6 +179,84 @@ class Matcher:
                 for blueprint in patterns["patterns"]
             ]
 
+    def __getstate__(self):
+        # Pickled Matchers, e.g. sent to worker processes, start with
+        # an empty results cache.
+        state = dict(self.__dict__)
+        cache = state.pop("results_cache")
+        state["results_cache_args"] = (cache.maxsize, cache.ttl)
+        return state
+
+    def __setstate__(self, state):
+        maxsize, ttl = state.pop("results_cache_args")
+        self.__dict__.update(state)
+        self.results_cache = LRUCache(maxsize, ttl=ttl)
+
+    @property
+    def templates(self):
+        """
+        TemplateMap of template ids to lists of compiled patterns.
+        """
+        return self._templates
+
+    @templates.setter
+    def templates(self, templates):
+        self._templates = TemplateMap(templates)
+
+    @property
+    def needs_word_model(self):
+        """
+        Whether any compiled pattern needs the word embedding model.
+        """
+        return "soft_match" in self.options
+
+    def warm_up(self):
+        """
+        Load the models required by the compiled templates, so the
+        first query does not pay for them. The word embedding model
+        is skipped when no pattern uses `soft_match`.
+        """
+        nlp = get_nlp()
+        disabled = self.disabled_pipes()
+        logger.info(
+            "Spacy pipes enabled: %s; disabled as unused by the config: %s",
+            ", ".join(p for p in nlp.pipe_names if p not in disabled)
+            or "none",
+            ", ".join(disabled) or "none",
+        )
+        if self.needs_word_model:
+            get_word_model()
+
+    def disabled_pipes(self):
+        """
+        Find the Spacy pipes no pattern needs, e.g. NER when no
+        pattern uses `ner_match`. The parser is always kept, as
+        sentences are split and built into trees from its parse.
+
+        Returns:
+            Tuple of the names of the pipes to skip while parsing.
+        """
+        return unused_pipes(self.get_index().annotations)
+
+    def get_index(self):
+        """
+        Get the PatternIndex of the current templates.
+
+        Returns:
+            PatternIndex over self.templates.
+        """
+        templates = self._templates
+        indexed = self._indexed_templates
+        if (
+            self._index is None
+            or indexed[0] is not templates
+            or indexed[1] != templates.changes
+        ):
+            self._index = PatternIndex(templates)
+            self._indexed_templates = (templates, templates.changes)
+            self.version += 1
+        return self._index
+
     def build_template(self, blueprint):
         """
         Build a template's blueprint into Template class tree.
@@ -63,9 +265,14 @@ class Matcher:
             blueprint (dict): deep parsed dict/list/str object parsed
                               from a YAML config.
         Returns:
-            A deep Template tree composing the compiled blueprint.
+            A deep Template tree composing the compiled blueprint. Each
+            vertex holds its constraints compiled into a Predicate, and
+            Template.compile() exposes the tree as a CompiledPattern.
         """
         template_args = dict(blueprint)
+        self.options.update(
+            key for key, value in template_args.items() if value
+        )
 
         # Compile the blueprints for each of the children.
         children = []
@@ -85,6 +292,76 @@ class Matcher:
 
         return new_template
 
+    def save(self, path):
+        """
+        Write the compiled templates, their soft match models and the
+        pattern index to a versioned artifact (see Doduo.artifact).
+
+        Args:
+            path (str): artifact file path.
+        """
+        payload = {
+            "templates": dict(self.templates),
+            "options": self.options,
+            "index": self.get_index(),
+        }
+        write_artifact(path, self.config_file, payload)
+
+    @classmethod
+    def load(cls, path, config_file=None, **kwargs):
+        """
+        Load a Matcher from an artifact written by save, skipping YAML
+        parsing and soft match model fitting.
+
+        Args:
+            path (str):        artifact file path.
+            config_file (str): if set, refuse artifacts not compiled
+                               from the current version of this config.
+            kwargs:            other Matcher arguments, e.g. dedupe.
+        Returns:
+            Matcher of the compiled templates.
+        Raises:
+            ConfigException: if the artifact is invalid or stale.
+        """
+        header, payload = read_artifact(path, config_file)
+        matcher = cls(**kwargs)
+        matcher.config_file = header["config_file"]
+        matcher.templates = payload["templates"]
+        matcher.options = payload["options"]
+
+        # Adopt the compiled index, which covers exactly these patterns.
+        matcher._index = payload["index"]
+        matcher._indexed_templates = (
+            matcher.templates,
+            matcher.templates.changes,
+        )
+        matcher.version += 1
+        return matcher
+
+    def select_templates(self, template_ids):
+        """
+        Look up the templates to match against.
+        Args:
+            template_ids (list): list of template ids, or None for all
+                                 known templates.
+        Returns:
+            List of (template_id, patterns) pairs.
+        """
+        # Parse the list of template_ids. If template_ids is set,
+        # limit our search space to those IDs. Otherwise, search
+        # across all templates.
+        if template_ids is None:
+            return list(self.templates.items())
+        templates = []
+        for id in template_ids:
+            try:
+                templates.append((id, self.templates[id]))
+            except KeyError:
+                raise ConfigException(
+                    "Provided template ID {} not in config.".format(id)
+                )
+        return templates
+
     def match(self, query, template_ids):
         """
         Match against query against potential templates.
@@ -95,63 +372,223 @@ class Matcher:
                                  search space will be all known templates.
         Returns:
             Generator of dictionaries. Each dictionary corresponds
-            to results for a single sentence.
+            to results for a single sentence. Results served from the
+            results cache are shared, and must not be modified.
         """
+        templates = self.select_templates(template_ids)
 
-        # Recursively attempt to match a pattern against each location
-        # in the tree.
-        def __match(parsed, pattern):
-            slots = []
-            result = pattern.match(parsed)
-            if result is not False:
-                slots += result
-            for child in parsed.children:
-                result = __match(child, pattern)
-                if result is not False:
-                    slots += result
-            return slots
-
-        # Parse the list of template_ids. If template_ids is set,
-        # limit our search space to those IDs. Otherwise, search
-        # across all templates.
-        if template_ids is None:
-            templates = list(self.templates.items())
-        else:
-            templates = []
-            for id in template_ids:
-                try:
-                    templates.append((id, self.templates[id]))
-                except KeyError:
-                    raise ConfigException(
-                        "Provided template ID {} not in config.".format(id)
-                    )
+        # Serve repeated queries from the results cache, if enabled.
+        key = None
+        if self.results_cache.maxsize > 0:
+            try:
+                text = check_query(query)
+            except TypeError:
+                raise InvalidUsage("Invalid query body.")
+            if template_ids is not None:
+                template_ids = tuple(template_ids)
+            self.get_index()
+            key = (text, template_ids, self.version)
+            results = self.results_cache.get(key)
+            if results is not None:
+                yield from results
+                return
 
         # Parse the user query and catch any invalid `query` values.
         try:
-            parsed_query = parse_query(query)
+            parsed_query = parse_query(query, self.disabled_pipes())
         except (TypeError, ValueError):
             raise InvalidUsage("Invalid query body.")
 
-        for parsed, sentence in parsed_query:
-            # Include metadata for this sentence's payload.
-            results = {}
-            results["__sentence__"] = sentence
-            results["__alternatives__"] = {}
-
-            for template_id, patterns in templates:
-                # Build up a list of possible results
-                # across each pattern for the given template.
-                slots = []
-                for t in patterns:
-                    match_results = __match(parsed, t)
-                    if match_results is not False:
-                        slots += match_results
-
-                # Split list of possible results into
-                # "main" result and a set of alternatives.
+        results = []
+        for parsed, _ in parsed_query:
+            result = self.match_sentence(parsed.sentence, templates)
+            results.append(result)
+            yield result
+        if key is not None:
+            self.results_cache.put(key, results)
+
+    def caches(self):
+        """
+        Returns:
+            Dictionary of the caches used by this process's matching:
+            match results, parses and soft matching.
+        """
+        return {
+            "match": self.results_cache,
+            "parse": parse_cache,
+            "embed": embed_cache,
+            "soft_verdict": verdict_cache,
+        }
+
+    def cache_stats(self):
+        """
+        Returns:
+            Dictionary of the statistics of each of self.caches().
+        """
+        return {name: cache.stats() for name, cache in self.caches().items()}
+
+    def match_many(
+        self,
+        queries,
+        template_ids,
+        batch_size=PARSE_BATCH_SIZE,
+        n_process=PARSE_PROCESSES,
+    ):
+        """
+        Match a batch of queries against potential templates, parsing
+        them together with Spacy's nlp.pipe.
+        Args:
+            queries (iterable):  strings to query against our templates,
+                                 read lazily.
+            template_ids (list): list of strings specifying which templates
+                                 to search through. If set to None, the
+                                 search space will be all known templates.
+            batch_size (int):    number of queries Spacy parses per batch.
+            n_process (int):     number of processes Spacy parses with.
+        Returns:
+            Generator of lists, one per query in input order. Each list
+            holds the dictionaries of results of the query's sentences,
+            as yielded by match.
+        """
+        templates = self.select_templates(template_ids)
+
+        # Parse the user queries, catching any invalid `queries` values
+        # as they are read.
+        def checked(queries):
+            for query in queries:
+                if not isinstance(query, str):
+                    raise InvalidUsage("Invalid queries body.")
+                yield query
+
+        parsed_queries = parse_queries(
+            checked(queries),
+            batch_size=batch_size,
+            n_process=n_process,
+            disable=self.disabled_pipes(),
+        )
+        for parsed_query in parsed_queries:
+            yield [
+                self.match_sentence(parsed.sentence, templates)
+                for parsed, _ in parsed_query
+            ]
+
+    def match_sentence(self, sentence, templates):
+        """
+        Match a parsed sentence against templates.
+        Args:
+            sentence (Sentence): parsed query sentence.
+            templates (list):    list of (template_id, patterns) pairs,
+                                 see select_templates.
+        Returns:
+            Dictionary of the sentence's results.
+        """
+        # Time the sentence, each template and optionally each pattern,
+        # if metrics are recorded.
+        timing = metrics.timing()
+        time_patterns = timing and metrics.registry.patterns
+        profiler = self.profiler
+        if timing:
+            start = perf_counter()
+
+        # Look up the keys of the selected templates' patterns, and
+        # find the tokens at which each pattern's root could match.
+        index = self.get_index()
+        allowed = None
+        if len(templates) != len(index.keys):
+            allowed = set()
+            for template_id, _ in templates:
+                allowed.update(index.keys[template_id])
+        positions = index.positions(sentence, allowed)
+
+        # Memo table of sub-template match results on this sentence,
+        # shared across all templates, along with the search bounds.
+        context = MatchContext(
+            first_only=self.first_match_only,
+            dedupe=self.dedupe,
+            max_hypotheses=self.max_hypotheses,
+        )
+
+        # Bound the number of results kept per template: the main
+        # result and its alternatives.
+        if self.first_match_only:
+            limit = 1
+        elif self.max_alternatives is not None:
+            limit = self.max_alternatives + 1
+        else:
+            limit = None
+
+        # Include metadata for this sentence's payload.
+        results = {}
+        results["__sentence__"] = sentence.text
+        results["__alternatives__"] = {}
+
+        for template_id, _ in templates:
+            if timing:
+                template_start = perf_counter()
+
+            # Build up a list of possible results
+            # across each pattern for the given template.
+            slots = []
+            seen = set()
+            for n, key in enumerate(index.keys[template_id]):
+                if time_patterns and key in positions:
+                    pattern_start = perf_counter()
+                if profiler is not None:
+                    profile = context.profile = profiler.stats(template_id, n)
+                    profile_start = perf_counter()
+                t = index.patterns[key][1]
+                for i in positions.get(key, ()):
+                    if profiler is not None:
+                        profile.roots += 1
+                    if isinstance(t, Template):
+                        match_results = t.match_at(sentence, i, context)
+                    else:
+                        match_results = t.match(Query(sentence, i))
+                    if match_results is False:
+                        continue
+                    if profiler is not None:
+                        profile.matches += 1
+                    for result in match_results:
+                        if self.dedupe:
+                            frozen = freeze(result)
+                            if frozen in seen:
+                                continue
+                            seen.add(frozen)
+                        slots.append(result)
+                        if limit is not None and len(slots) >= limit:
+                            break
+                    if limit is not None and len(slots) >= limit:
+                        break
+                if profiler is not None:
+                    profile.seconds += perf_counter() - profile_start
+                    context.profile = None
+                if time_patterns and key in positions:
+                    metrics.record(
+                        "doduo_pattern_seconds",
+                        perf_counter() - pattern_start,
+                        (("template", template_id), ("pattern", n)),
+                        "pattern:{}:{}".format(template_id, n),
+                    )
+                if limit is not None and len(slots) >= limit:
+                    break
+
+            # Split list of possible results into
+            # "main" result and a set of alternatives.
+            if slots:
+                results[template_id] = slots.pop(0)
                 if slots:
-                    results[template_id] = slots.pop(0)
-                    if slots:
-                        results["__alternatives__"][template_id] = slots
+                    results["__alternatives__"][template_id] = slots
 
-            yield results
+            if timing:
+                metrics.record(
+                    "doduo_template_seconds",
+                    perf_counter() - template_start,
+                    (("template", template_id),),
+                    "template:{}".format(template_id),
+                )
+
+        if timing:
+            metrics.record(
+                "doduo_match_seconds", perf_counter() - start, key="match"
+            )
+        return results
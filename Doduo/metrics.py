@@ -0,0 +1,378 @@
+"""
+Doduo/Doduo.metrics
+
+Latency histograms and counters of the matching stages (parsing,
+matching per template and pattern, soft matching and serialization),
+served in the Prometheus text format at /metrics.
+
+Stages are timed with `timer`, which hands out a shared no-op timer
+while metrics are disabled and no request is traced, so instrumented
+code costs a function call when nothing is recorded. A `trace` also
+collects the stage timings of the current thread, for per-request
+debug timings.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock, local
+from time import perf_counter
+
+from Doduo.config import METRICS_ENABLED, METRICS_PATTERNS, METRICS_BUCKETS
+
+
+# Help texts of the recorded metrics.
+METRICS_HELP = {
+    "doduo_parse_seconds": "Time parsing a single query with Spacy.",
+    "doduo_parse_batch_seconds": "Time parsing a batch of queries with Spacy.",
+    "doduo_match_seconds": "Time matching a sentence against templates.",
+    "doduo_template_seconds": "Time matching a template on a sentence.",
+    "doduo_pattern_seconds": "Time matching a pattern on a sentence.",
+    "doduo_serialize_seconds": "Time serializing a response to JSON.",
+    "doduo_request_seconds": "Time handling a request.",
+    "doduo_soft_match_words_total": "Words decided by soft match models.",
+    "doduo_cache_hits_total": "Cache lookups served from the cache.",
+    "doduo_cache_misses_total": "Cache lookups missing the cache.",
+    "doduo_cache_evictions_total": "Cache entries evicted for space.",
+    "doduo_cache_size": "Entries held in the cache.",
+}
+
+
+class Histogram:
+    """
+    Latency histogram with fixed bucket upper bounds.
+    """
+
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, n_buckets):
+        """
+        Args:
+            n_buckets (int): number of bucket upper bounds.
+        """
+        # One count per bucket, and a last one for +Inf.
+        self.counts = [0] * (n_buckets + 1)
+        self.sum = 0.0
+
+
+class Registry:
+    """
+    Thread-safe store of the histograms and counters of a process,
+    keyed by (metric name, labels) where labels is a tuple of
+    (label, value) pairs.
+    """
+
+    def __init__(
+        self,
+        enabled=METRICS_ENABLED,
+        patterns=METRICS_PATTERNS,
+        buckets=METRICS_BUCKETS,
+    ):
+        """
+        Args:
+            enabled (bool):  whether to record metrics.
+            patterns (bool): whether to also time every pattern.
+            buckets (tuple): sorted histogram bucket upper bounds.
+        """
+        self.enabled = enabled
+        self.patterns = patterns
+        self.buckets = tuple(buckets)
+        self._lock = Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, seconds, labels=()):
+        """ Record a duration in a histogram. """
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = Histogram(len(self.buckets))
+                self.histograms[(name, labels)] = histogram
+            histogram.counts[i] += 1
+            histogram.sum += seconds
+
+    def inc(self, name, n=1, labels=()):
+        """ Increment a counter. """
+        with self._lock:
+            self.counters[(name, labels)] = (
+                self.counters.get((name, labels), 0) + n
+            )
+
+    def reset(self):
+        """ Drop every recorded metric. """
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def snapshot(self):
+        """
+        Returns:
+            Picklable dictionary of the recorded metrics: the bucket
+            bounds, and the histograms and counters by key.
+        """
+        with self._lock:
+            return {
+                "buckets": self.buckets,
+                "histograms": {
+                    key: (list(h.counts), h.sum)
+                    for key, h in self.histograms.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+
+# Metrics of this process.
+registry = Registry()
+
+# Stage timings of the current thread's trace, and the number of
+# threads tracing.
+_local = local()
+_tracing = 0
+_tracing_lock = Lock()
+
+
+class Timer:
+    """
+    Context manager recording the duration of a stage.
+    """
+
+    __slots__ = ("name", "labels", "key", "start")
+
+    def __init__(self, name, labels, key):
+        self.name = name
+        self.labels = labels
+        self.key = key
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, perf_counter() - self.start, self.labels, self.key)
+
+
+class NullTimer:
+    """
+    Context manager recording nothing.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def timing():
+    """
+    Returns:
+        Whether stage durations are recorded, in metrics or a trace.
+    """
+    return registry.enabled or _tracing > 0
+
+
+def timer(name, labels=(), key=None):
+    """
+    Time a stage, e.g. `with timer("doduo_parse_seconds"): ...`.
+
+    Args:
+        name (str):     histogram name.
+        labels (tuple): histogram labels, as (label, value) pairs.
+        key (str):      name of the stage in traces, or None for name.
+    Returns:
+        Context manager recording the duration of its block.
+    """
+    if not (registry.enabled or _tracing > 0):
+        return NULL_TIMER
+    return Timer(name, labels, key)
+
+
+def record(name, seconds, labels=(), key=None):
+    """
+    Record the duration of a stage in the metrics and the current
+    thread's trace.
+
+    Args:
+        name (str):      histogram name.
+        seconds (float): duration of the stage.
+        labels (tuple):  histogram labels, as (label, value) pairs.
+        key (str):       name of the stage in traces, or None for name.
+    """
+    if registry.enabled:
+        registry.observe(name, seconds, labels)
+    if _tracing > 0:
+        timings = getattr(_local, "timings", None)
+        if timings is not None:
+            key = key or name
+            timings[key] = timings.get(key, 0.0) + seconds
+
+
+def count(name, n=1, labels=()):
+    """
+    Increment a counter, if metrics are enabled.
+
+    Args:
+        name (str):     counter name.
+        n (int):        increment.
+        labels (tuple): counter labels, as (label, value) pairs.
+    """
+    if registry.enabled:
+        registry.inc(name, n, labels)
+
+
+@contextmanager
+def trace():
+    """
+    Collect the stage timings of the current thread, whether or not
+    metrics are enabled.
+
+    Returns:
+        Context manager yielding the dictionary of stage names to
+        seconds spent, filled in as stages complete.
+    """
+    global _tracing
+    timings = {}
+    previous = getattr(_local, "timings", None)
+    _local.timings = timings
+    with _tracing_lock:
+        _tracing += 1
+    try:
+        yield timings
+    finally:
+        with _tracing_lock:
+            _tracing -= 1
+        _local.timings = previous
+
+
+def add_timings(timings, other):
+    """
+    Add the stage timings of a trace into another's.
+
+    Args:
+        timings (dict): trace timings to update.
+        other (dict):   trace timings to add.
+    """
+    for key, seconds in other.items():
+        timings[key] = timings.get(key, 0.0) + seconds
+
+
+def merge_snapshots(snapshots):
+    """
+    Sum Registry.snapshot reports, e.g. across worker processes.
+
+    Args:
+        snapshots (list): snapshots with the same bucket bounds.
+    Returns:
+        Snapshot of the summed histograms and counters.
+    """
+    merged = {"buckets": snapshots[0]["buckets"], "histograms": {}}
+    counters = {}
+    for snapshot in snapshots:
+        for key, (counts, total) in snapshot["histograms"].items():
+            if key in merged["histograms"]:
+                old_counts, old_total = merged["histograms"][key]
+                counts = [a + b for a, b in zip(old_counts, counts)]
+                total += old_total
+            merged["histograms"][key] = (list(counts), total)
+        for key, n in snapshot["counters"].items():
+            counters[key] = counters.get(key, 0) + n
+    merged["counters"] = counters
+    return merged
+
+
+def _format_labels(labels, extra=()):
+    """ Format labels as Prometheus' {label="value",...}. """
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ""
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(
+                label,
+                str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for label, value in labels
+        )
+    )
+
+
+def _format_float(value):
+    """ Format a bucket bound or sum in the Prometheus text format. """
+    return repr(float(value))
+
+
+def render(snapshot, cache_stats=None):
+    """
+    Render metrics in the Prometheus text exposition format.
+
+    Args:
+        snapshot (dict):    Registry.snapshot report.
+        cache_stats (dict): cache statistics, see Matcher.cache_stats,
+                            exported as counters, or None.
+    Returns:
+        Text of the metrics.
+    """
+    counters = dict(snapshot["counters"])
+    gauges = {}
+    for cache, stats in (cache_stats or {}).items():
+        labels = (("cache", cache),)
+        for stat in ("hits", "misses", "evictions"):
+            counters[("doduo_cache_{}_total".format(stat), labels)] = stats[
+                stat
+            ]
+        gauges[("doduo_cache_size", labels)] = stats["size"]
+
+    def by_name(metrics):
+        grouped = {}
+        for (name, labels), value in sorted(metrics.items()):
+            grouped.setdefault(name, []).append((labels, value))
+        return grouped
+
+    lines = []
+
+    def header(name, kind):
+        if name in METRICS_HELP:
+            lines.append("# HELP {} {}".format(name, METRICS_HELP[name]))
+        lines.append("# TYPE {} {}".format(name, kind))
+
+    buckets = snapshot["buckets"]
+    for name, series in by_name(snapshot["histograms"]).items():
+        header(name, "histogram")
+        for labels, (counts, total) in series:
+            cumulative = 0
+            bounds = [_format_float(b) for b in buckets] + ["+Inf"]
+            for bound, n in zip(bounds, counts):
+                cumulative += n
+                lines.append(
+                    "{}_bucket{} {}".format(
+                        name,
+                        _format_labels(labels, (("le", bound),)),
+                        cumulative,
+                    )
+                )
+            lines.append(
+                "{}_sum{} {}".format(
+                    name, _format_labels(labels), _format_float(total)
+                )
+            )
+            lines.append(
+                "{}_count{} {}".format(
+                    name, _format_labels(labels), cumulative
+                )
+            )
+    for kind, metrics in (("counter", counters), ("gauge", gauges)):
+        for name, series in by_name(metrics).items():
+            header(name, kind)
+            for labels, value in series:
+                lines.append(
+                    "{}{} {}".format(name, _format_labels(labels), value)
+                )
+    return "\n".join(lines) + "\n"
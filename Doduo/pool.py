@@ -0,0 +1,398 @@
+"""
+Doduo/Doduo.pool
+
+Multi-process execution of a Matcher. The Matcher's templates,
+index and models are loaded once in the parent process, then
+worker processes are forked from it, so every worker shares their
+memory copy-on-write instead of loading its own copy.
+
+Forking is only safe while no other thread runs: a lock held by
+another thread at the fork stays held forever in the worker. Pools
+created alongside request threads, e.g. on config reloads, start
+their workers with "forkserver" instead: each worker is sent the
+pickled Matcher and loads its models as it starts. Either way, a pool
+is only returned once all of its workers are ready to match.
+
+Workers push their cache statistics and metrics to the parent as they
+change, so reading them never waits on a busy worker.
+"""
+
+import gc
+import multiprocessing
+import os
+from collections import deque
+from itertools import islice
+from queue import Empty
+from threading import Event, Lock, Thread
+from time import sleep
+
+from Doduo import metrics, ConfigException
+from Doduo.cache import merge_stats
+from Doduo.config import (
+    MATCH_PROCESSES,
+    PARSE_BATCH_SIZE,
+    WORKER_START_TIMEOUT,
+    STATS_REPORT_INTERVAL,
+)
+
+
+# Matcher of a worker process, inherited from the parent at fork, and
+# the number of tasks the worker completed.
+_worker_matcher = None
+_worker_tasks = 0
+
+
+def _init_worker(matcher, reports, interval, forked):
+    """
+    Install the parent's Matcher in a freshly started worker, then
+    send its first report, which tells the parent it is ready. Workers
+    that were not forked load the models and index the parent warmed
+    up before serving their first query.
+    """
+    global _worker_matcher
+    _worker_matcher = matcher
+    if not forked:
+        matcher.warm_up()
+        matcher.get_index()
+
+    # Keep the warm cache entries, but count only this worker's use.
+    for cache in matcher.caches().values():
+        cache.reset_stats()
+    metrics.registry.reset()
+
+    # Reports are only a view of the statistics: never hold up exiting
+    # to flush them.
+    reports.cancel_join_thread()
+    reports.put(_report())
+    Thread(
+        target=_report_loop,
+        args=(reports, interval),
+        name="stats-reporter",
+        daemon=True,
+    ).start()
+
+
+def _report():
+    """
+    Returns:
+        (process id, cache statistics, metrics snapshot) tuple of
+        the worker.
+    """
+    return (
+        os.getpid(),
+        _worker_matcher.cache_stats(),
+        metrics.registry.snapshot(),
+    )
+
+
+def _report_loop(reports, interval):
+    """
+    Send a new report to the parent whenever the worker completed
+    tasks since the last one, at most every interval seconds.
+    """
+    reported = 0
+    while True:
+        sleep(interval)
+        tasks = _worker_tasks
+        if tasks != reported:
+            reports.put(_report())
+            reported = tasks
+
+
+def _match(query, template_ids, traced):
+    """
+    Match a single query in a worker.
+
+    Returns:
+        (results, stage timings or None) tuple.
+    """
+    global _worker_tasks
+    try:
+        if not traced:
+            return list(_worker_matcher.match(query, template_ids)), None
+        with metrics.trace() as timings:
+            return list(_worker_matcher.match(query, template_ids)), timings
+    finally:
+        _worker_tasks += 1
+
+
+def _match_chunk(queries, template_ids, batch_size, traced):
+    """
+    Match a chunk of queries in a worker, parsed in batches.
+
+    Returns:
+        (results, stage timings or None) tuple.
+    """
+    global _worker_tasks
+    try:
+        if not traced:
+            results = _match_chunk_results(queries, template_ids, batch_size)
+            return results, None
+        with metrics.trace() as timings:
+            results = _match_chunk_results(queries, template_ids, batch_size)
+        return results, timings
+    finally:
+        _worker_tasks += 1
+
+
+def _match_chunk_results(queries, template_ids, batch_size):
+    """ Match a chunk of queries with the worker's Matcher. """
+    return list(
+        _worker_matcher.match_many(
+            queries, template_ids, batch_size=batch_size, n_process=1
+        )
+    )
+
+
+class MatcherPool:
+    """
+    Pool of worker processes matching queries with a shared Matcher.
+
+    Requests are dispatched to the workers; batches are split into
+    chunks of queries, each parsed and matched by a single worker.
+    With a single process, queries are matched in-process and no
+    worker is forked.
+    """
+
+    def __init__(
+        self,
+        matcher,
+        processes=MATCH_PROCESSES,
+        start_method="fork",
+        report_interval=STATS_REPORT_INTERVAL,
+    ):
+        """
+        Args:
+            matcher (Matcher):       matcher to share with the workers.
+            processes (int):         number of worker processes.
+            start_method (str):      multiprocessing start method of the
+                                     workers. Only fork while no other
+                                     thread runs; "forkserver" workers
+                                     are sent the pickled Matcher
+                                     instead.
+            report_interval (float): seconds between the reports of a
+                                     busy worker's statistics.
+        Raises:
+            ConfigException: if the workers are not all ready within
+                             WORKER_START_TIMEOUT seconds.
+        """
+        self.matcher = matcher
+        self.processes = processes
+        self.pool = None
+        self._frozen = False
+        # Latest (cache statistics, metrics snapshot) of each worker,
+        # by process id. Reports of stopped workers are kept, so that
+        # the totals never go backwards.
+        self._reports = {}
+        self._reports_lock = Lock()
+        self._stop = Event()
+
+        # Load everything the workers need before forking, so that
+        # they inherit it instead of loading it again.
+        matcher.warm_up()
+        matcher.get_index()
+        if processes <= 1:
+            return
+
+        # Move the loaded objects out of the garbage collector's
+        # reach, so collections in forked workers do not write to (and
+        # thereby copy) the pages they live on. They are handed back
+        # to the collector when the pool is closed.
+        context = multiprocessing.get_context(start_method)
+        if start_method == "fork" and hasattr(gc, "freeze"):
+            gc.collect()
+            gc.freeze()
+            self._frozen = True
+        elif start_method == "forkserver":
+            context.set_forkserver_preload(["Doduo.pool"])
+        reports = context.Queue()
+        self.pool = context.Pool(
+            processes,
+            initializer=_init_worker,
+            initargs=(
+                matcher,
+                reports,
+                report_interval,
+                start_method == "fork",
+            ),
+        )
+
+        # Only hand out the pool once every worker can serve at once.
+        try:
+            for _ in range(processes):
+                self._store(reports.get(timeout=WORKER_START_TIMEOUT))
+        except Empty:
+            self.close()
+            raise ConfigException(
+                "Matching workers not ready after {} seconds.".format(
+                    WORKER_START_TIMEOUT
+                )
+            )
+        Thread(
+            target=self._collect,
+            args=(reports,),
+            name="stats-collector",
+            daemon=True,
+        ).start()
+
+    def _store(self, report):
+        """ Keep a worker's report, see _report. """
+        pid, stats, snapshot = report
+        with self._reports_lock:
+            self._reports[pid] = (stats, snapshot)
+
+    def _collect(self, reports):
+        """ Store the workers' reports as they come, until closed. """
+        while not self._stop.is_set():
+            try:
+                report = reports.get(timeout=1)
+            except Empty:
+                continue
+            self._store(report)
+
+    def _worker_reports(self):
+        """
+        Returns:
+            List of the latest (cache statistics, metrics snapshot)
+            reported by each worker.
+        """
+        with self._reports_lock:
+            return list(self._reports.values())
+
+    def match(self, query, template_ids, timings=None):
+        """
+        Match a query against potential templates, see Matcher.match.
+
+        Args:
+            timings (dict): if set, the stage timings of the query are
+                            added to it, see metrics.trace.
+        Returns:
+            List of dictionaries, one per sentence of the query.
+        """
+        if self.pool is None:
+            if timings is None:
+                return list(self.matcher.match(query, template_ids))
+            with metrics.trace() as traced:
+                results = list(self.matcher.match(query, template_ids))
+            metrics.add_timings(timings, traced)
+            return results
+        results, traced = self.pool.apply(
+            _match, (query, template_ids, timings is not None)
+        )
+        if traced is not None:
+            metrics.add_timings(timings, traced)
+        return results
+
+    def match_many(
+        self,
+        queries,
+        template_ids,
+        batch_size=PARSE_BATCH_SIZE,
+        timings=None,
+    ):
+        """
+        Match a batch of queries against potential templates, see
+        Matcher.match_many. Queries are read lazily, and only a few
+        chunks per worker are in flight at any time.
+
+        Args:
+            queries (iterable):  strings to query against our templates.
+            template_ids (list): templates to search through, or None.
+            batch_size (int):    number of queries per chunk, each
+                                 parsed by a worker in one batch.
+            timings (dict):      if set, the stage timings of the
+                                 queries are added to it as they are
+                                 matched, see metrics.trace.
+        Returns:
+            Generator of lists, one per query in input order.
+        """
+        if self.pool is None:
+            results = self.matcher.match_many(
+                queries, template_ids, batch_size=batch_size, n_process=1
+            )
+            if timings is None:
+                yield from results
+                return
+            # Trace each step of the generator, as the consumer may run
+            # on another thread between steps.
+            while True:
+                with metrics.trace() as traced:
+                    result = next(results, None)
+                metrics.add_timings(timings, traced)
+                if result is None:
+                    return
+                yield result
+
+        queries = iter(queries)
+        pending = deque()
+        while True:
+            # Keep every worker busy with a chunk queued behind it.
+            while len(pending) < 2 * self.processes:
+                chunk = list(islice(queries, batch_size))
+                if not chunk:
+                    break
+                pending.append(
+                    self.pool.apply_async(
+                        _match_chunk,
+                        (chunk, template_ids, batch_size, timings is not None),
+                    )
+                )
+            if not pending:
+                return
+            results, traced = pending.popleft().get()
+            if traced is not None:
+                metrics.add_timings(timings, traced)
+            yield from results
+
+    def cache_stats(self):
+        """
+        Returns:
+            Dictionary of cache statistics as Matcher.cache_stats,
+            summed over the worker processes as last reported, at
+            most report_interval seconds after their latest task.
+        """
+        if self.pool is None:
+            return self.matcher.cache_stats()
+        reports = [stats for stats, _ in self._worker_reports()]
+        return {
+            name: merge_stats([report[name] for report in reports])
+            for name in reports[0]
+        }
+
+    def metrics_snapshot(self):
+        """
+        Returns:
+            Snapshot of this process's metrics, see metrics.Registry,
+            summed with those last reported by the worker processes.
+        """
+        snapshot = metrics.registry.snapshot()
+        if self.pool is None:
+            return snapshot
+        reports = [report for _, report in self._worker_reports()]
+        return metrics.merge_snapshots(reports + [snapshot])
+
+    def close(self, wait=False):
+        """
+        Stop the worker processes.
+
+        Args:
+            wait (bool): let the workers finish their queued requests
+                         first, rather than stopping them at once.
+        """
+        if self.pool is not None:
+            if wait:
+                self.pool.close()
+            else:
+                self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        self._stop.set()
+        if self._frozen:
+            gc.unfreeze()
+            self._frozen = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,160 @@
+"""
+Doduo/Doduo.profiler
+
+Pattern-level profiling of a Matcher. A profiling Matcher records,
+per template id and pattern index, the time spent matching the
+pattern, the roots it was tried at, its Template vertex invocations
+(and memoized ones), the hypotheses its vertices generated and the
+peak size of a vertex's hypothesis list. Patterns share the memo
+table of a sentence, so the work of a sub-template is charged to the
+first pattern that computes it.
+
+Rank the patterns of a config over a replay of queries by calling:
+    `python3.6 -m Doduo profile --input queries.jsonl`
+"""
+
+from Doduo.stream import read_jsonl
+
+
+# Counters of PatternStats, in report order.
+PROFILE_COUNTERS = (
+    "seconds",
+    "roots",
+    "matches",
+    "calls",
+    "memo_hits",
+    "hypotheses",
+    "peak",
+)
+
+
+class PatternStats:
+    """
+    Profile counters of a single pattern, updated through the
+    `profile` hook of MatchContext.
+    """
+
+    __slots__ = PROFILE_COUNTERS
+
+    def __init__(self):
+        # Cumulative seconds matching the pattern.
+        self.seconds = 0.0
+        # Root tokens the pattern was tried at, and successful roots.
+        self.roots = 0
+        self.matches = 0
+        # Template vertex invocations, and those answered by the memo.
+        self.calls = 0
+        self.memo_hits = 0
+        # Hypotheses generated by the vertices, and the largest list of
+        # hypotheses a vertex held at once.
+        self.hypotheses = 0
+        self.peak = 0
+
+    def as_dict(self):
+        """
+        Returns:
+            Dictionary of the counters.
+        """
+        return {name: getattr(self, name) for name in PROFILE_COUNTERS}
+
+
+class Profiler:
+    """
+    PatternStats of every profiled pattern, keyed by (template id,
+    pattern index).
+    """
+
+    def __init__(self):
+        self.patterns = {}
+
+    def stats(self, template_id, n):
+        """
+        Args:
+            template_id (str): template id.
+            n (int):           index of the pattern in the template.
+        Returns:
+            PatternStats of the pattern, created on first use.
+        """
+        stats = self.patterns.get((template_id, n))
+        if stats is None:
+            stats = self.patterns[(template_id, n)] = PatternStats()
+        return stats
+
+    def clear(self):
+        """ Drop every recorded profile. """
+        self.patterns = {}
+
+    def report(self, sort="seconds", top=None):
+        """
+        Rank the profiled patterns.
+
+        Args:
+            sort (str): counter to rank by, one of PROFILE_COUNTERS.
+            top (int):  number of patterns reported, or None for all.
+        Returns:
+            List of dictionaries of the counters of each pattern, with
+            its "template" id and "pattern" index, costliest first.
+        """
+        if sort not in PROFILE_COUNTERS:
+            raise ValueError("Unknown profile counter '{}'.".format(sort))
+        rows = []
+        for (template_id, n), stats in self.patterns.items():
+            row = {"template": template_id, "pattern": n}
+            row.update(stats.as_dict())
+            rows.append(row)
+        rows.sort(key=lambda row: row[sort], reverse=True)
+        return rows[:top] if top is not None else rows
+
+
+def profile_jsonl(matcher, input_file, template_ids=None, batch_size=None):
+    """
+    Replay a JSON lines file of queries through a profiling Matcher.
+
+    Args:
+        matcher (Matcher):   Matcher built with profile=True.
+        input_file (file):   queries opened in binary mode, see
+                             Doduo.stream.read_jsonl.
+        template_ids (list): templates to search through, or None.
+        batch_size (int):    number of queries parsed per batch, or
+                             None for the default.
+    Returns:
+        Number of queries replayed.
+    """
+    queries = (record["query"] for record, _ in read_jsonl(input_file))
+    kwargs = {"n_process": 1}
+    if batch_size is not None:
+        kwargs["batch_size"] = batch_size
+    n = 0
+    for _ in matcher.match_many(queries, template_ids, **kwargs):
+        n += 1
+    return n
+
+
+def format_report(rows):
+    """
+    Format Profiler.report rows as a text table.
+
+    Args:
+        rows (list): rows of Profiler.report.
+    Returns:
+        Text of the table.
+    """
+    header = ("template", "pattern") + PROFILE_COUNTERS
+    lines = [
+        [
+            str(row["template"]),
+            str(row["pattern"]),
+            "{:.6f}".format(row["seconds"]),
+        ]
+        + [str(row[name]) for name in PROFILE_COUNTERS[1:]]
+        for row in rows
+    ]
+    widths = [
+        max([len(name)] + [len(line[i]) for line in lines])
+        for i, name in enumerate(header)
+    ]
+    text = [
+        "  ".join(cell.ljust(width) for cell, width in zip(line, widths))
+        for line in [list(header)] + lines
+    ]
+    return "\n".join(line.rstrip() for line in text)
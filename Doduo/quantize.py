@@ -0,0 +1,124 @@
+"""
+Doduo/Doduo.quantize
+
+Validation of quantized embedding stores. Soft match models only
+compare cosine similarities to a threshold, so the question is not
+how far quantized vectors drift but how many membership verdicts
+change: compare_verdicts fits the soft match models of configs on a
+reference and a candidate store and counts the verdicts of a corpus
+of words that flip between them.
+
+Quantize the store and validate it by calling:
+    `python3.6 -m Doduo quantize --dtype int8 --queries log.jsonl`
+"""
+
+import numpy as np
+
+from Doduo import ConfigException
+from Doduo.soft_match import fit_soft_model, normalize_word
+
+
+def store_vectors(store, words):
+    """
+    Look up the vectors of words in a store.
+
+    Args:
+        store (EmbeddingStore): store to read from.
+        words (list):           normalized words.
+    Returns:
+        Tuple of a (k, dim) float32 matrix holding the vectors of the k
+        in-vocabulary words, and a boolean numpy array marking which
+        of the words are in vocabulary.
+    """
+    vecs = []
+    found = np.zeros(len(words), dtype=bool)
+    for i, word in enumerate(words):
+        vec = store.get(word)
+        if vec is not None:
+            vecs.append(np.asarray(vec, dtype=np.float32))
+            found[i] = True
+    if not vecs:
+        return np.zeros((0, store.dim), dtype=np.float32), found
+    return np.vstack(vecs), found
+
+
+def verdicts(store, seeds, words):
+    """
+    Fit the soft match model of seed words on a store and decide the
+    membership of words.
+
+    Args:
+        store (EmbeddingStore): store to read vectors from.
+        seeds (list):           soft match sample words.
+        words (list):           normalized words to decide.
+    Returns:
+        Boolean numpy array of verdicts, one per word. Out of
+        vocabulary words never belong.
+    """
+    sample_vecs, found = store_vectors(
+        store, [normalize_word(seed) for seed in seeds]
+    )
+    if not found.all():
+        raise ConfigException(
+            "Soft match sample uses word '{}' not in model".format(
+                seeds[int(np.argmin(found))]
+            )
+        )
+    model = fit_soft_model(sample_vecs)
+    vecs, found = store_vectors(store, words)
+    result = np.zeros(len(words), dtype=bool)
+    result[found] = model.score_vectors(vecs) >= model.threshold
+    return result
+
+
+def compare_verdicts(reference, candidate, seed_lists, words):
+    """
+    Count the soft match verdicts flipping between two stores.
+
+    Args:
+        reference (EmbeddingStore): store to compare against, e.g. the
+                                    float32 store.
+        candidate (EmbeddingStore): store to validate, e.g. quantized.
+        seed_lists (list):          seed word lists of the soft match
+                                    models to compare.
+        words (iterable):           corpus of words to decide.
+    Returns:
+        Dictionary of the number of distinct normalized words, of
+        models, of decisions, of reference positives, and of flips:
+        in total, gained (False to True) and lost (True to False).
+        "flipped_models" details each model whose verdicts flip.
+    """
+    words = sorted({normalize_word(word) for word in words} - {""})
+    report = {
+        "words": len(words),
+        "models": len(seed_lists),
+        "decisions": len(words) * len(seed_lists),
+        "positives": 0,
+        "flips": 0,
+        "gained": 0,
+        "lost": 0,
+        "flipped_models": [],
+    }
+    for seeds in seed_lists:
+        expected = verdicts(reference, seeds, words)
+        actual = verdicts(candidate, seeds, words)
+        gained = int(np.sum(actual & ~expected))
+        lost = int(np.sum(expected & ~actual))
+        report["positives"] += int(np.sum(expected))
+        report["gained"] += gained
+        report["lost"] += lost
+        report["flips"] += gained + lost
+        if gained or lost:
+            report["flipped_models"].append(
+                {
+                    "seeds": list(seeds),
+                    "gained": gained,
+                    "lost": lost,
+                    "flipped": [
+                        word
+                        for word, a, b in zip(words, expected, actual)
+                        if a != b
+                    ],
+                }
+            )
+    return report
@@ -5,86 +5,358 @@ Wraps natural language sentences into tree structures for
 easier comparison against Template objects.
 """
 
-from uuid import uuid4
-from copy import copy
+from itertools import islice
+from sys import intern
 
-from Doduo import nlp
+from Doduo import get_nlp, metrics
+from Doduo.cache import LRUCache
+from Doduo.config import (
+    PARSE_BATCH_SIZE,
+    PARSE_PROCESSES,
+    PARSE_CACHE_SIZE,
+    PARSE_CACHE_TTL,
+)
+from Doduo.labels import label_id, label_name
 
 
-def parse_query(query):
+# Dependency label joining the words of a compound.
+COMPOUND_DEP = label_id("compound")
+
+# Token annotation set by each Spacy pipe used for matching: POS tags,
+# dependency labels and sentence boundaries, and NER tags. Sentences
+# are always split and built into trees, so "dep" is always needed and
+# the parser is never disabled; only the tagger and NER can be.
+PIPE_ANNOTATIONS = {"tagger": "pos", "parser": "dep", "ner": "ent"}
+
+# Per-process cache of (query text, disabled pipes) to the parsed
+# Sentences, which are never modified once built.
+parse_cache = LRUCache(PARSE_CACHE_SIZE, ttl=PARSE_CACHE_TTL)
+
+
+def unused_pipes(annotations):
+    """
+    Find the Spacy pipes whose annotations are not needed. The
+    parser's "dep" annotations are always used, so in practice only
+    the tagger and NER pipes are ever disabled.
+
+    Args:
+        annotations (set): token annotations used ("pos", "dep", "ent").
+    Returns:
+        Tuple of the names of the pipes that can be disabled.
+    """
+    return tuple(
+        name
+        for name in get_nlp().pipe_names
+        if name in PIPE_ANNOTATIONS
+        and PIPE_ANNOTATIONS[name] not in annotations
+    )
+
+
+def check_query(query):
+    """
+    Check a query before parsing it or using it as a cache key. Queries
+    are cached by their exact text: whitespace changes Spacy's tokens
+    and sentence boundaries, so differently spaced queries may parse
+    differently.
+
+    Args:
+        query (str): natural language string.
+    Returns:
+        The query.
+    """
+    if not isinstance(query, str):
+        raise TypeError("Query must be a string.")
+    return query
+
+
+def parse_query(query, disable=()):
     """
     Parse a natural language query into a list
     of Query trees.
 
     Args:
-        query (str): natural language string.
+        query (str):     natural language string.
+        disable (tuple): names of the Spacy pipes to skip.
+    Returns:
+        A list of (Query, sentence string) tuples, one per
+        sentence, where the Query wraps the sentence's root.
+    """
+
+    # Use Spacy to parse the natural language string and build a
+    # Sentence for each of its sentences, unless cached.
+    text = check_query(query)
+    key = (text, disable)
+    sentences = parse_cache.get(key)
+    if sentences is None:
+        with metrics.timer("doduo_parse_seconds", key="parse"):
+            sentences = parse_doc(get_nlp()(text, disable=list(disable)))
+        parse_cache.put(key, sentences)
+    return as_queries(sentences)
+
+
+def parse_queries(
+    queries,
+    batch_size=PARSE_BATCH_SIZE,
+    n_process=PARSE_PROCESSES,
+    disable=(),
+):
+    """
+    Parse natural language queries in batches with Spacy's nlp.pipe.
+    Queries are consumed lazily, so they may be a stream of any length.
+    Only queries missing from the parse cache are sent to Spacy.
+
+    Args:
+        queries (iterable): natural language strings.
+        batch_size (int):   number of texts Spacy parses per batch.
+        n_process (int):    number of processes Spacy parses with.
+        disable (tuple):    names of the Spacy pipes to skip.
+    Returns:
+        A generator of parse_query results, one per query, in the
+        order of the queries.
+    """
+    queries = iter(queries)
+    chunk_size = batch_size * max(n_process, 1)
+    while True:
+        chunk = [check_query(q) for q in islice(queries, chunk_size)]
+        if not chunk:
+            return
+
+        # Parse the chunk's distinct uncached texts in one pipe.
+        parsed = {}
+        for text in chunk:
+            if text not in parsed:
+                parsed[text] = parse_cache.get((text, disable))
+        missing = [text for text, value in parsed.items() if value is None]
+        if missing:
+            with metrics.timer("doduo_parse_batch_seconds", key="parse"):
+                docs = get_nlp().pipe(
+                    missing,
+                    batch_size=batch_size,
+                    n_process=n_process,
+                    disable=list(disable),
+                )
+                for text, doc in zip(missing, docs):
+                    parsed[text] = parse_doc(doc)
+                    parse_cache.put((text, disable), parsed[text])
+
+        for text in chunk:
+            yield as_queries(parsed[text])
+
+
+def parse_doc(doc):
+    """
+    Build the Sentences of a parsed Spacy doc.
+
+    Args:
+        doc (Spacy.doc): parsed natural language string.
+    Returns:
+        A tuple of Sentences, one per sentence of the doc.
+    """
+    return tuple(Sentence(s) for s in doc.sents)
+
+
+def as_queries(sentences):
+    """
+    Wrap Sentences into Query trees.
+
+    Args:
+        sentences (tuple): parsed Sentences.
     Returns:
-        A list of Query objects.
+        A list of (Query, sentence string) tuples, as parse_query.
     """
+    return [
+        (Query(sentence, sentence.root), sentence.text)
+        for sentence in sentences
+    ]
+
+
+class Sentence:
+    """
+    Sentence class.
+
+    Array-backed dependency parse of a single sentence, built once per
+    Spacy sentence span. Tokens are addressed by their index in the
+    sentence, and each attribute is a tuple holding one entry per token.
+    """
+
+    __slots__ = (
+        "text",
+        "words",
+        "lower",
+        "pos",
+        "ent",
+        "dep",
+        "children",
+        "n_lefts",
+        "root",
+        "preorder",
+    )
+
+    def __init__(self, span):
+        """
+        Args:
+            span (Spacy.span): the sentence span of a parsed Spacy doc.
+        """
+        start = span.start
+        tokens = list(span)
+        self.text = span.text
+        # Token texts, stripped of surrounding whitespace.
+        self.words = tuple(t.text.strip() for t in tokens)
+        # Interned lowercase token texts.
+        self.lower = tuple(intern(w.lower()) for w in self.words)
+        # Label ids of the POS tag, NER tag and dependency relation.
+        self.pos = tuple(label_id(t.pos_) for t in tokens)
+        self.ent = tuple(label_id(t.ent_type_) for t in tokens)
+        self.dep = tuple(label_id(t.dep_) for t in tokens)
+        # Child indices (left children first) and left children counts.
+        self.children = tuple(
+            tuple(c.i - start for c in t.lefts)
+            + tuple(c.i - start for c in t.rights)
+            for t in tokens
+        )
+        self.n_lefts = tuple(t.n_lefts for t in tokens)
+        self.root = span.root.i - start
+        self.__order()
+
+    @classmethod
+    def from_tokens(cls, tokens, text=None):
+        """
+        Build a Sentence of a dependency parse given as token tuples,
+        without Spacy, e.g. a recorded or synthetic parse.
+
+        Args:
+            tokens (list): (word, pos, head index, dep, ent) tuples in
+                           sentence order. The root token is its own
+                           head, and ent is "" outside of entities.
+            text (str):    text of the sentence, or None to join the
+                           words with spaces.
+        Returns:
+            Sentence of the parse.
+        """
+        self = cls.__new__(cls)
+        self.words = tuple(token[0] for token in tokens)
+        self.text = " ".join(self.words) if text is None else text
+        self.lower = tuple(intern(w.lower()) for w in self.words)
+        self.pos = tuple(label_id(token[1]) for token in tokens)
+        self.ent = tuple(label_id(token[4]) for token in tokens)
+        self.dep = tuple(label_id(token[3]) for token in tokens)
+
+        lefts = [[] for _ in tokens]
+        rights = [[] for _ in tokens]
+        roots = []
+        for i, token in enumerate(tokens):
+            head = token[2]
+            if head == i:
+                roots.append(i)
+            elif head > i:
+                lefts[head].append(i)
+            else:
+                rights[head].append(i)
+        if len(roots) != 1:
+            raise ValueError("A sentence must have exactly one root.")
+        self.children = tuple(
+            tuple(left + right) for left, right in zip(lefts, rights)
+        )
+        self.n_lefts = tuple(len(left) for left in lefts)
+        self.root = roots[0]
+        self.__order()
+        if len(self.preorder) != len(tokens):
+            raise ValueError("Sentence tokens must form a single tree.")
+        return self
 
-    def __build_subtree(token):
-        """ Build the Query tree for a given token. """
-        children = [__build_subtree(t) for t in token.lefts]
-        children += [__build_subtree(t) for t in token.rights]
-        return Query(token, children)
+    def __order(self):
+        """ Token indices in tree pre-order: each before its children. """
+        preorder = []
+        stack = [self.root]
+        while stack:
+            i = stack.pop()
+            preorder.append(i)
+            stack.extend(reversed(self.children[i]))
+        self.preorder = tuple(preorder)
 
-    # Use Spacy to parse the natural language string
-    # and build subtrees for each sentence's root.
-    doc = nlp(query)
-    parsed_list = [(__build_subtree(s.root), s.text) for s in doc.sents]
+    def __len__(self):
+        return len(self.words)
+
+    def get_compound(self, i):
+        """
+        Get the string composing of token i and all it's
+        `compound` related children.
+        """
+        compound_str = self.words[i]
+        children = self.children[i]
+        n_lefts = self.n_lefts[i]
+        for c in children[:n_lefts]:
+            if self.dep[c] == COMPOUND_DEP:
+                compound_str = self.get_compound(c) + " " + compound_str
+        for c in children[n_lefts:]:
+            if self.dep[c] == COMPOUND_DEP:
+                compound_str = compound_str + " " + self.get_compound(c)
+        return compound_str
 
-    return parsed_list
+    def get_phrase(self, i):
+        """
+        Get the string composing token i and all the tokens
+        downstream of it.
+        """
+        children = self.children[i]
+        n_lefts = self.n_lefts[i]
+        lefts = [self.get_phrase(c) for c in children[:n_lefts]]
+        rights = [self.get_phrase(c) for c in children[n_lefts:]]
+        return " ".join(lefts + [self.words[i]] + rights)
 
 
 class Query:
     """
     Query class.
 
-    Wraps a query sentence into a tree with a structure paralleling
-    the sentence's dependency parse tree.
+    Lightweight view of a token in a Sentence, exposing the
+    sentence's dependency parse as a tree of Query objects.
     """
 
-    def __init__(self, token, children=None):
+    __slots__ = ("sentence", "i")
+
+    def __init__(self, sentence, i):
         """
         Args:
-            token (Spacy.token): the token corresponding to this vertex
-                                 in the tree.
-            children (list):     list of Query objects.
+            sentence (Sentence): the parsed sentence.
+            i (int):             index of this vertex's token in the
+                                 sentence.
         """
-        self.ner = [token.ent_type_.lower(), token.pos_.lower()]
-        self.pos = token.pos_.lower()
-        self.text = token.text.strip()
-        self.token = token
-        self.rel = token.dep_.lower()
-        self.children = children or []
+        self.sentence = sentence
+        self.i = i
+
+    @property
+    def text(self):
+        return self.sentence.words[self.i]
+
+    @property
+    def pos(self):
+        return label_name(self.sentence.pos[self.i])
+
+    @property
+    def ner(self):
+        return [label_name(self.sentence.ent[self.i]), self.pos]
+
+    @property
+    def rel(self):
+        return label_name(self.sentence.dep[self.i])
+
+    @property
+    def children(self):
+        return [
+            Query(self.sentence, c) for c in self.sentence.children[self.i]
+        ]
 
     def get_compound(self):
         """
         Get the string composing of this tree and all it's
         `compound` related children.
         """
-
-        def __collapse(token):
-            compound_str = token.text
-            for t in token.lefts:
-                if t.dep_ == "compound":
-                    compound_str = __collapse(t) + " " + compound_str
-            for t in token.rights:
-                if t.dep_ == "compound":
-                    compound_str = compound_str + " " + __collapse(t)
-            return compound_str
-
-        return __collapse(self.token)
+        return self.sentence.get_compound(self.i)
 
     def get_phrase(self):
         """
         Get the string composing all the vertices downstream
         of this tree.
         """
-
-        def __get_phrase(token):
-            lefts = [__get_phrase(t) for t in token.lefts]
-            rights = [__get_phrase(t) for t in token.rights]
-            return " ".join(lefts + [token.text] + rights)
-
-        return __get_phrase(self.token)
+        return self.sentence.get_phrase(self.i)
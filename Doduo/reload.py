@@ -0,0 +1,151 @@
+"""
+Doduo/Doduo.reload
+
+Hot-reloading of template configs. A new Matcher (and its worker
+pool) is fully built from the config file off to the side, then
+swapped in with a single assignment, so requests only ever see a
+complete Matcher. Unchanged soft match models are reused, see
+build_soft_model.
+"""
+
+import logging
+import os
+from threading import Lock, Thread, Timer
+from time import sleep
+
+from Doduo.matcher import Matcher
+from Doduo.pool import MatcherPool
+from Doduo.config import (
+    ROOT_DIR,
+    MATCH_PROCESSES,
+    CONFIG_RELOAD_GRACE,
+    RELOAD_START_METHOD,
+)
+from Doduo import ConfigException
+
+
+logger = logging.getLogger(__name__)
+
+
+class MatcherReloader:
+    """
+    Holder of the MatcherPool serving a config file, replacing it
+    whenever the config is reloaded.
+
+    Requests should read `pool` once and use that pool throughout:
+    a replaced pool keeps serving for a grace period before its
+    workers are stopped, and after that it matches in-process.
+    """
+
+    def __init__(
+        self,
+        config_file,
+        processes=MATCH_PROCESSES,
+        grace=CONFIG_RELOAD_GRACE,
+        artifact=None,
+    ):
+        """
+        Args:
+            config_file (str): config file to load templates from.
+            processes (int):   number of matching worker processes.
+            grace (float):     seconds a replaced pool keeps serving.
+            artifact (str):    compiled artifact of the config to load
+                               instead while it is up to date, or None.
+        """
+        self.config_file = config_file
+        self.processes = processes
+        self.grace = grace
+        self.artifact = artifact
+        self.version = 0
+        self._lock = Lock()
+        self.mtime = self.__mtime()
+        self.pool = MatcherPool(self.build(), processes)
+
+    def __mtime(self):
+        """ Modification time of the config file, or None. """
+        try:
+            return os.path.getmtime(ROOT_DIR + "configs/" + self.config_file)
+        except OSError:
+            return None
+
+    def build(self):
+        """
+        Build a Matcher of the config, from its compiled artifact if
+        one is set and up to date, else from the YAML.
+
+        Returns:
+            Matcher of the config.
+        """
+        if self.artifact is not None:
+            try:
+                matcher = Matcher.load(self.artifact, self.config_file)
+            except ConfigException as e:
+                logger.warning("%s Loading the YAML config instead.", e)
+            else:
+                logger.info("Loaded compiled artifact %s", self.artifact)
+                return matcher
+        return Matcher(self.config_file)
+
+    def reload(self):
+        """
+        Rebuild the Matcher from the config file and swap it in.
+        On failure the current Matcher stays in place. Reloads run
+        alongside request threads, so the new pool's workers are
+        started with RELOAD_START_METHOD rather than forked, and
+        are swapped in once they have all loaded their models.
+
+        Returns:
+            The new config version.
+        Raises:
+            ConfigException: if the config file is invalid, or the new
+                             workers did not start.
+        """
+        with self._lock:
+            # Record the file's version first, so a broken config is not
+            # retried by the watcher until it changes again.
+            self.mtime = self.__mtime()
+            pool = MatcherPool(
+                self.build(), self.processes, RELOAD_START_METHOD
+            )
+            old, self.pool = self.pool, pool
+            self.version += 1
+            version = self.version
+
+        logger.info(
+            "Reloaded config %s (version %d)", self.config_file, version
+        )
+        if old.pool is not None:
+            timer = Timer(self.grace, old.close, kwargs={"wait": True})
+            timer.daemon = True
+            timer.start()
+        return version
+
+    def reload_if_changed(self):
+        """
+        Reload the config if its file changed since the last load.
+
+        Returns:
+            The new config version, or None if unchanged.
+        """
+        if self.__mtime() == self.mtime:
+            return None
+        return self.reload()
+
+    def watch(self, interval):
+        """
+        Check the config file for changes every interval seconds
+        in a background thread, reloading it when changed.
+
+        Args:
+            interval (float): seconds between checks.
+        """
+
+        def loop():
+            while True:
+                sleep(interval)
+                try:
+                    self.reload_if_changed()
+                except ConfigException as e:
+                    logger.error("Config reload failed: %s", e)
+
+        Thread(target=loop, name="config-watcher", daemon=True).start()
@@ -4,20 +4,91 @@ Doduo/Doduo.server
 The Flask server for accessing a Doduo Matcher.
 """
 
-from flask import request, jsonify, Flask
+from hmac import compare_digest
+from time import perf_counter
+
+from flask import request, jsonify, Flask, Response
 from flask_cors import CORS
 
-from Doduo.matcher import Matcher
-from Doduo.config import CONFIG_FILE
-from Doduo import InvalidUsage
+from Doduo.reload import MatcherReloader
+from Doduo.config import (
+    CONFIG_FILE,
+    MATCH_PROCESSES,
+    CONFIG_RELOAD_INTERVAL,
+    ADMIN_TOKEN,
+    ARTIFACT_FILE,
+)
+from Doduo import InvalidUsage, ConfigException, metrics
 
 
 app = Flask(__name__)
 cors = CORS(app)
 
 # Instantiate the Matcher singleton. Blueprints in CONFIG_FILE
-# will be compiled in this line.
-main_matcher = Matcher(CONFIG_FILE)
+# will be compiled in this line (or loaded from their compiled
+# ARTIFACT_FILE), and only the models they need loaded.
+# The pool then forks the workers that serve requests, which share
+# the loaded Matcher. The reloader swaps in a new Matcher and pool
+# whenever the config is reloaded.
+main_reloader = MatcherReloader(
+    CONFIG_FILE, MATCH_PROCESSES, artifact=ARTIFACT_FILE
+)
+if CONFIG_RELOAD_INTERVAL is not None:
+    main_reloader.watch(CONFIG_RELOAD_INTERVAL)
+
+
+def respond(endpoint, body, start, timings=None):
+    """
+    Serialize a response body, recording the time spent serializing
+    it and handling the request.
+
+    Args:
+        endpoint (str): name of the endpoint, labelling its metrics.
+        body (dict):    response body.
+        start (float):  perf_counter at the start of the request.
+        timings (dict): stage timings of a debug request, returned in
+                        the body, or None.
+    Returns:
+        JSON response.
+    """
+    labels = (("endpoint", endpoint),)
+    serialize_start = perf_counter()
+    response = jsonify(body)
+    serialized = perf_counter()
+    metrics.record(
+        "doduo_serialize_seconds", serialized - serialize_start, labels
+    )
+    if timings is not None:
+        timings["serialize"] = serialized - serialize_start
+        timings["request"] = serialized - start
+        body["timings"] = timings
+        response = jsonify(body)
+    metrics.record("doduo_request_seconds", perf_counter() - start, labels)
+    return response
+
+
+def request_body():
+    """
+    Returns:
+        The request's JSON object body.
+    Raises:
+        InvalidUsage: if the body is not a JSON object.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise InvalidUsage("Request body must be a JSON object.")
+    return body
+
+
+def debug_timings(body):
+    """
+    Args:
+        body (dict): the request's JSON object body.
+    Returns:
+        An empty dictionary to collect stage timings into if the
+        request sets `debug`, else None.
+    """
+    return {} if body.get("debug") else None
 
 
 @app.route("/match", methods=["POST"])
@@ -26,26 +97,103 @@ def api_match():
     The main API endpoint to handle client requests for
     parsing query strings.
     """
+    start = perf_counter()
+    body = request_body()
 
     # `query` is a mandatory attribute.
-    if "query" not in request.json:
+    if "query" not in body:
         raise InvalidUsage("Request missing query.", status_code=400)
-    query = request.json["query"]
+    query = body["query"]
 
     # `templates` is an optional attribute.
-    if "templates" in request.json:
-        template_ids = request.json["templates"]
+    if "templates" in body:
+        template_ids = body["templates"]
     else:
         template_ids = None
 
+    timings = debug_timings(body)
+    matches = main_reloader.pool.match(query, template_ids, timings=timings)
+    return respond(
+        "match", {"success": True, "matches": matches}, start, timings
+    )
+
+
+@app.route("/match/batch", methods=["POST"])
+def api_match_batch():
+    """
+    API endpoint to handle client requests for parsing a batch
+    of query strings at once.
+    """
+    start = perf_counter()
+    body = request_body()
+
+    # `queries` is a mandatory attribute.
+    if "queries" not in body:
+        raise InvalidUsage("Request missing queries.", status_code=400)
+    queries = body["queries"]
+    if not isinstance(queries, list):
+        raise InvalidUsage("Invalid queries body.", status_code=400)
+
+    # `templates` is an optional attribute.
+    if "templates" in body:
+        template_ids = body["templates"]
+    else:
+        template_ids = None
+
+    timings = debug_timings(body)
+    pool = main_reloader.pool
+    matches = list(pool.match_many(queries, template_ids, timings=timings))
+    return respond(
+        "match_batch", {"success": True, "matches": matches}, start, timings
+    )
+
+
+@app.route("/stats", methods=["GET"])
+def api_stats():
+    """
+    API endpoint reporting the hit rates and eviction counts
+    of the matching caches.
+    """
     return jsonify(
-        {
-            "success": True,
-            "matches": list(main_matcher.match(query, template_ids)),
-        }
+        {"success": True, "caches": main_reloader.pool.cache_stats()}
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+def api_metrics():
+    """
+    API endpoint exposing the stage latency histograms, counters
+    and cache statistics in the Prometheus text format.
+    """
+    pool = main_reloader.pool
+    return Response(
+        metrics.render(pool.metrics_snapshot(), pool.cache_stats()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
     )
 
 
+@app.route("/admin/reload", methods=["POST"])
+def api_reload():
+    """
+    Admin endpoint recompiling the config file in the background
+    of live traffic and swapping the new templates in. Disabled
+    unless an admin token is configured.
+    """
+    if ADMIN_TOKEN is None:
+        return (
+            jsonify({"success": False, "error": "Admin endpoints disabled."}),
+            404,
+        )
+    token = request.headers.get("X-Admin-Token", "")
+    if not compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({"success": False, "error": "Unauthorized."}), 403
+    try:
+        version = main_reloader.reload()
+    except ConfigException as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify({"success": True, "version": version})
+
+
 @app.errorhandler(InvalidUsage)
 def handle_invalid_usage(error):
     """
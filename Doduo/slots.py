@@ -0,0 +1,86 @@
+"""
+Doduo/Doduo.slots
+
+Immutable, structurally shared slot assignments used while matching.
+Extending a hypothesis with a child's slots is an O(1) concatenation
+that shares both operands; assignments are only materialized into
+dictionaries for the final results.
+
+An assignment is either None (no slots), a (slot name, value) leaf
+tuple, or a SlotConcat joining two assignments in order.
+"""
+
+
+class SlotConcat:
+    """
+    Concatenation of two non-empty slot assignments.
+    """
+
+    __slots__ = ("left", "right")
+
+    def __init__(self, left, right):
+        """
+        Args:
+            left:  slot assignment whose values come first.
+            right: slot assignment whose values come second.
+        """
+        self.left = left
+        self.right = right
+
+
+def concat(left, right):
+    """
+    Concatenate two slot assignments without copying either.
+
+    Args:
+        left:  slot assignment whose values come first.
+        right: slot assignment whose values come second.
+    Returns:
+        The concatenated slot assignment.
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return SlotConcat(left, right)
+
+
+def materialize(slots):
+    """
+    Build the dictionary of a slot assignment.
+
+    Args:
+        slots: slot assignment.
+    Returns:
+        Dictionary from slot names to lists of values, with names in
+        order of first appearance and values in assignment order.
+    """
+    result = {}
+    stack = [slots]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        if type(node) is SlotConcat:
+            stack.append(node.right)
+            stack.append(node.left)
+        else:
+            name, value = node
+            if name in result:
+                result[name].append(value)
+            else:
+                result[name] = [value]
+    return result
+
+
+def freeze(slot_dict):
+    """
+    Build a hashable key of a materialized slot dictionary, so that
+    identical assignments can be deduplicated.
+
+    Args:
+        slot_dict (dict): dictionary from slot names to lists of values.
+    Returns:
+        Tuple of (slot name, tuple of values) pairs.
+    """
+    return tuple((name, tuple(values)) for name, values in slot_dict.items())
@@ -8,14 +8,71 @@ The main difficulty is determining membership
 with no negative samples.
 """
 
-from scipy.spatial.distance import cosine
+from hashlib import sha1
+from weakref import WeakValueDictionary
 from scipy.stats import tstd
 import numpy as np
 import re
 
-from Doduo import word_model
+from Doduo import get_word_model, metrics
 from Doduo import ConfigException
-from Doduo.config import SLACK_DEFAULT
+from Doduo.cache import LRUCache
+from Doduo.config import (
+    SLACK_DEFAULT,
+    SOFT_INDEX_THRESHOLD,
+    SOFT_INDEX_TABLES,
+    SOFT_INDEX_BUCKET_SIZE,
+    EMBED_CACHE_SIZE,
+    SOFT_VERDICT_CACHE_SIZE,
+)
+
+
+# Characters stripped from words before embedding lookups.
+NON_WORD_CHARS = re.compile("[^a-zA-Z0-9_]")
+
+# Per-process caches shared by every SoftModel: normalized word to
+# embedding (None if out of vocabulary), and (model id, normalized
+# word) to membership verdict.
+embed_cache = LRUCache(EMBED_CACHE_SIZE)
+verdict_cache = LRUCache(SOFT_VERDICT_CACHE_SIZE)
+
+# SoftModels built by build_soft_model, keyed by their sample words, so
+# that reloaded configs reuse the models of unchanged seeds. Models are
+# dropped once no template uses them.
+soft_models = WeakValueDictionary()
+
+
+def cache_stats():
+    """
+    Returns:
+        Dictionary of the soft matching caches' statistics.
+    """
+    return {
+        "embed": embed_cache.stats(),
+        "soft_verdict": verdict_cache.stats(),
+    }
+
+
+def clear_caches():
+    """
+    Clear the soft matching caches and built models, e.g. after
+    swapping the word embedding model.
+    """
+    embed_cache.clear()
+    verdict_cache.clear()
+    soft_models.clear()
+
+
+def normalize_word(word):
+    """
+    Normalize a word into its embedding vocabulary key.
+
+    Args:
+        word (str): string word to normalize.
+    Returns:
+        Lowercase string stripped of non-word characters.
+    """
+    return NON_WORD_CHARS.sub("", str(word)).lower().strip()
 
 
 def embed(word):
@@ -29,12 +86,250 @@ def embed(word):
         1-dimensional numpy array that is the word vector. Raises
         ValueError if the word is out of vocabulary.
     """
-    word = re.compile("[^a-zA-Z0-9_]").sub("", str(word)).lower().strip()
-    if word in word_model:
-        norm = np.linalg.norm(word_model[word])
-        return word_model[word] / norm
-    else:
+    key = normalize_word(word)
+    vec = embed_cache.get(key, False)
+    if vec is False:
+        vec = get_word_model().get(key)
+        if vec is not None:
+            # Store rows are already norm-1; only widen half-precision
+            # stores. Cached vectors are shared, so freeze them.
+            vec = np.array(vec, dtype=np.float32)
+            vec.flags.writeable = False
+        embed_cache.put(key, vec)
+    if vec is None:
         raise ValueError("Invalid words...")
+    return vec
+
+
+def embed_many(words):
+    """
+    Convert a list of words to a matrix of norm-1 word vectors.
+
+    Args:
+        words (list): list of string words to embed.
+    Returns:
+        Tuple of a (k, dim) matrix holding the vectors of the k
+        in-vocabulary words, and a boolean numpy array marking which
+        of the words are in vocabulary.
+    """
+    vecs = []
+    found = np.zeros(len(words), dtype=bool)
+    for i, word in enumerate(words):
+        try:
+            vecs.append(embed(word))
+            found[i] = True
+        except ValueError:
+            pass
+    if not vecs:
+        return np.zeros((0, get_word_model().dim), dtype=np.float32), found
+    vecs = np.vstack(vecs)
+    return vecs, found
+
+
+class LSHIndex:
+    """
+    Random-projection LSH index for approximate maximum cosine
+    similarity search over norm-1 vectors.
+
+    Each table hashes a vector to the sign pattern of its projections
+    on random hyperplanes. Queries probe their own bucket and every
+    bucket one bit away in each table, then score the probed samples
+    exactly. The number of bits grows with the sample count so that
+    buckets (and the per-query cost) stay small. The buckets of all
+    tables live in one sorted key array, so probing is a handful of
+    vectorized searches however many samples are indexed.
+    """
+
+    def __init__(
+        self,
+        vecs,
+        n_tables=SOFT_INDEX_TABLES,
+        bucket_size=SOFT_INDEX_BUCKET_SIZE,
+        seed=0,
+    ):
+        """
+        Args:
+            vecs (np.ndarray):  (n, dim) matrix of norm-1 vectors.
+            n_tables (int):     number of hash tables.
+            bucket_size (int):  target number of vectors per bucket.
+            seed (int):         seed of the random hyperplanes.
+        """
+        self.vecs = vecs
+        n_bits = int(np.ceil(np.log2(max(len(vecs) / bucket_size, 2))))
+        self.n_bits = min(max(n_bits, 1), 24)
+        self.n_tables = n_tables
+        self.planes = (
+            np.random.RandomState(seed)
+            .standard_normal((n_tables * self.n_bits, vecs.shape[1]))
+            .astype(np.float32)
+        )
+        self.powers = 1 << np.arange(self.n_bits, dtype=np.int64)
+
+        # Offset each table's codes into its own key range, then sort
+        # the keys of all tables together with their sample rows.
+        self.offsets = np.arange(n_tables, dtype=np.int64) << self.n_bits
+        keys = (self.hash(vecs) + self.offsets).T.ravel()
+        rows = np.tile(np.arange(len(vecs), dtype=np.int64), n_tables)
+        order = np.argsort(keys, kind="mergesort")
+        self.keys = keys[order]
+        self.rows = rows[order]
+
+        # XOR masks of the probed buckets: the hashed bucket itself and
+        # every bucket one bit away.
+        self.probe_masks = np.concatenate([[0], self.powers])
+
+    def hash(self, vecs):
+        """
+        Hash vectors into one code per table.
+
+        Args:
+            vecs (np.ndarray): (k, dim) matrix of vectors.
+        Returns:
+            (k, n_tables) integer numpy array of hash codes.
+        """
+        bits = vecs.dot(self.planes.T) > 0
+        bits = bits.reshape(len(vecs), self.n_tables, self.n_bits)
+        return bits.dot(self.powers)
+
+    def candidates(self, vec):
+        """
+        Find the sample rows probed for a query vector.
+
+        Args:
+            vec (np.ndarray): (dim,) norm-1 vector.
+        Returns:
+            Numpy array of candidate row indices, possibly repeated.
+        """
+        codes = self.hash(vec[None, :])[0]
+        probes = (codes[:, None] ^ self.probe_masks) + self.offsets[:, None]
+        probes = probes.ravel()
+        lo = np.searchsorted(self.keys, probes, side="left")
+        hi = np.searchsorted(self.keys, probes, side="right")
+        sizes = hi - lo
+        total = int(sizes.sum())
+        if not total:
+            return np.zeros(0, dtype=np.int64)
+
+        # Expand the [lo, hi) ranges into one array of positions.
+        starts = np.repeat(lo - np.cumsum(sizes) + sizes, sizes)
+        return self.rows[starts + np.arange(total)]
+
+    def max_similarity(self, vec):
+        """
+        Approximate the highest cosine similarity of vec to the samples.
+
+        Args:
+            vec (np.ndarray): (dim,) norm-1 vector.
+        Returns:
+            Float similarity, -1 if no sample was probed.
+        """
+        rows = self.candidates(vec)
+        if not len(rows):
+            return -1.0
+        return float(np.max(self.vecs[rows].dot(vec)))
+
+
+class SoftModel:
+    """
+    Soft membership model over a set of sample vectors.
+
+    The norm-1 sample vectors (and their normalized mean) are stacked
+    into one matrix. Since all vectors are norm-1, the cosine distance
+    to a sample is 1 - dot product: a word belongs to the class if its
+    highest similarity to the samples is at least 1 - slack. Large
+    sample sets are searched through an LSHIndex instead.
+    """
+
+    def __init__(self, samples, slack, index_threshold=SOFT_INDEX_THRESHOLD):
+        """
+        Args:
+            samples (np.ndarray):   (n, dim) matrix of norm-1 vectors.
+            slack (float):          maximum cosine distance to permit.
+            index_threshold (int):  build an LSHIndex over the samples if
+                                    there are more than this many.
+        """
+        self.samples = np.ascontiguousarray(samples, dtype=np.float32)
+        self.slack = slack
+        self.threshold = 1 - slack
+
+        # Models with the same samples and slack share cached verdicts.
+        digest = sha1(self.samples.tobytes())
+        digest.update(repr(slack).encode("utf-8"))
+        self.model_id = digest.hexdigest()
+        self.index = None
+        if len(self.samples) > index_threshold:
+            self.index = LSHIndex(self.samples)
+
+    def score_vectors(self, vecs):
+        """
+        Compute the highest cosine similarity of each vector to the samples.
+
+        Args:
+            vecs (np.ndarray): (k, dim) matrix of norm-1 vectors.
+        Returns:
+            (k,) numpy array of similarities.
+        """
+        if not len(vecs):
+            return np.zeros(0, dtype=np.float32)
+        if self.index is not None:
+            return np.array([self.index.max_similarity(v) for v in vecs])
+        return np.max(vecs.dot(self.samples.T), axis=1)
+
+    def belongs_many(self, words):
+        """
+        Determine membership for many words in one call.
+
+        Args:
+            words (list): list of string words.
+        Returns:
+            List of booleans, one per word. Out of vocabulary
+            words never belong.
+        """
+        metrics.count("doduo_soft_match_words_total", len(words))
+        keys = [(self.model_id, normalize_word(word)) for word in words]
+        verdicts = [verdict_cache.get(key) for key in keys]
+        missing = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        if missing:
+            vecs, found = embed_many([keys[i][1] for i in missing])
+            computed = np.zeros(len(missing), dtype=bool)
+            computed[found] = self.score_vectors(vecs) >= self.threshold
+            for i, verdict in zip(missing, computed.tolist()):
+                verdicts[i] = verdict
+                verdict_cache.put(keys[i], verdict)
+        return verdicts
+
+    def __call__(self, word):
+        """
+        Determine membership for a single word.
+
+        Args:
+            word (str): string word.
+        Returns:
+            Boolean of whether the word belongs to the class.
+        """
+        metrics.count("doduo_soft_match_words_total")
+        key = (self.model_id, normalize_word(word))
+        verdict = verdict_cache.get(key)
+        if verdict is None:
+            try:
+                verdict = self.similarity(embed(key[1])) >= self.threshold
+            except ValueError:
+                verdict = False
+            verdict_cache.put(key, verdict)
+        return verdict
+
+    def similarity(self, vec):
+        """
+        Compute the highest cosine similarity of a vector to the samples.
+
+        Args:
+            vec (np.ndarray): (dim,) norm-1 vector.
+        Returns:
+            Float similarity.
+        """
+        if self.index is not None:
+            return self.index.max_similarity(vec)
+        return float(np.max(self.samples.dot(vec)))
 
 
 def build_soft_model(sample_words):
@@ -42,18 +337,25 @@ def build_soft_model(sample_words):
     Build a soft model for determining membership in an unknown
     class from which sample_words is drawn. We compute a
     slack value based on the variance of the word embeddings
-    of the sample words. We then return a boolean function
-    that computes the minimum distance of a word's embedding
+    of the sample words. We then return a SoftModel that
+    computes the minimum distance of a word's embedding
     and checks if it is smaller than the slack value.
 
     Args:
         sample_words (list): list of sample words.
     Returns:
-        Unnamed function that takes in a word and returns a boolean
+        SoftModel: callable taking in a word and returning a boolean
         of whether the word belongs to the same unnamed class as the
+        sample_words. Models are shared between calls with the same
         sample_words.
     """
 
+    # Reuse the model of the same sample words if still alive.
+    key = tuple(sample_words)
+    model = soft_models.get(key)
+    if model is not None:
+        return model
+
     # Attempt to embed sample words into sample_vecs.
     sample_vecs = []
     for word in sample_words:
@@ -63,33 +365,37 @@ def build_soft_model(sample_words):
             raise ConfigException(
                 "Soft match sample uses word '{}' not in model".format(word)
             )
-    if len(sample_vecs) is 0:
+    if not sample_vecs:
         raise ConfigException("No soft match samples provided.")
-    if len(sample_vecs) > 15:
-        raise NotImplementedError(
-            "Currently do not support > 15 options " "for soft matching."
-        )
+
+    model = soft_models[key] = fit_soft_model(np.vstack(sample_vecs))
+    return model
+
+
+def fit_soft_model(sample_vecs):
+    """
+    Fit a SoftModel to the embeddings of sample words.
+
+    Args:
+        sample_vecs (np.ndarray): (n, dim) matrix of norm-1 vectors.
+    Returns:
+        SoftModel over the samples and their normalized mean.
+    """
 
     # Compute a slack value based on the standard deviation of the
-    # sample's distance from their mean.
-    distances = [
-        cosine(vec, np.mean(sample_vecs, axis=0)) for vec in sample_vecs
-    ]
-    if np.mean(distances) == 0:
+    # sample's cosine distance from their mean.
+    mean = np.mean(sample_vecs, axis=0)
+    mean_norm = np.linalg.norm(mean)
+    if mean_norm > 0:
+        mean = mean / mean_norm
+    distances = 1 - sample_vecs.dot(mean)
+    if np.allclose(distances, 0, atol=1e-6):
         slack = SLACK_DEFAULT
     else:
         slack = max(distances) + tstd(distances)
 
     # Add the mean to the samples.
-    sample_vecs.append(np.mean(sample_vecs, axis=0))
-
-    # Boolean function to determine word membership: does_belong.
-    def does_belong(word):
-        try:
-            word_vec = embed(word)
-        except ValueError:
-            return False
-        return min([cosine(word_vec, vec) for vec in sample_vecs]) <= slack
+    if mean_norm > 0:
+        sample_vecs = np.vstack([sample_vecs, mean])
 
-    # Return our function.
-    return does_belong
+    return SoftModel(sample_vecs, float(slack))
@@ -0,0 +1,162 @@
+"""
+Doduo/Doduo.stream
+
+Matches JSON lines corpora offline, without the Flask server.
+Input lines are read lazily and results written as they are
+produced, so memory use does not grow with the size of the corpus.
+Results are synced to disk once per batch, and an interrupted run is
+resumed after the last complete line of its results.
+"""
+
+import io
+import json
+import os
+from collections import deque
+
+from Doduo import InvalidUsage
+from Doduo.config import PARSE_BATCH_SIZE
+
+
+# Bytes read at a time while scanning a results file backwards.
+SCAN_BLOCK_SIZE = 65536
+
+
+def read_jsonl(input_file, offset=0):
+    """
+    Lazily read the records of a JSON lines file.
+
+    Each line is either a JSON string, the query, or a JSON object
+    with a "query" attribute. Blank lines are skipped.
+
+    Args:
+        input_file (file):  JSON lines file opened in binary mode.
+        offset (int):       byte offset of the first line to read.
+    Returns:
+        A generator of (record, end offset) tuples, where the record
+        is a dictionary with a "query" attribute and the end offset is
+        the byte offset just past its line.
+    """
+    input_file.seek(offset)
+    for line in input_file:
+        offset += len(line)
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line.decode("utf-8"))
+        except ValueError:
+            raise InvalidUsage(
+                "Invalid JSON line ending at byte offset {}.".format(offset)
+            )
+        if not isinstance(record, dict):
+            record = {"query": record}
+        if "query" not in record:
+            raise InvalidUsage(
+                "Line ending at byte offset {} missing query.".format(offset)
+            )
+        yield record, offset
+
+
+def match_jsonl(
+    matcher,
+    input_file,
+    output_file,
+    template_ids=None,
+    batch_size=PARSE_BATCH_SIZE,
+    offset=0,
+):
+    """
+    Match every query of a JSON lines file, writing one JSON line of
+    results per input record.
+
+    Each output line is the input record with two more attributes:
+    "matches", the query's list of sentence results, and "offset", the
+    input byte offset to resume from once the line is written.
+
+    Args:
+        matcher (Matcher):   Matcher or MatcherPool to match the
+                             queries with.
+        input_file (file):   JSON lines file opened in binary mode.
+        output_file (file):  file opened in text mode to write to.
+        template_ids (list): templates to match against, or None for
+                             all known templates.
+        batch_size (int):    number of queries Spacy parses per batch.
+        offset (int):        input byte offset to start reading at.
+    Returns:
+        Number of records matched.
+    """
+    # Records wait here between being read for matching and their
+    # results being written, in input order.
+    pending = deque()
+
+    def queries():
+        for record, end in read_jsonl(input_file, offset):
+            pending.append((record, end))
+            yield record["query"]
+
+    # Sync once per batch, so a crash loses at most a batch of work.
+    n = 0
+    for matches in matcher.match_many(
+        queries(), template_ids, batch_size=batch_size
+    ):
+        record, end = pending.popleft()
+        result = dict(record, matches=matches, offset=end)
+        output_file.write(json.dumps(result) + "\n")
+        n += 1
+        if n % batch_size == 0:
+            _sync(output_file)
+    _sync(output_file)
+    return n
+
+
+def _sync(output_file):
+    """ Flush a file, and write it to disk if it has one. """
+    output_file.flush()
+    try:
+        fd = output_file.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        return
+    os.fsync(fd)
+
+
+def _rfind_newline(output_file, end):
+    """
+    Returns:
+        Byte offset of the last newline before end in a binary file,
+        or -1 if there is none.
+    """
+    while end > 0:
+        start = max(0, end - SCAN_BLOCK_SIZE)
+        output_file.seek(start)
+        i = output_file.read(end - start).rfind(b"\n")
+        if i >= 0:
+            return start + i
+        end = start
+    return -1
+
+
+def resume_jsonl(output_file, offset):
+    """
+    Prepare the results of an interrupted match_jsonl run to be
+    appended to from an input offset. A run killed mid-write leaves a
+    partial last line, which is truncated away.
+
+    Args:
+        output_file (file): results file opened in binary mode for
+                            reading and writing.
+        offset (int):       input byte offset the run resumes from.
+    Raises:
+        InvalidUsage: if the last complete line of results does not
+                      end at that input offset.
+    """
+    end = _rfind_newline(output_file, output_file.seek(0, os.SEEK_END)) + 1
+    output_file.truncate(end)
+    if end == 0:
+        return
+    start = _rfind_newline(output_file, end - 1) + 1
+    output_file.seek(start)
+    last = json.loads(output_file.read(end - start).decode("utf-8"))
+    if last["offset"] != offset:
+        raise InvalidUsage(
+            "Results end at input offset {}, not {}; resume from "
+            "there.".format(last["offset"], offset)
+        )
@@ -0,0 +1,119 @@
+"""
+Doduo/Doduo.subset
+
+Builds pruned embedding stores restricted to the serving vocabulary:
+the words of a frequency list or of a replay of logged queries, plus
+the soft match seeds of configs. Only words surviving normalize_word
+are ever looked up, so the subset is keyed by normalized words.
+Serve a subset by setting EMB_SUBSET_FILE; words outside of it fall
+back to the full store (see Doduo.embeddings.SubsetStore).
+
+Build a subset by calling:
+    `python3.6 -m Doduo subset --freq words.txt --queries log.jsonl`
+"""
+
+from yaml import load, YAMLError
+
+from Doduo import get_nlp, ConfigException
+from Doduo.config import ROOT_DIR
+from Doduo.embeddings import subset_store
+from Doduo.soft_match import normalize_word
+from Doduo.stream import read_jsonl
+
+
+def frequency_words(freq_file, top=None):
+    """
+    Read the words of a frequency list: one word per line, optionally
+    followed by whitespace separated counts, most frequent first.
+
+    Args:
+        freq_file (file): frequency list opened in text mode.
+        top (int):        only read the first top words, or None.
+    Returns:
+        A generator of words.
+    """
+    n = 0
+    for line in freq_file:
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        if top is not None and n >= top:
+            return
+        n += 1
+        yield fields[0]
+
+
+def query_words(input_file):
+    """
+    Read the words of a replay of logged queries, tokenized the way
+    parse_query tokenizes them.
+
+    Args:
+        input_file (file): JSON lines queries opened in binary mode,
+                           see Doduo.stream.read_jsonl.
+    Returns:
+        A generator of words.
+    """
+    tokenizer = get_nlp().tokenizer
+    for record, _ in read_jsonl(input_file):
+        for token in tokenizer(record["query"]):
+            yield token.text
+
+
+def soft_match_seeds(config_file):
+    """
+    Collect the soft match seeds of a config.
+
+    Args:
+        config_file (str): config file name, under configs/.
+    Returns:
+        List of the seed word lists of every soft_match vertex.
+    """
+    try:
+        with open(ROOT_DIR + "configs/" + config_file, "r") as f:
+            config = load(f)
+    except (YAMLError, FileNotFoundError):
+        raise ConfigException(
+            "Config file '{}' not found or invalid YAML.".format(config_file)
+        )
+
+    seeds = []
+    stack = [
+        blueprint
+        for template in config.values()
+        for blueprint in template["patterns"]
+    ]
+    while stack:
+        blueprint = stack.pop()
+        if blueprint.get("soft_match"):
+            seeds.append(blueprint["soft_match"])
+        stack.extend(blueprint.get("children") or [])
+    return seeds
+
+
+def seed_words(config_file):
+    """
+    Args:
+        config_file (str): config file name, under configs/.
+    Returns:
+        List of the seed words of every soft_match vertex.
+    """
+    return [word for seeds in soft_match_seeds(config_file) for word in seeds]
+
+
+def build_subset(store, words, dst_path):
+    """
+    Write the subset of a store covering the normalized forms of
+    a collection of words.
+
+    Args:
+        store (EmbeddingStore): full store.
+        words (iterable):       words to cover.
+        dst_path (str):         store path to write, without the file
+                                suffixes.
+    Returns:
+        Number of words written.
+    """
+    keys = {normalize_word(word) for word in words}
+    keys.discard("")
+    return subset_store(store, keys, dst_path)
@@ -0,0 +1,338 @@
+"""
+Doduo/Doduo.synthetic
+
+Random but valid template configs and dependency trees, for measuring
+how matching cost scales with the shape of patterns and queries.
+Pattern depth and branching, the ratio of optional children, the
+density of soft match vertices and the vocabulary size are all
+controlled by the generator. Trees are built into Sentences without
+Spacy, so they feed Template.match directly, and trees instantiated
+from a pattern are matched by it.
+
+Write a config and a corpus of trees by calling:
+    `python3.6 -m Doduo synthesize --output configs/synthetic_500.yml
+    --templates 500 --depth 4 --trees 1000`
+"""
+
+import random
+
+import numpy as np
+from yaml import safe_dump
+
+from Doduo.embeddings import EmbeddingStore
+from Doduo.query import Sentence, Query
+
+
+# Dependency relations of a child token, by its POS tag.
+CHILD_RELS = {
+    "noun": ("nsubj", "dobj", "pobj", "attr", "compound"),
+    "verb": ("ccomp", "xcomp", "advcl"),
+    "adj": ("amod", "acomp"),
+    "adv": ("advmod",),
+    "pron": ("nsubj", "dobj"),
+    "det": ("det",),
+    "adp": ("prep",),
+}
+
+# POS tags of the tokens that head a sentence, and of their children.
+ROOT_POS = ("verb", "noun")
+SYNTHETIC_POS = tuple(CHILD_RELS)
+
+# Words of a POS tag grouped into soft match clusters of this size.
+CLUSTER_SIZE = 8
+
+
+class SyntheticGenerator:
+    """
+    Seeded generator of pattern blueprints, template configs and
+    dependency trees over a synthetic vocabulary. Words are named after
+    their POS tag (e.g. "noun17"), and the words of a POS tag are
+    grouped into clusters that soft match patterns sample from.
+    """
+
+    def __init__(
+        self,
+        depth=3,
+        branching=2,
+        optional_ratio=0.2,
+        soft_ratio=0.1,
+        vocab_size=1000,
+        exact_ratio=0.5,
+        slot_ratio=0.5,
+        seed=0,
+    ):
+        """
+        Args:
+            depth (int):            maximum depth of patterns and trees,
+                                    1 for a single vertex.
+            branching (int):        maximum number of children of a
+                                    pattern vertex or tree token.
+            optional_ratio (float): fraction of optional pattern children.
+            soft_ratio (float):     fraction of soft match vertices.
+            vocab_size (int):       number of distinct words.
+            exact_ratio (float):    fraction of exact match vertices,
+                                    among the vertices not soft matched.
+            slot_ratio (float):     fraction of vertices filling a slot.
+            seed (int):             random seed.
+        """
+        if depth < 1 or branching < 0:
+            raise ValueError("Depth must be positive, branching not negative.")
+        if vocab_size < len(SYNTHETIC_POS):
+            raise ValueError(
+                "Vocabulary needs a word per POS tag: {}.".format(
+                    len(SYNTHETIC_POS)
+                )
+            )
+        self.depth = depth
+        self.branching = branching
+        self.optional_ratio = optional_ratio
+        self.soft_ratio = soft_ratio
+        self.exact_ratio = exact_ratio
+        self.slot_ratio = slot_ratio
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # Number of slots of the pattern being generated.
+        self._slots = 0
+
+        # Words of each POS tag, dealt round robin, and their clusters.
+        self.words = {pos: [] for pos in SYNTHETIC_POS}
+        for i in range(vocab_size):
+            pos = SYNTHETIC_POS[i % len(SYNTHETIC_POS)]
+            self.words[pos].append("{}{}".format(pos, len(self.words[pos])))
+        self.clusters = {
+            pos: [
+                words[k : k + CLUSTER_SIZE]
+                for k in range(0, len(words), CLUSTER_SIZE)
+            ]
+            for pos, words in self.words.items()
+        }
+
+    @property
+    def vocabulary(self):
+        """
+        Returns:
+            List of every word of the vocabulary.
+        """
+        return [word for words in self.words.values() for word in words]
+
+    def pattern(self):
+        """
+        Generate a random pattern blueprint, as in a config.
+
+        Returns:
+            Dictionary blueprint of the pattern's root vertex.
+        """
+        self._slots = 0
+        return self._vertex(self.rng.choice(ROOT_POS), None, self.depth)
+
+    def _vertex(self, pos, rel, depth):
+        """ Generate a pattern vertex and, depth allowing, children. """
+        rng = self.rng
+        blueprint = {}
+        if rel is not None:
+            blueprint["rels"] = [rel]
+        roll = rng.random()
+        if roll < self.soft_ratio:
+            cluster = rng.choice(self.clusters[pos])
+            blueprint["soft_match"] = rng.sample(cluster, min(3, len(cluster)))
+        elif roll < self.soft_ratio + (1 - self.soft_ratio) * self.exact_ratio:
+            words = self.words[pos]
+            blueprint["exact_match"] = rng.sample(
+                words, min(rng.randint(1, 3), len(words))
+            )
+        else:
+            blueprint["pos_match"] = [pos]
+        if rng.random() < self.slot_ratio:
+            blueprint["slot_name"] = "slot_{}".format(self._slots)
+            self._slots += 1
+            if rng.random() < 0.2:
+                blueprint["slot_is_full_phrase"] = True
+
+        if depth > 1 and self.branching > 0:
+            children = []
+            for _ in range(rng.randint(1, self.branching)):
+                child_pos = rng.choice(SYNTHETIC_POS)
+                child = self._vertex(
+                    child_pos, rng.choice(CHILD_RELS[child_pos]), depth - 1
+                )
+                if rng.random() < self.optional_ratio:
+                    child["optional"] = True
+                children.append(child)
+            blueprint["children"] = children
+        return blueprint
+
+    def templates(self, n_templates, patterns_per_template=2):
+        """
+        Generate a template config.
+
+        Args:
+            n_templates (int):           number of templates.
+            patterns_per_template (int): number of patterns of each.
+        Returns:
+            Dictionary config of template ids to their "patterns", see
+            dump to write it as YAML.
+        """
+        return {
+            "synthetic_{:04d}".format(k): {
+                "patterns": [
+                    self.pattern() for _ in range(patterns_per_template)
+                ]
+            }
+            for k in range(n_templates)
+        }
+
+    def tree(self, pattern=None, noise=0.3):
+        """
+        Generate a parse of a sentence, either random or instantiated
+        from a pattern so that the pattern matches its root.
+
+        Args:
+            pattern (dict): pattern blueprint to instantiate, or None for
+                            a random tree of the generator's shape.
+            noise (float):  probability of an extra random child under
+                            each instantiated token.
+        Returns:
+            List of (word, pos, head index, dep, ent) tuples, as taken
+            by Sentence.from_tokens.
+        """
+        if pattern is None:
+            node = self._random_node(self.rng.choice(ROOT_POS), "ROOT", 1)
+        else:
+            node = self._instantiate(pattern, "ROOT", noise)
+        tokens = []
+        self._flatten(node, None, tokens)
+        return [tuple(token) for token in tokens]
+
+    def _random_node(self, pos, rel, depth):
+        """ Generate a random (word, pos, rel, lefts, rights) node. """
+        rng = self.rng
+        node = (rng.choice(self.words[pos]), pos, rel, [], [])
+        if depth < self.depth:
+            for _ in range(rng.randint(0, self.branching)):
+                child_pos = rng.choice(SYNTHETIC_POS)
+                child = self._random_node(
+                    child_pos, rng.choice(CHILD_RELS[child_pos]), depth + 1
+                )
+                node[3 if rng.random() < 0.5 else 4].append(child)
+        return node
+
+    def _instantiate(self, blueprint, rel, noise):
+        """ Generate a node matched by a pattern vertex. """
+        rng = self.rng
+        if "exact_match" in blueprint:
+            word = rng.choice(blueprint["exact_match"])
+        elif "soft_match" in blueprint:
+            word = rng.choice(blueprint["soft_match"])
+        else:
+            word = rng.choice(self.words[blueprint["pos_match"][0]])
+        node = (word, word.rstrip("0123456789"), rel, [], [])
+        for child in blueprint.get("children", ()):
+            if child.get("optional") and rng.random() < 0.5:
+                continue
+            node[3 if rng.random() < 0.5 else 4].append(
+                self._instantiate(child, child["rels"][0], noise)
+            )
+        if rng.random() < noise:
+            pos = rng.choice(SYNTHETIC_POS)
+            node[4].append(
+                self._random_node(pos, rng.choice(CHILD_RELS[pos]), self.depth)
+            )
+        return node
+
+    def _flatten(self, node, head, tokens):
+        """ Append a node's subtree to tokens, in sentence order. """
+        word, pos, rel, lefts, rights = node
+        heads = []
+        for child in lefts:
+            heads.append(self._flatten(child, None, tokens))
+        i = len(tokens)
+        tokens.append(
+            [word, pos.upper(), i if head is None else head, rel, ""]
+        )
+        for child_i in heads:
+            tokens[child_i][2] = i
+        for child in rights:
+            self._flatten(child, i, tokens)
+        return i
+
+    def trees(self, config, n, match_ratio=0.5, noise=0.3):
+        """
+        Generate a corpus of parses for a template config.
+
+        Args:
+            config (dict):       config, see templates.
+            n (int):             number of parses.
+            match_ratio (float): fraction of the parses instantiated from
+                                 a random pattern of the config, the
+                                 others being random trees.
+            noise (float):       see tree.
+        Returns:
+            List of token lists, see tree.
+        """
+        patterns = [
+            pattern
+            for template in config.values()
+            for pattern in template["patterns"]
+        ]
+        return [
+            self.tree(
+                self.rng.choice(patterns)
+                if patterns and self.rng.random() < match_ratio
+                else None,
+                noise,
+            )
+            for _ in range(n)
+        ]
+
+    def sentence(self, pattern=None, noise=0.3):
+        """
+        Returns:
+            Sentence of a tree, see tree.
+        """
+        return Sentence.from_tokens(self.tree(pattern, noise))
+
+    def query(self, pattern=None, noise=0.3):
+        """
+        Returns:
+            Query at the root of a tree's Sentence, see tree.
+        """
+        sentence = self.sentence(pattern, noise)
+        return Query(sentence, sentence.root)
+
+    def store(self, dim=32):
+        """
+        Build an in-memory word embedding store of the vocabulary, in
+        which the words of a cluster lie close to a shared center.
+
+        Args:
+            dim (int): dimensionality of the vectors.
+        Returns:
+            EmbeddingStore of the vocabulary.
+        """
+        rng = np.random.RandomState(self.seed)
+        vectors = {}
+        for clusters in self.clusters.values():
+            for cluster in clusters:
+                center = rng.standard_normal(dim) * 3
+                for word in cluster:
+                    vectors[word] = center + rng.standard_normal(dim)
+        vocab = sorted(vectors)
+        matrix = np.array([vectors[word] for word in vocab], dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        return EmbeddingStore(
+            matrix,
+            np.array([w.encode("utf-8") for w in vocab], dtype=np.bytes_),
+        )
+
+
+def dump(config, stream=None):
+    """
+    Write a template config as YAML.
+
+    Args:
+        config (dict): config, see SyntheticGenerator.templates.
+        stream (file): file to write to, or None.
+    Returns:
+        The YAML text if stream is None.
+    """
+    return safe_dump(config, stream, default_flow_style=None)
@@ -5,12 +5,65 @@ A tree structure for easily comparing against
 Query trees.
 """
 
-import copy
+from itertools import count
+from threading import Lock
+from weakref import WeakValueDictionary
 
-from Doduo import intersect
+from Doduo.compiled import Predicate, CompiledPattern
+from Doduo.slots import concat, materialize, freeze
 from Doduo.soft_match import build_soft_model
 
 
+# Map of Template subtree signatures to their Nodes. Structurally
+# identical subtrees, across all patterns and templates, share a node
+# id and so form a DAG: their match results are computed once per
+# token and memoized under (node id, token index). Entries are dropped
+# once no Template holds their Node, e.g. after a config reload, and
+# node ids are never reused.
+_nodes = WeakValueDictionary()
+_nodes_lock = Lock()
+_node_counter = count()
+
+
+class Node:
+    """
+    Identity of a Template subtree, held by every live Template of
+    the same signature.
+    """
+
+    __slots__ = ("id", "__weakref__")
+
+    def __init__(self):
+        self.id = next(_node_counter)
+
+
+class MatchContext:
+    """
+    State shared by every Template matched against one sentence: the
+    memo table of sub-template results, keyed by (node id, token
+    index), the bounds of the hypothesis search and the profile hook.
+    """
+
+    __slots__ = ("memo", "first_only", "dedupe", "max_hypotheses", "profile")
+
+    def __init__(self, first_only=False, dedupe=False, max_hypotheses=None):
+        """
+        Args:
+            first_only (bool):     keep only the first feasible slot
+                                   assignment of each vertex.
+            dedupe (bool):         drop duplicate slot assignments.
+            max_hypotheses (int):  maximum number of hypotheses kept per
+                                   vertex, or None for no bound.
+        """
+        self.memo = {}
+        self.first_only = first_only
+        self.dedupe = dedupe
+        self.max_hypotheses = max_hypotheses
+        # PatternStats (see Doduo.profiler) of the pattern being
+        # matched, counting the work of its vertices, or None.
+        self.profile = None
+
+
 class Template:
     def __init__(
         self,
@@ -63,6 +116,58 @@ class Template:
         if self.soft_match is not None:
             self.soft_match = build_soft_model(self.soft_match)
 
+        # Compile the vertex constraints into an integer-coded predicate.
+        self.predicate = Predicate(
+            rels=self.rels,
+            exact_match=self.exact_match,
+            case_sensitive=self.case_sensitive,
+            ner_match=self.ner_match,
+            pos_match=self.pos_match,
+            soft_match=self.soft_match,
+        )
+
+        self.__register()
+
+    def __register(self):
+        """
+        Identify this subtree by everything its match results depend
+        on, and look up its node id. The optional flag only matters
+        to the parent vertex.
+        """
+        self.signature = (
+            self.predicate.signature(),
+            self.slot_name,
+            self.slot_is_full_phrase,
+            self.slot_is_not_compound,
+            tuple((child.node_id, child.optional) for child in self.children),
+        )
+        with _nodes_lock:
+            node = _nodes.get(self.signature)
+            if node is None:
+                node = _nodes[self.signature] = Node()
+        self.node = node
+        self.node_id = node.id
+
+    def __getstate__(self):
+        # Node ids are only meaningful within a process.
+        state = dict(self.__dict__)
+        del state["signature"]
+        del state["node"]
+        del state["node_id"]
+        return state
+
+    def __setstate__(self, state):
+        # Children are unpickled, and so registered, before parents.
+        self.__dict__.update(state)
+        self.__register()
+
+    def compile(self):
+        """
+        Returns:
+            CompiledPattern flattening this Template tree.
+        """
+        return CompiledPattern(self)
+
     def match(self, candidate):
         """
         Match and obtain slot values for comparison of self
@@ -73,89 +178,160 @@ class Template:
             List of dictionaries, each of which is a feasible
             assignment of slot values.
         """
+        return self.match_at(candidate.sentence, candidate.i)
 
-        # If relationship is enforced and we do not have equivalence,
-        # this match is a failure.
-        if self.rels and candidate.rel not in self.rels:
+    def match_at(self, sentence, i, context=None):
+        """
+        Match and obtain slot values for comparison of self
+        and the subtree of a sentence's token.
+        Args:
+            sentence (Sentence):    parsed query sentence.
+            i (int):                index of the candidate token.
+            context (MatchContext): optional memo table and search
+                                    bounds, to share across every
+                                    Template matched against the
+                                    sentence.
+        Returns:
+            List of dictionaries, each of which is a feasible
+            assignment of slot values.
+        """
+        if context is None:
+            context = MatchContext()
+        result = self.match_slots(sentence, i, context)
+        if result is False:
             return False
+        return [materialize(slots) for slots in result]
 
-        # If match parameters are specified, enforce that at least one
-        # of them aligns.
-        if (
-            self.exact_match
-            or self.soft_match
-            or self.ner_match
-            or self.pos_match
-        ):
-            matched = False
-            if not self.case_sensitive:
-                matched = matched or candidate.text.lower() in self.exact_match
-            else:
-                matched = matched or candidate.text in self.exact_match
-            matched = matched or intersect(candidate.ner, self.ner_match)
-            matched = matched or (candidate.pos in self.pos_match)
-            if self.soft_match is not None:
-                matched = matched or self.soft_match(candidate.text)
-            if not matched:
-                return False
+    def match_slots(self, sentence, i, context):
+        """
+        Match self against the subtree of a sentence's token, returning
+        immutable slot assignments (see Doduo.slots). Results are
+        memoized in the context under (node id, token index).
+        Args:
+            sentence (Sentence):    parsed query sentence.
+            i (int):                index of the candidate token.
+            context (MatchContext): memo table and search bounds.
+        Returns:
+            List of slot assignments, each of which is a feasible
+            assignment of slot values, or False.
+        """
+        memo = context.memo
+        profile = context.profile
+        key = (self.node_id, i)
+        try:
+            result = memo[key]
+        except KeyError:
+            pass
+        else:
+            if profile is not None:
+                profile.memo_hits += 1
+            return result
+        if profile is not None:
+            profile.calls += 1
+
+        # Test the vertex's compiled constraints: the relationship,
+        # and at least one of the match parameters if any are specified.
+        if not self.predicate.test(sentence, i):
+            memo[key] = False
+            return False
 
         # The match for this vertex is succesful. We now begin
         # the slotting task and validating that children are matches.
 
         # Set our current hypothesis using this vertice's slot value.
-        # The hypotheses list is composed of a list of dictionaries.
-        # The unmatched key is a list of candidate.children that have
-        # not been aligned for the hypothesis and are available for
-        # matching. The slots key is a dictionary containing the
-        # filled in slot values for the hypothesis.
-        hypotheses = [{"unmatched": candidate.children[:], "slots": {}}]
+        # The hypotheses list is composed of (consumed, slots) tuples.
+        # The consumed bitmask marks the candidate's children that have
+        # been aligned for the hypothesis: bit j is set once the j-th
+        # child is taken and is no longer available for matching. The
+        # slots are the hypothesis' immutable slot assignment.
+        slots = None
         if self.slot_name is not None:
             if self.slot_is_full_phrase:
-                slot_value = candidate.get_phrase()
+                slot_value = sentence.get_phrase(i)
             elif self.slot_is_not_compound:
-                slot_value = candidate.text
+                slot_value = sentence.words[i]
             else:
-                slot_value = candidate.get_compound()
-            hypotheses[0]["slots"] = {self.slot_name: [slot_value]}
+                slot_value = sentence.get_compound(i)
+            slots = (self.slot_name, slot_value)
+        hypotheses = [(0, slots)]
+        cand_children = sentence.children[i]
 
         # For each hypothesis, we want to make sure that
         # there is a proper alignment with each one of the enforced
         # children of this tree.
         for template_child in self.children:
             new_hypotheses = []
-            for hyp in hypotheses:
-                for cand_child in hyp["unmatched"]:
+            for consumed, slots in hypotheses:
+                for j, cand_child in enumerate(cand_children):
+                    bit = 1 << j
+                    if consumed & bit:
+                        continue
+
                     # Check if this candidate-template pair is valid.
-                    result = template_child.match(cand_child)
+                    result = template_child.match_slots(
+                        sentence, cand_child, context
+                    )
                     if result is False:
                         continue
 
-                    # If so, we update our hypothesis.
-                    unmatched = [x for x in hyp["unmatched"] if x != cand_child]
-                    assert len(unmatched) == len(hyp["unmatched"]) - 1
-
                     # For each hypothesis of the child's match:
                     # we create a combination of that hypothesis and our
                     # current hypothesis to add to our hypotheses list.
                     for child_slots in result:
-                        slots = copy.deepcopy(hyp["slots"])
-                        for key, slot_value in child_slots.items():
-                            if key not in slots:
-                                slots[key] = []
-                            slots[key] += slot_value
                         new_hypotheses.append(
-                            {"unmatched": unmatched, "slots": slots}
+                            (consumed | bit, concat(slots, child_slots))
                         )
 
             # If this child is optional, we consider the case where
             # we don't actually match this child.
             if template_child.optional:
                 new_hypotheses += hypotheses
+            if profile is not None:
+                profile.hypotheses += len(new_hypotheses)
+                profile.peak = max(profile.peak, len(new_hypotheses))
 
             # If we no longer have any more valid hypotheses, we have failed.
-            hypotheses = new_hypotheses
+            hypotheses = self.__bound(new_hypotheses, context)
             if not hypotheses:
+                memo[key] = False
                 return False
 
         # Return the feasible slot values.
-        return [x["slots"] for x in hypotheses]
+        result = [slots for _, slots in hypotheses]
+        if context.dedupe and len(result) > 1:
+            seen = set()
+            unique = []
+            for slots in result:
+                frozen = freeze(materialize(slots))
+                if frozen not in seen:
+                    seen.add(frozen)
+                    unique.append(slots)
+            result = unique
+        if context.first_only:
+            result = result[:1]
+        memo[key] = result
+        return result
+
+    def __bound(self, hypotheses, context):
+        """
+        Apply the context's search bounds to a list of hypotheses.
+        Duplicates are dropped keeping the first occurrence, which
+        leaves the first occurrence of every final assignment
+        unchanged. With first_only, hypotheses consuming the same
+        children have the same futures, so only the first is kept.
+        """
+        if len(hypotheses) > 1 and (context.first_only or context.dedupe):
+            seen = set()
+            unique = []
+            for consumed, slots in hypotheses:
+                if context.first_only:
+                    frozen = consumed
+                else:
+                    frozen = (consumed, freeze(materialize(slots)))
+                if frozen not in seen:
+                    seen.add(frozen)
+                    unique.append((consumed, slots))
+            hypotheses = unique
+        if context.max_hypotheses is not None:
+            hypotheses = hypotheses[: context.max_hypotheses]
+        return hypotheses
@@ -0,0 +1,62 @@
+"""
+Doduo/Doduo.wsgi
+
+Production serving of the Flask API with Gunicorn.
+
+Gunicorn runs a single process of threaded (gthread) workers: its main
+thread only accepts connections and keeps them alive, while request
+threads hand parsing and matching to the server's MatcherPool. Slow
+requests therefore never block the accept loop, and CPU-bound matching
+scales with MATCH_PROCESSES rather than with Gunicorn workers.
+"""
+
+from gunicorn.app.base import BaseApplication
+
+
+class DoduoApplication(BaseApplication):
+    """
+    Gunicorn application serving Doduo.server.app.
+    """
+
+    def __init__(self, options):
+        """
+        Args:
+            options (dict): Gunicorn settings, e.g. {"threads": 8}.
+        """
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Importing the server loads the config and warms up the
+        # models, before the worker starts accepting connections.
+        from Doduo.server import app
+
+        return app
+
+
+def serve(host, port, threads, keepalive, timeout):
+    """
+    Serve the Flask API with Gunicorn until interrupted.
+
+    Args:
+        host (str):      address to bind to.
+        port (int):      port to bind to.
+        threads (int):   number of request threads.
+        keepalive (int): seconds to keep idle connections open.
+        timeout (int):   seconds a request may take before its worker
+                         is restarted.
+    """
+    DoduoApplication(
+        {
+            "bind": "{}:{}".format(host, port),
+            "workers": 1,
+            "worker_class": "gthread",
+            "threads": threads,
+            "keepalive": keepalive,
+            "timeout": timeout,
+        }
+    ).run()
@@ -0,0 +1,9 @@
+"""
+benchmarks
+
+Benchmarks of Doduo's parse and match hot paths, run offline against
+stand-in Spacy and embedding fixtures (see benchmarks.fixtures).
+
+Run the suite and compare it against the stored baseline by calling:
+    `python3.6 -m benchmarks [--quick] [--only matcher_match]`
+"""
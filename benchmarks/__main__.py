@@ -0,0 +1,102 @@
+"""
+benchmarks/__main__.py
+
+Run the benchmark suite, report its results and compare them against
+the stored baseline, exiting with status 1 on regressions.
+
+    `python3.6 -m benchmarks`:                  run and compare.
+    `python3.6 -m benchmarks --save-baseline`:  store the results as
+                                                the new baseline.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+
+from benchmarks.suite import run, compare
+
+
+BASELINE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baseline.json"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmarks")
+    parser.add_argument(
+        "--quick", action="store_true", help="smaller corpora, one round"
+    )
+    parser.add_argument(
+        "--only", default=None, help="run the benchmarks matching this"
+    )
+    parser.add_argument("--output", default=None, help="write results JSON")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="relative slowdown or growth allowed",
+    )
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "quick": args.quick,
+        "benchmarks": run(quick=args.quick, only=args.only),
+    }
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+            # Keep the other benchmarks of a baseline of the same mode.
+            if baseline.get("quick") == args.quick:
+                baseline["benchmarks"].update(report["benchmarks"])
+                report["benchmarks"] = baseline["benchmarks"]
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("Saved baseline to {}".format(args.baseline))
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at {}, skipping comparison".format(args.baseline))
+        return
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    if baseline.get("quick") != args.quick:
+        print(
+            "The baseline was run with quick={}, skipping comparison".format(
+                baseline.get("quick")
+            )
+        )
+        return
+    regressions = compare(
+        report["benchmarks"], baseline["benchmarks"], args.tolerance
+    )
+    for name, field, old, new in regressions:
+        print(
+            "REGRESSION {} {}: {:.4g} -> {:.4g}".format(name, field, old, new)
+        )
+    if regressions:
+        sys.exit(1)
+    print(
+        "No regressions against {} (tolerance {:.0%})".format(
+            args.baseline, args.tolerance
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+benchmarks/fixtures.py
+
+Offline stand-ins for the Spacy pipeline and the Numberbatch store,
+and the corpora and template sets the benchmarks run over. Parses
+are recorded (see benchmarks/corpus/) or synthesized, and built into
+real Spacy docs without any statistical model, so the benchmarks
+exercise Doduo's own parse, index and match code on any machine.
+"""
+
+import json
+import os
+import random
+
+import numpy as np
+import yaml
+from spacy.attrs import POS, HEAD, DEP
+from spacy.tokens import Doc, Span
+from spacy.vocab import Vocab
+
+import Doduo
+from Doduo.embeddings import EmbeddingStore
+from Doduo.matcher import Matcher
+from Doduo.query import parse_cache
+from Doduo.soft_match import clear_caches, normalize_word
+
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(BENCHMARKS_DIR, "corpus")
+CONFIGS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), "configs")
+
+# Vocabulary of the synthetic corpus and templates. Preference verbs
+# seed the soft match patterns, and form one embedding cluster with
+# the other soft match seeds of configs/beer.yml.
+PREFERENCE_VERBS = ["love", "hate", "like", "enjoy", "drink", "prefer"]
+PREFERENCE_CLUSTER = PREFERENCE_VERBS + ["disgusting"]
+VERBS = PREFERENCE_VERBS + [
+    "want",
+    "need",
+    "order",
+    "buy",
+    "find",
+    "recommend",
+    "have",
+    "sell",
+    "ship",
+    "return",
+    "taste",
+    "try",
+    "pour",
+    "brew",
+    "serve",
+    "stock",
+    "pack",
+    "rate",
+    "review",
+    "compare",
+]
+NOUNS = [
+    "ale",
+    "stout",
+    "porter",
+    "lager",
+    "pilsner",
+    "cider",
+    "bottle",
+    "can",
+    "keg",
+    "glass",
+    "pint",
+    "case",
+    "flavor",
+    "color",
+    "price",
+    "label",
+    "hop",
+    "malt",
+    "yeast",
+    "barrel",
+    "brewery",
+    "order",
+    "gift",
+    "sample",
+]
+ADJECTIVES = [
+    "old",
+    "dark",
+    "pale",
+    "sweet",
+    "bitter",
+    "cold",
+    "local",
+    "cheap",
+    "fresh",
+    "strong",
+    "light",
+    "smoky",
+]
+PRONOUNS = ["i", "you", "we", "they"]
+DETERMINERS = ["the", "a", "any", "your", "some"]
+
+
+class StandInNLP:
+    """
+    Stand-in for a loaded Spacy pipeline. Texts with a recorded parse
+    are built into docs with its annotations; any other text is
+    tokenized on whitespace and attached to its first token.
+    """
+
+    pipe_names = ["tagger", "parser", "ner"]
+
+    def __init__(self, parses=()):
+        """
+        Args:
+            parses (iterable): (text, tokens) pairs, where tokens is a
+                               list of (word, pos, head index, dep, ent)
+                               tuples covering the whole text.
+        """
+        self.vocab = Vocab()
+        self.parses = {}
+        self.add(parses)
+
+    def add(self, parses):
+        """ Record more (text, tokens) parses. """
+        for text, tokens in parses:
+            self.parses[text] = tokens
+
+    def __call__(self, text, disable=()):
+        tokens = self.parses.get(text)
+        if tokens is None:
+            tokens = [
+                (word, "X", 0, "ROOT" if i == 0 else "dep", "")
+                for i, word in enumerate(text.split())
+            ]
+        return self.make_doc(text, tokens)
+
+    def pipe(self, texts, batch_size=None, n_process=1, disable=()):
+        for text in texts:
+            yield self(text, disable)
+
+    def make_doc(self, text, tokens):
+        """
+        Build a Spacy doc of a parse.
+
+        Args:
+            text (str):    text of the doc.
+            tokens (list): (word, pos, head index, dep, ent) tuples.
+        Returns:
+            Spacy doc with the POS tags, dependencies and entities set.
+        """
+        words = [token[0] for token in tokens]
+        spaces = []
+        end = 0
+        for word in words:
+            end = text.index(word, end) + len(word)
+            spaces.append(text[end : end + 1] == " ")
+        doc = Doc(self.vocab, words=words, spaces=spaces)
+
+        strings = self.vocab.strings
+        annotations = np.array(
+            [
+                [strings[pos], head - i, strings.add(dep)]
+                for i, (_, pos, head, dep, _) in enumerate(tokens)
+            ],
+            dtype="int64",
+        )
+        doc.from_array([POS, HEAD, DEP], annotations.view("uint64"))
+
+        ents = []
+        for i, (_, _, _, _, ent) in enumerate(tokens):
+            if not ent:
+                continue
+            if ents and ents[-1][1] == i and ents[-1][2] == ent:
+                ents[-1][1] = i + 1
+            else:
+                ents.append([i, i + 1, ent])
+        doc.ents = [
+            Span(doc, start, end, label=ent) for start, end, ent in ents
+        ]
+        return doc
+
+
+def stand_in_store(words, clusters=(PREFERENCE_CLUSTER,), dim=32, seed=0):
+    """
+    Build an in-memory EmbeddingStore over a vocabulary. Words of a
+    cluster lie close to a shared center, other words are random.
+
+    Args:
+        words (iterable): vocabulary.
+        clusters (list):  lists of words embedded close together.
+        dim (int):        dimensionality of the vectors.
+        seed (int):       random seed.
+    Returns:
+        EmbeddingStore of the normalized words.
+    """
+    rng = np.random.RandomState(seed)
+    vectors = {}
+    for cluster in clusters:
+        center = rng.standard_normal(dim) * 3
+        for word in cluster:
+            vectors[normalize_word(word)] = center + rng.standard_normal(dim)
+    for word in sorted({normalize_word(w) for w in words} - {""}):
+        if word not in vectors:
+            vectors[word] = rng.standard_normal(dim)
+
+    vocab = sorted(vectors)
+    matrix = np.array([vectors[word] for word in vocab], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return EmbeddingStore(
+        matrix, np.array([w.encode("utf-8") for w in vocab], dtype=np.bytes_)
+    )
+
+
+def install(nlp, store):
+    """
+    Make Doduo use the stand-in models, dropping every cache built
+    with the previous ones.
+
+    Args:
+        nlp (StandInNLP):       stand-in Spacy pipeline.
+        store (EmbeddingStore): stand-in word embedding store.
+    """
+    Doduo._models["nlp"] = nlp
+    Doduo._models["word_model"] = store
+    parse_cache.clear()
+    clear_caches()
+
+
+def load_recorded(name):
+    """
+    Load a recorded corpus of benchmarks/corpus/, one JSON object per
+    line with the "query" and its recorded parse "tokens".
+
+    Args:
+        name (str): corpus file name.
+    Returns:
+        List of (text, tokens) pairs.
+    """
+    corpus = []
+    with open(os.path.join(CORPUS_DIR, name), "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                corpus.append((record["query"], record["tokens"]))
+    return corpus
+
+
+def config_matcher(config_file):
+    """
+    Build a Matcher of a config of the repository's configs/.
+
+    Args:
+        config_file (str): config file name.
+    Returns:
+        Matcher of the config's templates.
+    """
+    with open(os.path.join(CONFIGS_DIR, config_file), "r") as f:
+        config = yaml.safe_load(f)
+    return blueprint_matcher(
+        {
+            template_id: template["patterns"]
+            for template_id, template in config.items()
+        }
+    )
+
+
+def blueprint_matcher(blueprints):
+    """
+    Build a Matcher of template blueprints.
+
+    Args:
+        blueprints (dict): map of template ids to lists of pattern
+                           blueprints, as in a config.
+    Returns:
+        Matcher of the templates.
+    """
+    matcher = Matcher()
+    matcher.templates = {
+        template_id: [matcher.build_template(bp) for bp in patterns]
+        for template_id, patterns in blueprints.items()
+    }
+    return matcher
+
+
+def synthetic_corpus(n, seed=0):
+    """
+    Generate parsed queries of the synthetic vocabulary, shaped like
+    "do you have any dark ales?" or "we love the old porter".
+
+    Args:
+        n (int):    number of queries.
+        seed (int): random seed.
+    Returns:
+        List of (text, tokens) pairs.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        tokens = []
+        question = rng.random() < 0.5
+        if question:
+            tokens.append(["do", "VERB", None, "aux", ""])
+        tokens.append([rng.choice(PRONOUNS), "PRON", None, "nsubj", ""])
+        root = len(tokens)
+        tokens.append([rng.choice(VERBS), "VERB", root, "ROOT", ""])
+        noun = root + 1
+        if rng.random() < 0.7:
+            tokens.append([rng.choice(DETERMINERS), "DET", None, "det", ""])
+            noun += 1
+        if rng.random() < 0.5:
+            tokens.append([rng.choice(ADJECTIVES), "ADJ", None, "amod", ""])
+            noun += 1
+        tokens.append([rng.choice(NOUNS), "NOUN", root, "dobj", ""])
+        tokens.append(["?" if question else ".", "PUNCT", root, "punct", ""])
+        for token in tokens:
+            if token[2] is None:
+                token[2] = root if token[3] in ("aux", "nsubj") else noun
+        words = [token[0] for token in tokens]
+        text = " ".join(words[:-1]) + words[-1]
+        corpus.append((text, [tuple(token) for token in tokens]))
+    return corpus
+
+
+def synthetic_blueprints(n_patterns, soft_ratio=0.1, seed=0):
+    """
+    Generate template blueprints over the synthetic vocabulary, two
+    patterns per template.
+
+    Args:
+        n_patterns (int):   number of patterns.
+        soft_ratio (float): fraction of the patterns whose root is a
+                            soft match of the preference verbs.
+        seed (int):         random seed.
+    Returns:
+        Map of template ids to lists of pattern blueprints.
+    """
+    rng = random.Random(seed)
+    blueprints = {}
+    for k in range(n_patterns):
+        obj = {
+            "slot_name": "product",
+            "rels": ["dobj"],
+            "pos_match": ["noun"],
+            "slot_is_full_phrase": True,
+            "children": [
+                {
+                    "slot_name": "quality",
+                    "rels": ["amod"],
+                    "optional": True,
+                }
+            ],
+        }
+        if rng.random() < 0.5:
+            obj["exact_match"] = rng.sample(NOUNS, rng.randint(1, 4))
+        pattern = {
+            "slot_name": "action",
+            "children": [
+                {"rels": ["nsubj"], "pos_match": ["pron"], "optional": True},
+                obj,
+            ],
+        }
+        if rng.random() < soft_ratio:
+            pattern["pos_match"] = ["verb"]
+            pattern["soft_match"] = rng.sample(PREFERENCE_VERBS, 3)
+        else:
+            pattern["exact_match"] = rng.sample(VERBS, rng.randint(1, 3))
+        blueprints.setdefault("intent_{:04d}".format(k // 2), []).append(
+            pattern
+        )
+    return blueprints
+
+
+def vocabulary(corpus=()):
+    """
+    Args:
+        corpus (list): (text, tokens) pairs whose words to include.
+    Returns:
+        Set of the synthetic vocabulary and the corpus' words.
+    """
+    words = set(VERBS + NOUNS + ADJECTIVES + PRONOUNS + DETERMINERS)
+    words.update(token[0] for _, tokens in corpus for token in tokens)
+    return words
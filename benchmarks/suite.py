@@ -0,0 +1,349 @@
+"""
+benchmarks/suite.py
+
+The benchmarks of the parse and match hot paths, their measurement
+and the comparison of their results against a stored baseline.
+
+Every benchmark times single calls of one hot path over a corpus
+and reports the p50 and p99 call latency, the calls per second and
+the peak memory allocated by Python while running the calls (and
+while setting the benchmark up). Caches a call would hit on a real
+repeated query are cleared between calls, outside of the timings.
+"""
+
+import gc
+import math
+import tracemalloc
+from time import perf_counter
+
+from Doduo import get_nlp, get_word_model
+from Doduo.query import parse_query, parse_doc, parse_cache, Query, Sentence
+from Doduo.soft_match import build_soft_model, soft_models, verdict_cache
+from Doduo.synthetic import SyntheticGenerator
+
+from benchmarks.fixtures import (
+    StandInNLP,
+    stand_in_store,
+    install,
+    load_recorded,
+    config_matcher,
+    blueprint_matcher,
+    synthetic_corpus,
+    synthetic_blueprints,
+    vocabulary,
+    PREFERENCE_VERBS,
+    NOUNS,
+    VERBS,
+)
+
+
+# Pattern counts of the scaled Matcher benchmarks.
+PATTERN_COUNTS = (10, 100, 1000)
+
+# Pattern and tree shapes of the scaled Template.match benchmarks, see
+# Doduo.synthetic.SyntheticGenerator, each varying one dimension.
+SHAPES = {
+    "base": {},
+    "depth=5": {"depth": 5},
+    "branching=4": {"branching": 4},
+    "optional=0.6": {"optional_ratio": 0.6},
+    "soft=0.5": {"soft_ratio": 0.5},
+    "vocab=50": {"vocab_size": 50},
+}
+
+# Result fields compared against the baseline: whether larger values
+# are better, and the absolute slack allowed on top of the tolerance.
+COMPARED = {
+    "p50_ms": (False, 0.005),
+    "p99_ms": (False, 0.01),
+    "qps": (True, 0),
+    "peak_kb": (False, 16),
+    "setup_kb": (False, 64),
+}
+
+
+def percentile(samples, q):
+    """
+    Args:
+        samples (list): sorted samples.
+        q (float):      percentile, between 0 and 100.
+    Returns:
+        Nearest-rank percentile of the samples.
+    """
+    rank = max(int(math.ceil(q / 100 * len(samples))) - 1, 0)
+    return samples[min(rank, len(samples) - 1)]
+
+
+def measure(call, inputs, reset=None, rounds=3, memory_inputs=200):
+    """
+    Time single calls over inputs, and trace their memory.
+
+    Args:
+        call (callable):     hot path called on each input.
+        inputs (list):       inputs of the calls.
+        reset (callable):    called before each call, outside of the
+                             timings, e.g. to clear caches, or None.
+        rounds (int):        number of passes over the inputs.
+        memory_inputs (int): number of inputs traced for peak memory.
+    Returns:
+        Dictionary of the number of calls, the p50 and p99 latencies in
+        milliseconds, the calls per second and the peak memory in KB.
+    """
+    # Warm up on the first inputs, e.g. to intern labels.
+    for x in inputs[:10]:
+        if reset is not None:
+            reset()
+        call(x)
+
+    latencies = []
+    gc.collect()
+    for _ in range(rounds):
+        for x in inputs:
+            if reset is not None:
+                reset()
+            start = perf_counter()
+            call(x)
+            latencies.append(perf_counter() - start)
+    latencies.sort()
+
+    tracemalloc.start()
+    try:
+        for x in inputs[:memory_inputs]:
+            if reset is not None:
+                reset()
+            call(x)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "calls": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1e3,
+        "p99_ms": percentile(latencies, 99) * 1e3,
+        "qps": len(latencies) / sum(latencies),
+        "peak_kb": peak / 1024,
+    }
+
+
+def traced_setup(setup):
+    """
+    Run a benchmark's setup, tracing its memory.
+
+    Args:
+        setup (callable): returns the benchmark's state.
+    Returns:
+        (state, peak memory in KB) tuple.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        state = setup()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return state, peak / 1024
+
+
+def clear_parses():
+    """ Drop the cached parses, so every call parses its query. """
+    parse_cache.clear()
+
+
+def bench_parse_query(corpus, rounds):
+    """ parse_query: stand-in Spacy doc, then Sentence arrays. """
+    queries = [text for text, _ in corpus]
+    return measure(parse_query, queries, clear_parses, rounds)
+
+
+def bench_template_match(corpus, rounds, n_patterns=100):
+    """ Template.match of every pattern on every sentence root. """
+
+    def setup():
+        matcher = blueprint_matcher(synthetic_blueprints(n_patterns))
+        patterns = [t for ts in matcher.templates.values() for t in ts]
+        roots = [
+            Query(sentence, sentence.root)
+            for text, _ in corpus
+            for sentence in parse_doc(get_nlp()(text))
+        ]
+        return patterns, roots
+
+    (patterns, roots), setup_kb = traced_setup(setup)
+    result = measure(
+        lambda root: [t.match(root) for t in patterns], roots, None, rounds
+    )
+    result["setup_kb"] = setup_kb
+    return result
+
+
+def bench_template_shape(shape, n_trees, rounds, n_patterns=50):
+    """ Template.match of synthetic patterns on synthetic trees. """
+    generator = SyntheticGenerator(seed=1, **shape)
+    config = generator.templates(n_patterns, 1)
+    roots = [
+        Query(sentence, sentence.root)
+        for sentence in (
+            Sentence.from_tokens(tokens)
+            for tokens in generator.trees(config, n_trees)
+        )
+    ]
+    # Soft match patterns sample the generator's own vocabulary.
+    nlp, store = get_nlp(), get_word_model()
+    install(nlp, generator.store())
+    try:
+        matcher, setup_kb = traced_setup(
+            lambda: blueprint_matcher(
+                {k: t["patterns"] for k, t in config.items()}
+            )
+        )
+        patterns = [t for ts in matcher.templates.values() for t in ts]
+        result = measure(
+            lambda root: [t.match(root) for t in patterns], roots, None, rounds
+        )
+    finally:
+        install(nlp, store)
+    result["setup_kb"] = setup_kb
+    return result
+
+
+def bench_build_soft_model(rounds):
+    """ build_soft_model of seed lists of the preference cluster. """
+    seeds = [
+        [PREFERENCE_VERBS[(i + j) % len(PREFERENCE_VERBS)] for j in range(3)]
+        for i in range(len(PREFERENCE_VERBS))
+    ]
+    return measure(build_soft_model, seeds, soft_models.clear, rounds * 20)
+
+
+def bench_soft_belongs(rounds):
+    """ SoftModel membership verdicts of single words. """
+    model = build_soft_model(PREFERENCE_VERBS[:3])
+    words = VERBS + NOUNS
+    return measure(model, words, verdict_cache.clear, rounds * 5)
+
+
+def bench_matcher_match(matcher_setup, corpus, rounds):
+    """ End-to-end Matcher.match: parse, index lookup and matching. """
+    matcher, setup_kb = traced_setup(matcher_setup)
+    matcher.get_index()
+    queries = [text for text, _ in corpus]
+    result = measure(
+        lambda query: list(matcher.match(query, None)),
+        queries,
+        clear_parses,
+        rounds,
+    )
+    result["setup_kb"] = setup_kb
+    return result
+
+
+def run(quick=False, only=None, log=print):
+    """
+    Run the benchmarks with the stand-in models installed.
+
+    Args:
+        quick (bool):  run over smaller corpora, fewer rounds.
+        only (str):    only run the benchmarks whose name contains it.
+        log (callable): called with a progress line per benchmark.
+    Returns:
+        Dictionary of benchmark names to results, see measure.
+    """
+    rounds = 1 if quick else 3
+    recorded = load_recorded("beer.jsonl")
+    synthetic = synthetic_corpus(100 if quick else 500)
+    install(
+        StandInNLP(recorded + synthetic),
+        stand_in_store(vocabulary(recorded + synthetic)),
+    )
+
+    benchmarks = [
+        ("parse_query/recorded", lambda: bench_parse_query(recorded, rounds)),
+        (
+            "parse_query/synthetic",
+            lambda: bench_parse_query(synthetic, rounds),
+        ),
+        (
+            "template_match/synthetic",
+            lambda: bench_template_match(synthetic[:100], rounds),
+        ),
+        ("build_soft_model", lambda: bench_build_soft_model(rounds)),
+        ("soft_model_belongs", lambda: bench_soft_belongs(rounds)),
+        (
+            "matcher_match/beer/recorded",
+            lambda: bench_matcher_match(
+                lambda: config_matcher("beer.yml"), recorded * 10, rounds
+            ),
+        ),
+    ]
+    for name, shape in SHAPES.items():
+        benchmarks.append(
+            (
+                "template_match/shape/" + name,
+                lambda shape=shape: bench_template_shape(
+                    shape, 100 if quick else 300, rounds
+                ),
+            )
+        )
+    for n in PATTERN_COUNTS:
+        benchmarks.append(
+            (
+                "matcher_match/{}/synthetic".format(n),
+                lambda n=n: bench_matcher_match(
+                    lambda: blueprint_matcher(synthetic_blueprints(n)),
+                    synthetic,
+                    rounds,
+                ),
+            )
+        )
+
+    results = {}
+    for name, bench in benchmarks:
+        if only is not None and only not in name:
+            continue
+        results[name] = bench()
+        log(format_result(name, results[name]))
+    return results
+
+
+def format_result(name, result):
+    """ Format a benchmark result as a line. """
+    line = (
+        "{:34} p50 {:8.3f} ms  p99 {:8.3f} ms  {:10.0f} qps  {:8.0f} KB"
+    ).format(
+        name,
+        result["p50_ms"],
+        result["p99_ms"],
+        result["qps"],
+        result["peak_kb"],
+    )
+    if "setup_kb" in result:
+        line += "  (setup {:.0f} KB)".format(result["setup_kb"])
+    return line
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results against a baseline.
+
+    Args:
+        results (dict):    benchmark results, see run.
+        baseline (dict):   baseline benchmark results.
+        tolerance (float): relative change allowed, e.g. 0.25.
+    Returns:
+        List of (benchmark, field, baseline value, value) regressions.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        for field, (higher_is_better, slack) in COMPARED.items():
+            if field not in result or field not in baseline[name]:
+                continue
+            old, new = baseline[name][field], result[field]
+            if higher_is_better:
+                regressed = new < old / (1 + tolerance) - slack
+            else:
+                regressed = new > old * (1 + tolerance) + slack
+            if regressed:
+                regressions.append((name, field, old, new))
+    return regressions
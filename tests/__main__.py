@@ -3,6 +3,22 @@ from .test_matcher import TestMatcher
 from .test_query import TestQuery
 from .test_beer import TestBeer
 from .test_template import TestTemplate
+from .test_embeddings import TestEmbeddings
+from .test_soft_match import TestSoftMatch
+from .test_cache import TestCache
+from .test_compiled import TestCompiled
+from .test_index import TestIndex
+from .test_stream import TestStream
+from .test_pool import TestPool
+from .test_reload import TestReload
+from .test_artifact import TestArtifact
+from .test_subset import TestSubset
+from .test_quantize import TestQuantize
+from .test_metrics import TestMetrics
+from .test_profiler import TestProfiler
+from .test_benchmarks import TestBenchmarks
+from .test_synthetic import TestSynthetic
+from .test_server import TestServer
 
 
 if __name__ == "__main__":
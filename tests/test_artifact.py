@@ -0,0 +1,136 @@
+"""
+tests/test_artifact.py
+
+Test Doduo's compiled Matcher artifacts. Validate that loaded
+Matchers match like the compiled ones and that stale or invalid
+artifacts are refused.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import Doduo.artifact
+from Doduo.matcher import Matcher
+from Doduo.config import ROOT_DIR
+from Doduo.embeddings import VECTORS_SUFFIX, VOCAB_SUFFIX
+from Doduo import ConfigException
+
+
+CONFIG_FILE = "artifact_tests.yml"
+
+CONFIG = """
+speak_template:
+  patterns:
+    - exact_match: ["speak"]
+      children:
+        - slot_name: "who"
+          rels: ["nsubj"]
+          pos_match: ["pron"]
+        - slot_name: "lang"
+          ner_match: ["language"]
+          optional: True
+like_template:
+  patterns:
+    - exact_match: ["like"]
+"""
+
+QUERIES = [
+    "Do you speak English or do you speak Chinese?",
+    "I like chocolate",
+    "Hello my friend",
+]
+
+
+class TestArtifact(unittest.TestCase):
+    def setUp(self):
+        self.config_path = ROOT_DIR + "configs/" + CONFIG_FILE
+        with open(self.config_path, "w") as f:
+            f.write(CONFIG)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "artifact.doduo")
+
+    def tearDown(self):
+        os.remove(self.config_path)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        compiled = Matcher(CONFIG_FILE)
+        compiled.save(self.path)
+        loaded = Matcher.load(self.path, CONFIG_FILE)
+        self.assertEqual(loaded.config_file, CONFIG_FILE)
+        self.assertEqual(loaded.options, compiled.options)
+        self.assertEqual(
+            loaded.templates["speak_template"][0].node_id,
+            compiled.templates["speak_template"][0].node_id,
+        )
+        self.assertEqual(
+            loaded.templates["speak_template"][0].compile().describe(),
+            compiled.templates["speak_template"][0].compile().describe(),
+        )
+        self.assertTrue(loaded.get_index() is loaded.get_index())
+        self.assertEqual(loaded.disabled_pipes(), compiled.disabled_pipes())
+        for query in QUERIES:
+            self.assertEqual(
+                list(loaded.match(query, None)),
+                list(compiled.match(query, None)),
+            )
+
+    def test_refused(self):
+        Matcher(CONFIG_FILE).save(self.path)
+        with open(self.config_path, "a") as f:
+            f.write("\n# edited\n")
+        with self.assertRaises(ConfigException):
+            Matcher.load(self.path, CONFIG_FILE)
+        Matcher.load(self.path)
+
+        with open(self.path, "wb") as f:
+            f.write(b"not an artifact")
+        with self.assertRaises(ConfigException):
+            Matcher.load(self.path)
+        with self.assertRaises(ConfigException):
+            Matcher.load(os.path.join(self.tmp_dir, "missing.doduo"))
+
+    def test_store_changed(self):
+        os.makedirs(ROOT_DIR + "dumps", exist_ok=True)
+        store_path = ROOT_DIR + "dumps/artifact_tests"
+        vectors = np.eye(4, 3, dtype=np.float32)
+        vocab = np.array([b"ale", b"beer", b"cider", b"stout"])
+        store_file = Doduo.artifact.EMB_STORE_FILE
+        Doduo.artifact.EMB_STORE_FILE = "artifact_tests"
+        try:
+            np.save(store_path + VOCAB_SUFFIX, vocab)
+            np.save(store_path + VECTORS_SUFFIX, vectors)
+            Matcher(CONFIG_FILE).save(self.path)
+            Matcher.load(self.path, CONFIG_FILE)
+
+            # Quantized in place.
+            np.save(store_path + VECTORS_SUFFIX, vectors.astype(np.float16))
+            with self.assertRaises(ConfigException):
+                Matcher.load(self.path, CONFIG_FILE)
+            # Reconverted from other vectors, and cut to other words,
+            # with the same dtype and shape.
+            np.save(store_path + VECTORS_SUFFIX, vectors[::-1])
+            with self.assertRaises(ConfigException):
+                Matcher.load(self.path, CONFIG_FILE)
+            np.save(store_path + VECTORS_SUFFIX, vectors)
+            np.save(store_path + VOCAB_SUFFIX, vocab[::-1])
+            with self.assertRaises(ConfigException):
+                Matcher.load(self.path, CONFIG_FILE)
+            np.save(store_path + VOCAB_SUFFIX, vocab)
+            Matcher.load(self.path, CONFIG_FILE)
+
+            Doduo.artifact.EMB_STORE_FILE = "other_store"
+            with self.assertRaises(ConfigException):
+                Matcher.load(self.path, CONFIG_FILE)
+        finally:
+            Doduo.artifact.EMB_STORE_FILE = store_file
+            os.remove(store_path + VOCAB_SUFFIX)
+            os.remove(store_path + VECTORS_SUFFIX)
+
+
+if __name__ == "__main__":
+    unittest.main()
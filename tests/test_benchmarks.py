@@ -0,0 +1,84 @@
+"""
+tests/test_benchmarks.py
+
+Test the benchmark suite's fixtures and measurements. Validate that
+stand-in parses build the recorded Sentences, and that regressions
+against a baseline are caught.
+"""
+
+import unittest
+
+from Doduo.labels import label_name
+from Doduo.query import parse_doc
+
+from benchmarks.fixtures import (
+    StandInNLP,
+    stand_in_store,
+    load_recorded,
+    synthetic_corpus,
+    synthetic_blueprints,
+)
+from benchmarks.suite import percentile, measure, compare
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_stand_in_nlp(self):
+        recorded = load_recorded("beer.jsonl")
+        nlp = StandInNLP(recorded)
+        text, tokens = recorded[-1]
+        sentences = parse_doc(nlp(text))
+        self.assertEqual(len(sentences), 1)
+        sentence = sentences[0]
+        self.assertEqual(sentence.text, text)
+        self.assertEqual(list(sentence.words), [t[0] for t in tokens])
+        self.assertEqual(
+            [label_name(pos) for pos in sentence.pos],
+            [t[1].lower() for t in tokens],
+        )
+        self.assertEqual(sentence.root, 2)
+
+        # Multiple sentences and entities.
+        text = "Which ales are in stock? I enjoy dark stouts."
+        sentences = parse_doc(nlp(text))
+        self.assertEqual(len(sentences), 2)
+        self.assertEqual(sentences[1].words[sentences[1].root], "enjoy")
+        doc = nlp("We like the pale lager from New York.")
+        self.assertEqual([e.text for e in doc.ents], ["New York"])
+
+        # Unknown texts still parse.
+        self.assertEqual(len(parse_doc(nlp("no such parse"))), 1)
+
+    def test_synthetic(self):
+        corpus = synthetic_corpus(20, seed=1)
+        self.assertEqual(corpus, synthetic_corpus(20, seed=1))
+        nlp = StandInNLP(corpus)
+        for text, tokens in corpus:
+            (sentence,) = parse_doc(nlp(text))
+            self.assertEqual(len(sentence), len(tokens))
+        blueprints = synthetic_blueprints(10)
+        self.assertEqual(sum(len(p) for p in blueprints.values()), 10)
+        store = stand_in_store(["ale", "Stout"])
+        self.assertTrue("stout" in store)
+        self.assertTrue("love" in store)
+
+    def test_measure(self):
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(percentile(list(range(100)), 99), 98)
+        result = measure(lambda x: x * 2, list(range(50)), rounds=2)
+        self.assertEqual(result["calls"], 100)
+        self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        self.assertGreater(result["qps"], 0)
+
+    def test_compare(self):
+        baseline = {"a": {"p50_ms": 1.0, "qps": 1000, "peak_kb": 100}}
+        same = {"a": {"p50_ms": 1.1, "qps": 900, "peak_kb": 110}}
+        self.assertEqual(compare(same, baseline, 0.25), [])
+        slow = {"a": {"p50_ms": 2.0, "qps": 500, "peak_kb": 100}, "b": {}}
+        self.assertEqual(
+            compare(slow, baseline, 0.25),
+            [("a", "p50_ms", 1.0, 2.0), ("a", "qps", 1000, 500)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+tests/test_cache.py
+
+Test Doduo's LRUCache. Validate eviction order and statistics.
+"""
+
+import unittest
+
+from Doduo.cache import LRUCache, merge_stats
+
+
+class TestCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_stats(self):
+        cache = LRUCache(1)
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("b")
+        cache.put("b", 2)
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["hit_rate"], 0.5)
+        cache.clear()
+        self.assertEqual(cache.stats()["hits"], 0)
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a", "missing"), "missing")
+
+    def test_ttl(self):
+        now = [0.0]
+        cache = LRUCache(4, ttl=10, clock=lambda: now[0])
+        cache.put("a", 1)
+        now[0] = 5.0
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        now[0] = 12.0
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.get("b"), 2)
+        stats = cache.stats()
+        self.assertEqual(stats["expirations"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["size"], 1)
+
+    def test_merge_stats(self):
+        first, second = LRUCache(1), LRUCache(2)
+        first.put("a", 1)
+        first.get("a")
+        second.get("a")
+        merged = merge_stats([first.stats(), second.stats()])
+        self.assertEqual(merged["size"], 1)
+        self.assertEqual(merged["maxsize"], 3)
+        self.assertEqual(merged["hits"], 1)
+        self.assertEqual(merged["misses"], 1)
+        self.assertEqual(merged["hit_rate"], 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
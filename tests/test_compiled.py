@@ -0,0 +1,83 @@
+"""
+tests/test_compiled.py
+
+Test Doduo's compiled predicates and patterns. Validate that the
+integer-coded programs agree with the Template blueprints.
+"""
+
+import unittest
+
+from Doduo.compiled import Predicate, CompiledPattern
+from Doduo.query import parse_query
+from Doduo.template import Template
+
+
+class TestCompiled(unittest.TestCase):
+    def setUp(self):
+        self.sentence = parse_query("Do you speak English?")[0][0].sentence
+        self.index = dict(
+            (word, i) for i, word in enumerate(self.sentence.words)
+        )
+
+    def test_predicate(self):
+        speak = self.index["speak"]
+        english = self.index["English"]
+        self.assertTrue(Predicate().test(self.sentence, speak))
+        self.assertTrue(
+            Predicate(exact_match=["Speak"]).test(self.sentence, speak)
+        )
+        self.assertFalse(
+            Predicate(exact_match=["Speak"], case_sensitive=True).test(
+                self.sentence, speak
+            )
+        )
+        self.assertTrue(
+            Predicate(pos_match=["VERB"]).test(self.sentence, speak)
+        )
+        self.assertTrue(
+            Predicate(ner_match=["language"]).test(self.sentence, english)
+        )
+        self.assertTrue(
+            Predicate(ner_match=["propn"]).test(self.sentence, english)
+        )
+        self.assertFalse(
+            Predicate(ner_match=["language"]).test(self.sentence, speak)
+        )
+        self.assertFalse(
+            Predicate(rels=["nsubj"], pos_match=["propn"]).test(
+                self.sentence, english
+            )
+        )
+        self.assertTrue(
+            Predicate(rels=["dobj"], pos_match=["propn"]).test(
+                self.sentence, english
+            )
+        )
+
+    def test_compiled_pattern(self):
+        t = Template(
+            children=[
+                Template(exact_match=["you"]),
+                Template(slot_name="lang", ner_match=["LANGUAGE"]),
+            ],
+            pos_match=["verb"],
+        )
+        pattern = t.compile()
+        self.assertTrue(isinstance(pattern, CompiledPattern))
+        self.assertEqual(len(pattern), 3)
+        self.assertEqual(pattern.children, [[1, 2], [], []])
+        description = pattern.describe()
+        self.assertEqual(description[0]["pos_match"], ["verb"])
+        self.assertEqual(description[2]["ner_match"], ["language"])
+        self.assertEqual(description[2]["slot_name"], "lang")
+
+        speak = self.index["speak"]
+        self.assertTrue(pattern.test(self.sentence, speak))
+        self.assertFalse(pattern.test(self.sentence, speak, node=1))
+        self.assertEqual(
+            pattern.match(self.sentence, speak), [{"lang": ["English"]}]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
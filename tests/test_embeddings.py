@@ -0,0 +1,133 @@
+"""
+tests/test_embeddings.py
+
+Test Doduo's EmbeddingStore. Validate conversion of word2vec text
+dumps and lookups against the memory-mapped store, and subset
+stores falling back to the full store.
+"""
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from Doduo.embeddings import (
+    EmbeddingStore,
+    SubsetStore,
+    convert_word2vec,
+    quantize_store,
+    subset_store,
+)
+
+
+SAMPLE_DUMP = """4 3
+stout 3 0 4
+ale 0 2 0
+lager 1 1 1
+bad_row 1 1
+porter 0 0 5
+"""
+
+
+class TestEmbeddings(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp_dir, "sample.txt.gz")
+        self.dst = os.path.join(self.tmp_dir, "sample")
+        with gzip.open(self.src, "wt") as f:
+            f.write(SAMPLE_DUMP)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_convert(self):
+        self.assertEqual(convert_word2vec(self.src, self.dst), 4)
+        store = EmbeddingStore.open(self.dst)
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store.dim, 3)
+        self.assertTrue(isinstance(store.vectors, np.memmap))
+        self.assertFalse(os.path.exists(self.dst + ".tmp.npy"))
+
+    def test_lookup(self):
+        convert_word2vec(self.src, self.dst)
+        store = EmbeddingStore.open(self.dst)
+        self.assertTrue("stout" in store)
+        self.assertFalse("bad_row" in store)
+        self.assertFalse("pilsner" in store)
+        self.assertEqual(store.index("pilsner"), -1)
+        np.testing.assert_allclose(store["stout"], [0.6, 0, 0.8])
+        np.testing.assert_allclose(store["ale"], [0, 1, 0])
+        for word in ["stout", "ale", "lager", "porter"]:
+            self.assertAlmostEqual(np.linalg.norm(store[word]), 1, places=5)
+
+    def test_float16(self):
+        convert_word2vec(self.src, self.dst, dtype="float16")
+        store = EmbeddingStore.open(self.dst)
+        self.assertEqual(store.vectors.dtype, np.float16)
+        np.testing.assert_allclose(store["porter"], [0, 0, 1])
+        with self.assertRaises(ValueError):
+            convert_word2vec(self.src, self.dst, dtype="int4")
+
+    def test_int8(self):
+        convert_word2vec(self.src, self.dst, dtype="int8")
+        store = EmbeddingStore.open(self.dst)
+        self.assertEqual(store.dtype, "int8")
+        self.assertEqual(store.scales.shape, (4,))
+        np.testing.assert_allclose(store["stout"], [0.6, 0, 0.8], atol=0.01)
+        for word in ["stout", "ale", "lager", "porter"]:
+            self.assertEqual(store[word].dtype, np.float32)
+            self.assertAlmostEqual(np.linalg.norm(store[word]), 1, places=5)
+
+    def test_quantize_store(self):
+        convert_word2vec(self.src, self.dst)
+        full = EmbeddingStore.open(self.dst)
+        for dtype in ["int8", "float16"]:
+            dst = self.dst + "." + dtype
+            self.assertEqual(quantize_store(full, dst, dtype), 4)
+            store = EmbeddingStore.open(dst)
+            self.assertEqual(store.dtype, dtype)
+            self.assertEqual(list(store.vocab), list(full.vocab))
+            for word in ["stout", "ale", "lager", "porter"]:
+                np.testing.assert_allclose(store[word], full[word], atol=0.01)
+
+        # Subsets of scaled stores keep their scales.
+        quantized = EmbeddingStore.open(self.dst + ".int8")
+        sub = self.dst + ".subset"
+        subset_store(quantized, ["lager"], sub)
+        np.testing.assert_allclose(
+            EmbeddingStore.open(sub)["lager"], quantized["lager"]
+        )
+
+    def test_subset(self):
+        convert_word2vec(self.src, self.dst)
+        store = EmbeddingStore.open(self.dst)
+        sub = self.dst + ".subset"
+        self.assertEqual(subset_store(store, ["porter", "ale", "x"], sub), 2)
+        subset = SubsetStore(EmbeddingStore.open(sub), self.dst)
+        self.assertEqual(len(subset), 2)
+        self.assertEqual(list(subset.subset.vocab), [b"ale", b"porter"])
+        np.testing.assert_allclose(subset["porter"], [0, 0, 1])
+        # Only misses open the full store.
+        self.assertIsNone(subset._fallback)
+        np.testing.assert_allclose(subset["stout"], [0.6, 0, 0.8])
+        self.assertIsNotNone(subset.fallback())
+        self.assertFalse("pilsner" in subset)
+        with self.assertRaises(KeyError):
+            subset["pilsner"]
+
+    def test_subset_without_fallback(self):
+        convert_word2vec(self.src, self.dst)
+        sub = self.dst + ".subset"
+        subset_store(EmbeddingStore.open(self.dst), ["ale"], sub)
+        missing = os.path.join(self.tmp_dir, "missing")
+        subset = SubsetStore(EmbeddingStore.open(sub), missing)
+        self.assertTrue("ale" in subset)
+        self.assertIsNone(subset.get("stout"))
+        self.assertIsNone(subset.fallback())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+tests/test_index.py
+
+Test Doduo's PatternIndex. Validate that root-anchor lookups only
+narrow down, and never change, the Matcher's results.
+"""
+
+import unittest
+
+from Doduo.index import PatternIndex
+from Doduo.matcher import Matcher
+from Doduo.query import parse_query
+from Doduo.template import Template
+
+
+QUERY = "Do you speak English or do you speak Chinese?"
+
+
+def build_templates():
+    return {
+        "exact": [Template(exact_match=["speak", "talk"])],
+        "case": [Template(exact_match=["speak"], case_sensitive=True)],
+        "pos": [
+            Template(
+                pos_match=["verb"],
+                children=[Template(slot_name="lang", ner_match=["language"])],
+            )
+        ],
+        "ner": [Template(ner_match=["language"], slot_name="lang")],
+        "rels": [Template(rels=["nsubj"], slot_name="who")],
+        "any": [
+            Template(
+                children=[Template(exact_match=["you"])], slot_name="head"
+            ),
+            Template(exact_match=["chinese"], rels=["dobj"]),
+        ],
+    }
+
+
+class TestIndex(unittest.TestCase):
+    def test_candidates(self):
+        index = PatternIndex(build_templates())
+        sentence = parse_query(QUERY)[0][0].sentence
+        keys = dict(
+            (template_id, set(keys))
+            for template_id, keys in index.keys.items()
+        )
+        you = sentence.words.index("you")
+        candidates = index.candidates(sentence, you)
+        self.assertFalse(candidates & keys["exact"])
+        self.assertFalse(candidates & keys["case"])
+        self.assertTrue(candidates & keys["rels"])
+        self.assertTrue(keys["any"] & candidates)
+
+        english = sentence.words.index("English")
+        candidates = index.candidates(sentence, english)
+        self.assertTrue(candidates & keys["ner"])
+        self.assertFalse(candidates & keys["pos"])
+
+    def test_matches_unindexed(self):
+        M = Matcher()
+        M.templates = build_templates()
+        sentence = parse_query(QUERY)[0][0].sentence
+        results = next(M.match(QUERY, None))
+        for template_id, patterns in M.templates.items():
+            slots = []
+            for pattern in patterns:
+                for i in sentence.preorder:
+                    result = pattern.match_at(sentence, i)
+                    if result is not False:
+                        slots += result
+            self.assertTrue(slots)
+            self.assertEqual(results[template_id], slots[0])
+            self.assertEqual(
+                results["__alternatives__"].get(template_id, []), slots[1:]
+            )
+
+    def test_rebuilt_on_change(self):
+        M = Matcher()
+        M.templates["test_template"] = [Template(exact_match=["speak"])]
+        self.assertTrue("test_template" in next(M.match(QUERY, None)))
+        M.templates["test_template"] = [Template(exact_match=["hello"])]
+        self.assertFalse("test_template" in next(M.match(QUERY, None)))
+
+        # The index is only rebuilt when the templates change.
+        index = M.get_index()
+        version = M.version
+        next(M.match(QUERY, None))
+        self.assertTrue(M.get_index() is index)
+        self.assertEqual(M.version, version)
+        del M.templates["test_template"]
+        self.assertFalse(M.get_index() is index)
+        self.assertEqual(M.get_index().keys, {})
+        M.templates = {"test_template": [Template(exact_match=["speak"])]}
+        self.assertTrue("test_template" in next(M.match(QUERY, None)))
+        self.assertEqual(M.version, version + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,7 +8,7 @@ of template/pattern matching logic.
 import unittest
 
 from Doduo.matcher import Matcher
-from Doduo import ConfigException
+from Doduo import ConfigException, get_nlp
 
 
 class DummyTemplate:
@@ -58,6 +58,38 @@ class TestMatcher(unittest.TestCase):
             self.assertEqual(str(e), "Invalid config option provided.")
         self.assertTrue(failed)
 
+    def test_needs_word_model(self):
+        M = Matcher()
+        self.assertFalse(M.needs_word_model)
+        M.build_template(
+            {"exact_match": ["hello"], "children": [{"pos_match": ["noun"]}]}
+        )
+        self.assertFalse(M.needs_word_model)
+        M.build_template(
+            {"exact_match": ["hello"], "children": [{"soft_match": ["ale"]}]}
+        )
+        self.assertTrue(M.needs_word_model)
+        self.assertTrue(Matcher("beer.yml").needs_word_model)
+
+    def test_disabled_pipes(self):
+        pipes = set(get_nlp().pipe_names)
+        M = Matcher()
+        M.templates["hello"] = [M.build_template({"exact_match": ["hello"]})]
+        self.assertEqual(set(M.disabled_pipes()), {"tagger", "ner"} & pipes)
+        M.templates["noun"] = [
+            M.build_template(
+                {
+                    "exact_match": ["hello"],
+                    "children": [{"pos_match": ["noun"]}],
+                }
+            )
+        ]
+        self.assertEqual(set(M.disabled_pipes()), {"ner"} & pipes)
+        M.templates["lang"] = [M.build_template({"ner_match": ["language"]})]
+        self.assertEqual(M.disabled_pipes(), ())
+        M.templates = {"dummy": [DummyTemplate("hello")]}
+        self.assertEqual(M.disabled_pipes(), ())
+
     def test_match(self):
         M = Matcher()
 
@@ -113,6 +145,26 @@ class TestMatcher(unittest.TestCase):
             in next(M.match("I like chocolate", ["test_template"]))
         )
 
+    def test_results_cache(self):
+        M = Matcher(cache_size=8)
+        M.templates["test_template"] = [DummyTemplate("chocolate")]
+        first = list(M.match("I like chocolate", ["test_template"]))
+        second = list(M.match("I like chocolate", ["test_template"]))
+        self.assertEqual(first, second)
+        self.assertTrue(first[0] is second[0])
+        stats = M.cache_stats()
+        self.assertEqual(stats["match"]["hits"], 1)
+        self.assertEqual(stats["match"]["misses"], 1)
+        self.assertTrue("parse" in stats and "embed" in stats)
+
+        # Changing the templates invalidates cached results.
+        M.templates["test_template"] = [DummyTemplate("asdf")]
+        self.assertFalse(
+            "test_template"
+            in next(M.match("I like chocolate", ["test_template"]))
+        )
+        self.assertEqual(M.cache_stats()["match"]["misses"], 2)
+
     def test_multipattern_match(self):
         dummy_one = DummyTemplate("friend", [DummyTemplate("Hello")])
         dummy_two = DummyTemplate("friend", [DummyTemplate("my")])
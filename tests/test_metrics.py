@@ -0,0 +1,141 @@
+"""
+tests/test_metrics.py
+
+Test Doduo's metrics. Validate histogram rendering in the Prometheus
+text format, and the stage timings recorded by matching, in-process
+and in worker processes.
+"""
+
+import unittest
+from time import sleep
+
+from Doduo import metrics
+from Doduo.matcher import Matcher
+from Doduo.pool import MatcherPool
+from Doduo.query import parse_cache
+from Doduo.template import Template
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.registry
+        metrics.registry = metrics.Registry(enabled=True, patterns=True)
+        parse_cache.clear()
+        self.matcher = Matcher()
+        self.matcher.templates["speak"] = [
+            Template(
+                children=[
+                    Template(
+                        slot_name="lang", ner_match=["language"], optional=True
+                    )
+                ],
+                exact_match=["speak"],
+            )
+        ]
+
+    def tearDown(self):
+        metrics.registry = self.registry
+
+    def test_render(self):
+        registry = metrics.Registry(buckets=(0.1, 1.0))
+        labels = (("template", 'a"b'),)
+        registry.observe("doduo_template_seconds", 0.05, labels)
+        registry.observe("doduo_template_seconds", 0.5, labels)
+        registry.observe("doduo_template_seconds", 5.0, labels)
+        registry.inc("doduo_soft_match_words_total", 3)
+        snapshot = metrics.merge_snapshots(
+            [registry.snapshot(), registry.snapshot()]
+        )
+        text = metrics.render(
+            snapshot,
+            {
+                "parse": {
+                    "hits": 1,
+                    "misses": 2,
+                    "evictions": 0,
+                    "size": 2,
+                }
+            },
+        )
+        lines = text.splitlines()
+        self.assertIn("# TYPE doduo_template_seconds histogram", lines)
+        self.assertIn(
+            'doduo_template_seconds_bucket{template="a\\"b",le="0.1"} 2',
+            lines,
+        )
+        self.assertIn(
+            'doduo_template_seconds_bucket{template="a\\"b",le="+Inf"} 6',
+            lines,
+        )
+        self.assertIn(
+            'doduo_template_seconds_count{template="a\\"b"} 6', lines
+        )
+        self.assertIn("doduo_soft_match_words_total 6", lines)
+        self.assertIn('doduo_cache_misses_total{cache="parse"} 2', lines)
+        self.assertIn('doduo_cache_size{cache="parse"} 2', lines)
+
+    def test_disabled(self):
+        metrics.registry = metrics.Registry(enabled=False)
+        self.assertIs(metrics.timer("doduo_parse_seconds"), metrics.NULL_TIMER)
+        list(self.matcher.match_many(["I like chocolate"], None))
+        list(self.matcher.match("Do you speak English?", None))
+        self.assertEqual(metrics.registry.snapshot()["histograms"], {})
+
+        # Traces record timings whether or not metrics are enabled.
+        with metrics.trace() as timings:
+            self.assertIsNot(metrics.timer("x"), metrics.NULL_TIMER)
+            list(self.matcher.match("Hello my friend", None))
+        self.assertIn("parse", timings)
+        self.assertIn("template:speak", timings)
+        self.assertIs(metrics.timer("x"), metrics.NULL_TIMER)
+        self.assertEqual(metrics.registry.snapshot()["histograms"], {})
+
+    def test_in_process(self):
+        with MatcherPool(self.matcher, 1) as pool:
+            timings = {}
+            pool.match("Do you speak English?", None, timings=timings)
+            self.assertEqual(
+                set(timings),
+                {"parse", "match", "template:speak", "pattern:speak:0"},
+            )
+            timings = {}
+            list(
+                pool.match_many(
+                    ["I like chocolate", "Hello my friend"],
+                    None,
+                    timings=timings,
+                )
+            )
+            self.assertIn("parse", timings)
+            self.assertIn("template:speak", timings)
+
+            snapshot = pool.metrics_snapshot()
+        histograms = snapshot["histograms"]
+        self.assertEqual(sum(histograms[("doduo_parse_seconds", ())][0]), 1)
+        self.assertEqual(sum(histograms[("doduo_match_seconds", ())][0]), 3)
+        self.assertIn(
+            ("doduo_template_seconds", (("template", "speak"),)), histograms
+        )
+
+    def test_workers(self):
+        with MatcherPool(self.matcher, 2, report_interval=0.01) as pool:
+            timings = {}
+            pool.match("Do you speak English?", None, timings=timings)
+            self.assertIn("template:speak", timings)
+            timings = {}
+            queries = [
+                "I like chocolate",
+                "Hello my friend",
+                "Do you speak English or do you speak Chinese?",
+            ]
+            list(pool.match_many(queries, None, batch_size=1, timings=timings))
+            self.assertIn("parse", timings)
+            # Let the workers report their latest tasks.
+            sleep(0.5)
+            snapshot = pool.metrics_snapshot()
+        histograms = snapshot["histograms"]
+        self.assertEqual(sum(histograms[("doduo_match_seconds", ())][0]), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
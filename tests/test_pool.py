@@ -0,0 +1,107 @@
+"""
+tests/test_pool.py
+
+Test Doduo's MatcherPool. Validate that forked workers return the
+same results as the Matcher they share, in input order.
+"""
+
+import gc
+import pickle
+import unittest
+from time import perf_counter, sleep
+
+from Doduo.matcher import Matcher
+from Doduo.pool import MatcherPool
+from Doduo.template import Template
+from Doduo import InvalidUsage
+
+
+QUERIES = [
+    "Do you speak English?",
+    "Hello my friend",
+    "Do you speak English or do you speak Chinese?",
+    "I like chocolate",
+    "Do you speak English?",
+]
+
+
+class TestPool(unittest.TestCase):
+    def setUp(self):
+        self.matcher = Matcher()
+        self.matcher.templates["speak"] = [
+            Template(
+                children=[
+                    Template(
+                        slot_name="lang", ner_match=["language"], optional=True
+                    )
+                ],
+                exact_match=["speak"],
+            )
+        ]
+        self.expected = [
+            list(self.matcher.match(query, None)) for query in QUERIES
+        ]
+
+    def test_in_process(self):
+        with MatcherPool(self.matcher, 1) as pool:
+            self.assertIsNone(pool.pool)
+            self.assertEqual(pool.match(QUERIES[0], None), self.expected[0])
+            self.assertEqual(
+                list(pool.match_many(QUERIES, None, batch_size=2)),
+                self.expected,
+            )
+
+    def test_workers(self):
+        with MatcherPool(self.matcher, 2, report_interval=0.01) as pool:
+            self.assertEqual(pool.match(QUERIES[0], None), self.expected[0])
+            self.assertEqual(
+                list(pool.match_many(QUERIES, None, batch_size=2)),
+                self.expected,
+            )
+            self.assertEqual(
+                list(pool.match_many(iter(QUERIES), ["speak"], batch_size=1)),
+                self.expected,
+            )
+            with self.assertRaises(InvalidUsage):
+                list(pool.match_many(QUERIES + [None], None, batch_size=2))
+            # Each chunk looks up its distinct queries once; the last
+            # chunk of the invalid batch fails before any lookup. Let
+            # the workers report their latest tasks first.
+            sleep(0.5)
+            stats = pool.cache_stats()
+            self.assertEqual(stats["match"]["maxsize"], 0)
+            self.assertEqual(
+                stats["parse"]["hits"] + stats["parse"]["misses"],
+                1 + 5 + 5 + 4,
+            )
+        self.assertIsNone(pool.pool)
+        if hasattr(gc, "get_freeze_count"):
+            self.assertEqual(gc.get_freeze_count(), 0)
+
+    def test_stats_while_busy(self):
+        with MatcherPool(self.matcher, 2) as pool:
+            busy = pool.pool.apply_async(sleep, (3,))
+            start = perf_counter()
+            stats = pool.cache_stats()
+            pool.metrics_snapshot()
+            # Statistics are read from the latest reports, without
+            # waiting on the busy worker.
+            self.assertLess(perf_counter() - start, 1)
+            self.assertEqual(stats["parse"]["misses"], 0)
+            busy.get()
+
+    def test_pickled_matcher(self):
+        # Workers not forked from the server are sent the Matcher.
+        self.matcher.get_index()
+        matcher = pickle.loads(pickle.dumps(self.matcher))
+        self.assertEqual(matcher.version, self.matcher.version)
+        self.assertTrue(matcher.get_index() is matcher.get_index())
+        self.assertEqual(matcher.version, self.matcher.version)
+        self.assertEqual(
+            [list(matcher.match(query, None)) for query in QUERIES],
+            self.expected,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
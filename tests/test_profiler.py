@@ -0,0 +1,98 @@
+"""
+tests/test_profiler.py
+
+Test Doduo's pattern profiler. Validate the per-pattern counters
+recorded by a profiling Matcher, and their ranking.
+"""
+
+import io
+import unittest
+
+from Doduo.matcher import Matcher
+from Doduo.profiler import Profiler, profile_jsonl, format_report
+from Doduo.template import Template
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.matcher = Matcher(profile=True)
+        self.matcher.templates["speak"] = [
+            Template(
+                children=[
+                    Template(
+                        slot_name="lang", ner_match=["language"], optional=True
+                    ),
+                    Template(slot_name="who", pos_match=["PRON"]),
+                ],
+                exact_match=["speak"],
+            ),
+            Template(exact_match=["chocolate"]),
+        ]
+        self.matcher.templates["greet"] = [Template(exact_match=["hello"])]
+
+    def test_counters(self):
+        results = list(
+            self.matcher.match(
+                "Do you speak English or do you speak Chinese?", None
+            )
+        )
+        self.assertEqual(
+            results[0]["speak"], {"lang": ["English"], "who": ["you"]}
+        )
+
+        stats = self.matcher.profiler.patterns[("speak", 0)]
+        self.assertEqual(stats.roots, 2)
+        self.assertEqual(stats.matches, 2)
+        self.assertGreaterEqual(stats.calls, 2)
+        self.assertGreater(stats.hypotheses, 0)
+        self.assertGreaterEqual(stats.peak, 2)
+        self.assertGreater(stats.seconds, 0)
+        self.assertEqual(self.matcher.profiler.patterns[("greet", 0)].roots, 0)
+
+        # Profiling leaves the results unchanged.
+        plain = Matcher()
+        plain.templates = self.matcher.templates
+        self.assertEqual(
+            list(
+                plain.match(
+                    "Do you speak English or do you speak Chinese?", None
+                )
+            ),
+            results,
+        )
+        self.assertIsNone(plain.profiler)
+
+    def test_report(self):
+        queries = io.BytesIO(
+            b'"Do you speak English?"\n'
+            b'{"query": "I like chocolate"}\n'
+            b'"Hello my friend"\n'
+        )
+        self.assertEqual(profile_jsonl(self.matcher, queries), 3)
+        report = self.matcher.profiler.report(sort="calls")
+        self.assertEqual(report[0]["template"], "speak")
+        self.assertEqual(report[0]["pattern"], 0)
+        self.assertEqual(
+            [row["calls"] for row in report],
+            sorted((row["calls"] for row in report), reverse=True),
+        )
+        self.assertEqual(len(self.matcher.profiler.report(top=1)), 1)
+        with self.assertRaises(ValueError):
+            self.matcher.profiler.report(sort="nope")
+
+        table = format_report(report).splitlines()
+        self.assertEqual(len(table), len(report) + 1)
+        self.assertTrue(table[0].startswith("template"))
+
+    def test_stats(self):
+        profiler = Profiler()
+        stats = profiler.stats("a", 0)
+        self.assertIs(profiler.stats("a", 0), stats)
+        stats.calls += 3
+        self.assertEqual(profiler.report()[0]["calls"], 3)
+        profiler.clear()
+        self.assertEqual(profiler.report(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+tests/test_quantize.py
+
+Test Doduo's quantized store validation. Validate that soft match
+verdicts barely change between float32 and int8 stores, and that
+flips are counted.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from Doduo.embeddings import (
+    EmbeddingStore,
+    VOCAB_SUFFIX,
+    VECTORS_SUFFIX,
+    quantize_store,
+)
+from Doduo.quantize import compare_verdicts, verdicts
+from Doduo import ConfigException
+
+
+class TestQuantize(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        centers = rng.standard_normal((4, 64))
+        vecs = np.repeat(centers, 50, axis=0)
+        vecs += 0.6 * rng.standard_normal(vecs.shape)
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+        self.words = ["w{:03d}".format(i) for i in range(len(vecs))]
+        self.path = os.path.join(self.tmp_dir, "store")
+        np.save(self.path + VOCAB_SUFFIX, np.array(self.words, dtype="S"))
+        np.save(self.path + VECTORS_SUFFIX, vecs.astype(np.float32))
+        self.store = EmbeddingStore.open(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_identical(self):
+        seeds = [self.words[:5], self.words[50:60]]
+        report = compare_verdicts(self.store, self.store, seeds, self.words)
+        self.assertEqual(report["words"], 200)
+        self.assertEqual(report["decisions"], 400)
+        self.assertEqual(report["flips"], 0)
+        self.assertGreater(report["positives"], 15)
+        self.assertEqual(report["flipped_models"], [])
+
+    def test_int8(self):
+        quantize_store(self.store, self.path + ".int8", "int8")
+        quantized = EmbeddingStore.open(self.path + ".int8")
+        seeds = [self.words[i : i + 5] for i in range(0, 200, 25)]
+        report = compare_verdicts(
+            self.store, quantized, seeds, self.words + ["W000!", "oov"]
+        )
+        self.assertEqual(report["words"], 201)
+        self.assertLessEqual(report["flips"], report["decisions"] // 100)
+        self.assertEqual(report["flips"], report["gained"] + report["lost"])
+
+    def test_flips(self):
+        # A store of only the seeds' own vectors loses every other word.
+        np.save(
+            self.path + ".seeds" + VOCAB_SUFFIX,
+            np.array(self.words[:5], dtype="S"),
+        )
+        np.save(
+            self.path + ".seeds" + VECTORS_SUFFIX,
+            np.asarray(self.store.vectors[:5]),
+        )
+        seeds_only = EmbeddingStore.open(self.path + ".seeds")
+        expected = verdicts(self.store, self.words[:5], self.words)
+        report = compare_verdicts(
+            self.store, seeds_only, [self.words[:5]], self.words
+        )
+        self.assertEqual(report["lost"], int(expected[5:].sum()))
+        self.assertEqual(report["gained"], 0)
+        self.assertEqual(len(report["flipped_models"]), 1)
+        with self.assertRaises(ConfigException):
+            verdicts(seeds_only, ["w199"], self.words)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,7 +6,8 @@ Test Doduo's Query class. Validate query tree build process.
 
 import unittest
 
-from Doduo.query import parse_query
+from Doduo.query import parse_query, parse_queries, parse_cache, Sentence
+from Doduo.labels import label_id
 
 
 class TestQuery(unittest.TestCase):
@@ -70,6 +71,53 @@ class TestQuery(unittest.TestCase):
         self.assertEqual(main_child.get_phrase(), "two sentences")
         self.assertEqual(main_child.get_compound(), "sentences")
 
+    def test_sentence_arrays(self):
+        kenobi_node = parse_query(
+            "Hello there General Kenobi. This should be two sentences."
+        )[0][0]
+        sentence = kenobi_node.sentence
+        self.assertTrue(isinstance(sentence, Sentence))
+        self.assertEqual(sentence.words[sentence.root], "Kenobi")
+        self.assertEqual(sentence.lower[sentence.root], "kenobi")
+        self.assertEqual(sentence.pos[sentence.root], label_id("PROPN"))
+        self.assertEqual(sentence.ent[sentence.root], label_id("person"))
+        self.assertEqual(sentence.dep[sentence.root], label_id("ROOT"))
+
+        # Pre-order visits each node before its children.
+        self.assertEqual(len(sentence.preorder), len(sentence))
+        self.assertEqual(sentence.preorder[0], sentence.root)
+        seen = set()
+        for i in sentence.preorder:
+            self.assertFalse(set(sentence.children[i]) & seen)
+            seen.add(i)
+
+    def test_parse_cache(self):
+        parse_cache.clear()
+        first = parse_query("Hello my friend")
+        self.assertEqual(parse_cache.stats()["misses"], 1)
+        second = parse_query("Hello my friend")
+        self.assertEqual(parse_cache.stats()["hits"], 1)
+        self.assertTrue(second[0][0].sentence is first[0][0].sentence)
+        self.assertEqual(second[0][1], "Hello my friend")
+
+        # Whitespace changes Spacy's parse, so it is part of the key.
+        self.assertEqual(parse_cache.get(("Hello my friend\n", ())), None)
+        self.assertEqual(parse_cache.get(("Hello  my friend", ())), None)
+
+        batch = list(
+            parse_queries(
+                ["I like chocolate", "Hello my friend", "I like chocolate"],
+                batch_size=2,
+            )
+        )
+        self.assertEqual(len(batch), 3)
+        self.assertTrue(batch[1][0][0].sentence is first[0][0].sentence)
+        self.assertTrue(batch[0][0][0].sentence is batch[2][0][0].sentence)
+        self.assertEqual(batch[0][0][1], "I like chocolate")
+        with self.assertRaises(TypeError):
+            parse_query(None)
+        parse_cache.clear()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,140 @@
+"""
+tests/test_reload.py
+
+Test Doduo's MatcherReloader. Validate that config reloads swap in
+complete Matchers and keep the current one on failure.
+"""
+
+import os
+import unittest
+from threading import Event, Thread
+from time import sleep
+
+import Doduo
+from Doduo.reload import MatcherReloader
+from Doduo.config import ROOT_DIR
+from Doduo import ConfigException, metrics
+
+
+CONFIG_FILE = "reload_tests.yml"
+
+FIRST_CONFIG = """
+like_template:
+  patterns:
+    - exact_match: ["like"]
+"""
+
+SECOND_CONFIG = """
+chocolate_template:
+  patterns:
+    - exact_match: ["chocolate"]
+"""
+
+
+def worker_models(_):
+    """ Process id and names of the models loaded in a worker. """
+    # Hold the worker, so the other workers take the next requests.
+    sleep(0.5)
+    return os.getpid(), sorted(Doduo._models)
+
+
+class TestReload(unittest.TestCase):
+    def setUp(self):
+        self.path = ROOT_DIR + "configs/" + CONFIG_FILE
+        self.write(FIRST_CONFIG, 1000000000)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write(self, config, mtime):
+        with open(self.path, "w") as f:
+            f.write(config)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_reload(self):
+        reloader = MatcherReloader(CONFIG_FILE, processes=1)
+        pool = reloader.pool
+        self.assertEqual(
+            list(pool.match("I like chocolate", None)[0]),
+            ["__sentence__", "__alternatives__", "like_template"],
+        )
+        self.assertEqual(reloader.reload_if_changed(), None)
+
+        self.write(SECOND_CONFIG, 1000000001)
+        self.assertEqual(reloader.reload_if_changed(), 1)
+        self.assertFalse(reloader.pool is pool)
+        self.assertEqual(
+            list(reloader.pool.match("I like chocolate", None)[0]),
+            ["__sentence__", "__alternatives__", "chocolate_template"],
+        )
+        # The replaced pool still serves its own templates.
+        self.assertTrue(
+            "like_template" in pool.match("I like chocolate", None)[0]
+        )
+
+        # A broken config leaves the current Matcher in place.
+        pool = reloader.pool
+        self.write("[not: valid", 1000000002)
+        with self.assertRaises(ConfigException):
+            reloader.reload_if_changed()
+        self.assertTrue(reloader.pool is pool)
+        self.assertEqual(reloader.reload_if_changed(), None)
+        self.assertEqual(reloader.version, 1)
+
+        self.write(FIRST_CONFIG, 1000000003)
+        self.assertEqual(reloader.reload(), 2)
+        self.assertTrue(
+            "like_template" in reloader.pool.match("I like chocolate", None)[0]
+        )
+
+    def test_reload_under_load(self):
+        # The first pool is forked before any other thread runs.
+        reloader = MatcherReloader(CONFIG_FILE, processes=2, grace=0)
+
+        # Keep other threads taking the metrics lock, as request
+        # threads do, while reloads start new worker pools.
+        stop = Event()
+
+        def busy():
+            while not stop.is_set():
+                metrics.record("doduo_request_seconds", 0.001)
+
+        threads = [Thread(target=busy, daemon=True) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in range(2):
+                reloader.reload()
+                pool = reloader.pool
+                answered = []
+                check = Thread(
+                    target=lambda: answered.append(pool.cache_stats()),
+                    daemon=True,
+                )
+                check.start()
+                check.join(60)
+                self.assertTrue(answered, "Reloaded workers hung.")
+                self.assertEqual(answered[0]["match"]["misses"], 0)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            reloader.pool.close()
+
+    def test_reloaded_workers_warm(self):
+        reloader = MatcherReloader(CONFIG_FILE, processes=2, grace=0)
+        try:
+            reloader.reload()
+            # No query was matched yet, yet every worker has its models.
+            reports = reloader.pool.pool.map(
+                worker_models, range(2), chunksize=1
+            )
+            self.assertEqual(len({pid for pid, _ in reports}), 2)
+            for _, models in reports:
+                self.assertTrue("nlp" in models)
+        finally:
+            reloader.pool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
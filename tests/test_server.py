@@ -0,0 +1,114 @@
+"""
+tests/test_server.py
+
+Test Doduo's Flask API. Validate matched responses and the 400
+responses of invalid requests.
+"""
+
+import unittest
+
+import Doduo.server
+from Doduo.server import app
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+
+    def assertInvalid(self, response, error):
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.get_json(), {"success": False, "error": error}
+        )
+
+    def test_match(self):
+        response = self.client.post(
+            "/match", json={"query": "I like chocolate"}
+        )
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertTrue(body["success"])
+        self.assertEqual(len(body["matches"]), 1)
+        self.assertEqual(
+            body["matches"][0]["__sentence__"], "I like chocolate"
+        )
+
+        self.assertInvalid(
+            self.client.post("/match", json={}), "Request missing query."
+        )
+        self.assertInvalid(
+            self.client.post("/match", json={"query": 5}),
+            "Invalid query body.",
+        )
+
+    def test_match_batch(self):
+        queries = ["I like chocolate", "Do you speak English?"]
+        response = self.client.post("/match/batch", json={"queries": queries})
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertTrue(body["success"])
+        self.assertEqual(
+            [matches[0]["__sentence__"] for matches in body["matches"]],
+            queries,
+        )
+        single = self.client.post("/match", json={"query": queries[0]})
+        self.assertEqual(body["matches"][0], single.get_json()["matches"])
+
+        response = self.client.post(
+            "/match/batch", json={"queries": queries, "debug": True}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("request", response.get_json()["timings"])
+
+    def test_match_batch_invalid(self):
+        self.assertInvalid(
+            self.client.post("/match/batch", json={}),
+            "Request missing queries.",
+        )
+        self.assertInvalid(
+            self.client.post(
+                "/match/batch", json={"queries": "I like chocolate"}
+            ),
+            "Invalid queries body.",
+        )
+        self.assertInvalid(
+            self.client.post(
+                "/match/batch", json={"queries": ["I like chocolate", 5]}
+            ),
+            "Invalid queries body.",
+        )
+        self.assertInvalid(
+            self.client.post("/match/batch", json=["I like chocolate"]),
+            "Request body must be a JSON object.",
+        )
+        self.assertInvalid(
+            self.client.post("/match/batch", data="not json"),
+            "Request body must be a JSON object.",
+        )
+
+    def test_admin_reload(self):
+        # Disabled unless an admin token is configured.
+        response = self.client.post("/admin/reload")
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.get_json()["success"])
+
+        token = Doduo.server.ADMIN_TOKEN
+        Doduo.server.ADMIN_TOKEN = "secret"
+        try:
+            for headers in ({}, {"X-Admin-Token": "wrong"}):
+                response = self.client.post("/admin/reload", headers=headers)
+                self.assertEqual(response.status_code, 403)
+            version = Doduo.server.main_reloader.version
+            response = self.client.post(
+                "/admin/reload", headers={"X-Admin-Token": "secret"}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.get_json(), {"success": True, "version": version + 1}
+            )
+        finally:
+            Doduo.server.ADMIN_TOKEN = token
+
+
+if __name__ == "__main__":
+    unittest.main()
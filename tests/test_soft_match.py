@@ -0,0 +1,214 @@
+"""
+tests/test_soft_match.py
+
+Test Doduo's soft matching models against a small embedding store.
+"""
+
+import gc
+import gzip
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from scipy.spatial.distance import cosine
+from scipy.stats import tstd
+import numpy as np
+
+import Doduo
+from Doduo import ConfigException
+from Doduo.embeddings import EmbeddingStore, convert_word2vec
+from Doduo.soft_match import (
+    SoftModel,
+    LSHIndex,
+    build_soft_model,
+    cache_stats,
+    clear_caches,
+    embed,
+    embed_many,
+    soft_models,
+)
+
+
+SAMPLE_DUMP = """8 4
+stout 1.0 0.1 0.0 0.0
+porter 0.9 0.2 0.0 0.1
+lager 0.8 0.4 0.1 0.0
+ale 0.7 0.5 0.0 0.2
+color 0.1 1.0 0.2 0.0
+car 0.0 0.0 1.0 0.1
+bike 0.0 0.1 0.9 0.3
+the 0.3 0.3 0.3 0.3
+"""
+
+
+def reference_soft_model(sample_words):
+    """Loop-based soft model using scipy cosine distances."""
+    sample_vecs = [embed(word) for word in sample_words]
+    distances = [
+        cosine(vec, np.mean(sample_vecs, axis=0)) for vec in sample_vecs
+    ]
+    if np.allclose(distances, 0, atol=1e-6):
+        slack = 0.1
+    else:
+        slack = max(distances) + tstd(distances)
+    sample_vecs.append(np.mean(sample_vecs, axis=0))
+
+    def does_belong(word):
+        try:
+            word_vec = embed(word)
+        except ValueError:
+            return False
+        return min([cosine(word_vec, vec) for vec in sample_vecs]) <= slack
+
+    return does_belong
+
+
+class TestSoftMatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        src = os.path.join(self.tmp_dir, "sample.txt.gz")
+        with gzip.open(src, "wt") as f:
+            f.write(SAMPLE_DUMP)
+        convert_word2vec(src, os.path.join(self.tmp_dir, "sample"))
+        self.prev_models = dict(Doduo._models)
+        Doduo._models["word_model"] = EmbeddingStore.open(
+            os.path.join(self.tmp_dir, "sample")
+        )
+        clear_caches()
+        self.words = [
+            "stout",
+            "porter",
+            "lager",
+            "ale",
+            "color",
+            "car",
+            "bike",
+            "the",
+            "pilsner",
+        ]
+
+    def tearDown(self):
+        Doduo._models.clear()
+        Doduo._models.update(self.prev_models)
+        clear_caches()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_embed(self):
+        self.assertAlmostEqual(np.linalg.norm(embed("Stout!")), 1, places=5)
+        with self.assertRaises(ValueError):
+            embed("pilsner")
+        vecs, found = embed_many(["stout", "pilsner", "car"])
+        self.assertEqual(vecs.shape, (2, 4))
+        self.assertEqual(found.tolist(), [True, False, True])
+
+    def test_build(self):
+        with self.assertRaises(ConfigException):
+            build_soft_model([])
+        with self.assertRaises(ConfigException):
+            build_soft_model(["stout", "pilsner"])
+        model = build_soft_model(["stout"])
+        self.assertAlmostEqual(model.slack, 0.1)
+        self.assertTrue(model("stout"))
+        self.assertFalse(model("car"))
+
+    def test_membership(self):
+        model = build_soft_model(["stout", "porter", "ale"])
+        self.assertTrue(model("lager"))
+        self.assertFalse(model("car"))
+        self.assertFalse(model("pilsner"))
+
+    def test_matches_reference(self):
+        for samples in [
+            ["stout", "porter"],
+            ["stout", "porter", "ale"],
+            ["car", "bike"],
+            ["color", "the"],
+        ]:
+            model = build_soft_model(samples)
+            reference = reference_soft_model(samples)
+            self.assertEqual(
+                [model(word) for word in self.words],
+                [reference(word) for word in self.words],
+            )
+
+    def test_belongs_many(self):
+        model = build_soft_model(["stout", "porter", "ale"])
+        self.assertEqual(
+            model.belongs_many(self.words),
+            [model(word) for word in self.words],
+        )
+        self.assertEqual(model.belongs_many([]), [])
+
+    def test_caches(self):
+        model = build_soft_model(["stout", "porter", "ale"])
+        twin = build_soft_model(["stout", "porter", "ale"])
+        other = build_soft_model(["car", "bike"])
+        self.assertEqual(model.model_id, twin.model_id)
+        self.assertNotEqual(model.model_id, other.model_id)
+
+        clear_caches()
+        self.assertTrue(model("Lager"))
+        self.assertTrue(twin("lager!"))
+        self.assertFalse(other("lager"))
+        self.assertFalse(model("pilsner"))
+        self.assertFalse(model("pilsner"))
+        stats = cache_stats()
+        self.assertEqual(stats["soft_verdict"]["hits"], 2)
+        self.assertEqual(stats["soft_verdict"]["misses"], 3)
+        self.assertEqual(stats["embed"]["hits"], 1)
+        self.assertEqual(stats["embed"]["misses"], 2)
+        self.assertEqual(stats["embed"]["size"], 2)
+
+        self.assertEqual(
+            model.belongs_many(["lager", "car", "pilsner"]),
+            [True, False, False],
+        )
+        self.assertEqual(cache_stats()["soft_verdict"]["hits"], 4)
+
+    def test_model_reuse(self):
+        model = build_soft_model(["stout", "porter"])
+        self.assertTrue(build_soft_model(["stout", "porter"]) is model)
+        self.assertFalse(build_soft_model(["car", "bike"]) is model)
+        self.assertTrue(("stout", "porter") in soft_models)
+        del model
+        gc.collect()
+        self.assertFalse(("stout", "porter") in soft_models)
+
+    def test_pickle(self):
+        model = build_soft_model(["stout", "porter", "ale"])
+        loaded = pickle.loads(pickle.dumps(model))
+        self.assertEqual(loaded.model_id, model.model_id)
+        self.assertEqual(
+            [loaded(word) for word in self.words],
+            [model(word) for word in self.words],
+        )
+
+    def test_large_sample_sets(self):
+        rng = np.random.RandomState(0)
+        samples = rng.standard_normal((20000, 64)).astype(np.float32)
+        samples /= np.linalg.norm(samples, axis=1)[:, None]
+        queries = samples[:200] + 0.05 * rng.standard_normal((200, 64))
+        queries /= np.linalg.norm(queries, axis=1)[:, None]
+
+        exact = SoftModel(samples, 0.05, index_threshold=len(samples))
+        indexed = SoftModel(samples, 0.05, index_threshold=2048)
+        self.assertEqual(exact.index, None)
+        self.assertTrue(isinstance(indexed.index, LSHIndex))
+
+        # Every sample is found exactly, and near neighbours are found
+        # for nearly all of the perturbed queries.
+        self.assertTrue(all(indexed.score_vectors(samples[:500]) > 0.999))
+        exact_verdicts = exact.score_vectors(queries) >= exact.threshold
+        indexed_verdicts = indexed.score_vectors(queries) >= exact.threshold
+        self.assertFalse(any(indexed_verdicts & ~exact_verdicts))
+        self.assertGreater(np.mean(indexed_verdicts == exact_verdicts), 0.9)
+        self.assertLess(
+            np.mean([len(indexed.index.candidates(q)) for q in queries]),
+            len(samples) / 20,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+tests/test_stream.py
+
+Test Doduo's JSON lines streaming. Validate lazy reading, results
+order and resuming from byte offsets, also after a partial write.
+"""
+
+import io
+import json
+import unittest
+
+import Doduo.stream
+from Doduo.matcher import Matcher
+from Doduo.template import Template
+from Doduo.stream import read_jsonl, match_jsonl, resume_jsonl
+from Doduo import InvalidUsage
+
+
+CORPUS = (
+    '{"id": 1, "query": "Do you speak English?"}\n'
+    "\n"
+    '"Hello my friend"\n'
+    '{"id": 3, "query": "I like chocolate"}\n'
+)
+
+
+class TestStream(unittest.TestCase):
+    def setUp(self):
+        self.matcher = Matcher()
+        self.matcher.templates["speak"] = [
+            Template(
+                children=[Template(slot_name="lang", ner_match=["language"])],
+                exact_match=["speak"],
+            )
+        ]
+
+    def test_read_jsonl(self):
+        records = list(read_jsonl(io.BytesIO(CORPUS.encode("utf-8"))))
+        self.assertEqual(
+            [record for record, _ in records],
+            [
+                {"id": 1, "query": "Do you speak English?"},
+                {"query": "Hello my friend"},
+                {"id": 3, "query": "I like chocolate"},
+            ],
+        )
+        ends = [end for _, end in records]
+        self.assertEqual(ends[-1], len(CORPUS))
+        resumed = read_jsonl(io.BytesIO(CORPUS.encode("utf-8")), ends[0])
+        self.assertEqual([end for _, end in resumed], ends[1:])
+
+        with self.assertRaises(InvalidUsage):
+            list(read_jsonl(io.BytesIO(b'{"id": 1}\n')))
+        with self.assertRaises(InvalidUsage):
+            list(read_jsonl(io.BytesIO(b"{not json\n")))
+
+    def test_match_jsonl(self):
+        output = io.StringIO()
+        n = match_jsonl(
+            self.matcher,
+            io.BytesIO(CORPUS.encode("utf-8")),
+            output,
+            batch_size=2,
+        )
+        self.assertEqual(n, 3)
+        results = [
+            json.loads(line) for line in output.getvalue().split("\n")[:-1]
+        ]
+        self.assertEqual(
+            [result.get("id") for result in results], [1, None, 3]
+        )
+        self.assertEqual(
+            results[0]["matches"],
+            list(self.matcher.match("Do you speak English?", None)),
+        )
+        self.assertEqual(
+            results[0]["matches"][0]["speak"], {"lang": ["English"]}
+        )
+        self.assertEqual(results[-1]["offset"], len(CORPUS))
+
+        # Resuming from a written offset only matches the rest.
+        output = io.StringIO()
+        n = match_jsonl(
+            self.matcher,
+            io.BytesIO(CORPUS.encode("utf-8")),
+            output,
+            offset=results[0]["offset"],
+        )
+        self.assertEqual(n, 2)
+        resumed = [
+            json.loads(line) for line in output.getvalue().split("\n")[:-1]
+        ]
+        self.assertEqual(resumed, results[1:])
+
+    def test_resume_partial_line(self):
+        output = io.StringIO()
+        match_jsonl(self.matcher, io.BytesIO(CORPUS.encode("utf-8")), output)
+        lines = output.getvalue().encode("utf-8").splitlines(keepends=True)
+        offset = json.loads(lines[1])["offset"]
+
+        # Killed while writing the third line; scan in small blocks.
+        block_size = Doduo.stream.SCAN_BLOCK_SIZE
+        Doduo.stream.SCAN_BLOCK_SIZE = 8
+        try:
+            results = io.BytesIO(b"".join(lines[:2]) + lines[2][:20])
+            with self.assertRaises(InvalidUsage):
+                resume_jsonl(results, offset - 1)
+            resume_jsonl(results, offset)
+        finally:
+            Doduo.stream.SCAN_BLOCK_SIZE = block_size
+        self.assertEqual(results.getvalue(), b"".join(lines[:2]))
+
+        output = io.StringIO()
+        match_jsonl(
+            self.matcher,
+            io.BytesIO(CORPUS.encode("utf-8")),
+            output,
+            offset=offset,
+        )
+        self.assertEqual(
+            results.getvalue() + output.getvalue().encode("utf-8"),
+            b"".join(lines),
+        )
+
+        # Nothing complete written yet.
+        results = io.BytesIO(lines[0][:10])
+        resume_jsonl(results, 0)
+        self.assertEqual(results.getvalue(), b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+tests/test_subset.py
+
+Test Doduo's subset vocabulary gathering. Validate the words read from
+frequency lists and config seeds, and their normalization.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from Doduo.embeddings import EmbeddingStore, VOCAB_SUFFIX, VECTORS_SUFFIX
+from Doduo.subset import frequency_words, seed_words, build_subset
+
+
+FREQ_LIST = """# word count
+the 100
+Stouts 50
+
+ale 20
+lager 10
+"""
+
+
+class TestSubset(unittest.TestCase):
+    def test_frequency_words(self):
+        words = list(frequency_words(io.StringIO(FREQ_LIST)))
+        self.assertEqual(words, ["the", "Stouts", "ale", "lager"])
+        words = list(frequency_words(io.StringIO(FREQ_LIST), top=2))
+        self.assertEqual(words, ["the", "Stouts"])
+
+    def test_seed_words(self):
+        seeds = seed_words("beer.yml")
+        self.assertTrue(seeds)
+        self.assertTrue(all(isinstance(seed, str) for seed in seeds))
+
+    def test_build_subset(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            src = os.path.join(tmp_dir, "full")
+            np.save(src + VOCAB_SUFFIX, np.array([b"ale", b"stout", b"the"]))
+            np.save(src + VECTORS_SUFFIX, np.eye(3, dtype=np.float32))
+            dst = os.path.join(tmp_dir, "subset")
+            store = EmbeddingStore.open(src)
+            self.assertEqual(
+                build_subset(store, ["Stout", "Ale!", ""], dst), 2
+            )
+            self.assertEqual(
+                list(EmbeddingStore.open(dst).vocab), [b"ale", b"stout"]
+            )
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+tests/test_synthetic.py
+
+Test Doduo's synthetic config and tree generator, and Sentences built
+without Spacy. Validate that generated configs load, that generated
+shapes are bounded and that instantiated trees match their patterns.
+"""
+
+import unittest
+
+from yaml import safe_load
+
+import Doduo
+from Doduo.matcher import Matcher
+from Doduo.query import Sentence, Query
+from Doduo.soft_match import clear_caches
+from Doduo.synthetic import SyntheticGenerator, dump
+
+
+def pattern_depth(blueprint):
+    """Depth of a pattern blueprint, 1 for a single vertex."""
+    return 1 + max(
+        [pattern_depth(child) for child in blueprint.get("children", [])]
+        or [0]
+    )
+
+
+def tree_depth(sentence, i):
+    """Depth of the subtree of a sentence's token."""
+    return 1 + max(
+        [tree_depth(sentence, c) for c in sentence.children[i]] or [0]
+    )
+
+
+class TestSynthetic(unittest.TestCase):
+    def setUp(self):
+        self.prev_models = dict(Doduo._models)
+
+    def tearDown(self):
+        Doduo._models.clear()
+        Doduo._models.update(self.prev_models)
+        clear_caches()
+
+    def test_from_tokens(self):
+        tokens = [
+            ("Do", "VERB", 2, "aux", ""),
+            ("you", "PRON", 2, "nsubj", ""),
+            ("have", "VERB", 2, "ROOT", ""),
+            ("old", "ADJ", 4, "amod", ""),
+            ("porters", "NOUN", 2, "dobj", ""),
+            ("from", "ADP", 4, "prep", ""),
+            ("Ireland", "PROPN", 5, "pobj", "GPE"),
+        ]
+        sentence = Sentence.from_tokens(tokens)
+        self.assertEqual(sentence.text, "Do you have old porters from Ireland")
+        self.assertEqual(sentence.root, 2)
+        self.assertEqual(sentence.children[2], (0, 1, 4))
+        self.assertEqual(sentence.n_lefts[2], 2)
+        self.assertEqual(sentence.children[4], (3, 5))
+        self.assertEqual(sentence.preorder, (2, 0, 1, 4, 3, 5, 6))
+        self.assertEqual(sentence.get_phrase(4), "old porters from Ireland")
+
+        query = Query(sentence, sentence.root)
+        self.assertEqual(query.text, "have")
+        self.assertEqual(query.children[2].rel, "dobj")
+        self.assertEqual(
+            query.children[2].children[1].children[0].ner[0], "gpe"
+        )
+
+        with self.assertRaises(ValueError):
+            Sentence.from_tokens(
+                [("a", "X", 0, "ROOT", ""), ("b", "X", 1, "ROOT", "")]
+            )
+        with self.assertRaises(ValueError):
+            Sentence.from_tokens(
+                [
+                    ("a", "X", 0, "ROOT", ""),
+                    ("b", "X", 2, "dep", ""),
+                    ("c", "X", 1, "dep", ""),
+                ]
+            )
+
+    def test_config(self):
+        generator = SyntheticGenerator(depth=4, branching=3, vocab_size=70)
+        self.assertEqual(len(generator.vocabulary), 70)
+        config = generator.templates(20, 3)
+        self.assertEqual(len(config), 20)
+        self.assertEqual(safe_load(dump(config)), config)
+        self.assertEqual(
+            config,
+            SyntheticGenerator(depth=4, branching=3, vocab_size=70).templates(
+                20, 3
+            ),
+        )
+
+        vocabulary = set(generator.vocabulary)
+        for template in config.values():
+            for pattern in template["patterns"]:
+                self.assertLessEqual(pattern_depth(pattern), 4)
+                self.assertLessEqual(len(pattern.get("children", [])), 3)
+                self.assertTrue(
+                    set(pattern.get("soft_match", [])) <= vocabulary
+                )
+                self.assertTrue(
+                    set(pattern.get("exact_match", [])) <= vocabulary
+                )
+
+        # Without optional children or soft match vertices.
+        generator = SyntheticGenerator(optional_ratio=0, soft_ratio=0)
+        text = dump(generator.templates(10))
+        self.assertNotIn("optional", text)
+        self.assertNotIn("soft_match", text)
+
+    def test_trees(self):
+        generator = SyntheticGenerator(depth=3, branching=3)
+        for _ in range(20):
+            sentence = generator.sentence()
+            self.assertLessEqual(tree_depth(sentence, sentence.root), 3)
+            for children in sentence.children:
+                self.assertLessEqual(len(children), 3)
+
+        config = generator.templates(5)
+        trees = generator.trees(config, 30, match_ratio=1)
+        self.assertEqual(len(trees), 30)
+        for tokens in trees:
+            self.assertEqual(len(Sentence.from_tokens(tokens)), len(tokens))
+
+    def test_match(self):
+        generator = SyntheticGenerator(
+            depth=4, branching=3, optional_ratio=0.3, soft_ratio=0.3, seed=3
+        )
+        Doduo._models["word_model"] = generator.store()
+        clear_caches()
+        matcher = Matcher()
+        for _ in range(30):
+            pattern = generator.pattern()
+            template = matcher.build_template(pattern)
+            for _ in range(3):
+                self.assertTrue(template.match(generator.query(pattern)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,11 +4,15 @@ tests/test_template.py
 Test Doduo's Template class. Validate pattern matching and slot parsing logic.
 """
 
+import gc
 import unittest
 import pdb
 
-from Doduo.template import Template
+from Doduo.template import Template, MatchContext, _nodes
 from Doduo.matcher import Matcher
+from Doduo.query import parse_query
+from Doduo.slots import concat, materialize
+from Doduo import InvalidUsage
 
 
 class TestTemplate(unittest.TestCase):
@@ -495,6 +499,168 @@ class TestTemplate(unittest.TestCase):
             },
         )
 
+    def test_bounded_search(self):
+        def build(**kwargs):
+            M = Matcher(**kwargs)
+            M.templates["test_template"] = [
+                Template(
+                    children=[
+                        Template(
+                            slot_name="lang",
+                            ner_match=["language"],
+                            optional=True,
+                        )
+                    ],
+                    exact_match=["speak"],
+                    slot_name="lang",
+                )
+            ]
+            return next(
+                M.match(
+                    "Do you speak English or do you speak Chinese?",
+                    ["test_template"],
+                )
+            )
+
+        results = build(first_match_only=True)
+        self.assertEqual(
+            results["test_template"], {"lang": ["speak", "English"]}
+        )
+        self.assertEqual(results["__alternatives__"], {})
+
+        results = build(max_alternatives=1)
+        self.assertEqual(
+            results["test_template"], {"lang": ["speak", "English"]}
+        )
+        self.assertEqual(
+            results["__alternatives__"],
+            {"test_template": [{"lang": ["speak"]}]},
+        )
+
+        results = build(dedupe=True)
+        self.assertEqual(
+            results["test_template"], {"lang": ["speak", "English"]}
+        )
+        self.assertEqual(
+            results["__alternatives__"],
+            {
+                "test_template": [
+                    {"lang": ["speak"]},
+                    {"lang": ["speak", "Chinese"]},
+                ]
+            },
+        )
+
+        results = build(max_hypotheses=1)
+        self.assertEqual(
+            results["test_template"], {"lang": ["speak", "English"]}
+        )
+        self.assertEqual(
+            results["__alternatives__"],
+            {"test_template": [{"lang": ["speak", "Chinese"]}]},
+        )
+
+    def test_match_many(self):
+        M = Matcher()
+        M.templates["test_template"] = [
+            Template(
+                children=[
+                    Template(
+                        slot_name="lang", ner_match=["language"], optional=True
+                    )
+                ],
+                exact_match=["speak"],
+            )
+        ]
+        queries = [
+            "Do you speak English or do you speak Chinese?",
+            "Hello my friend",
+            "Do you speak English?",
+        ]
+        self.assertEqual(
+            list(M.match_many(queries, ["test_template"], batch_size=2)),
+            [list(M.match(query, ["test_template"])) for query in queries],
+        )
+        self.assertEqual(list(M.match_many([], None)), [])
+        with self.assertRaises(InvalidUsage):
+            list(M.match_many(["Hello my friend", None], None))
+
+    def test_released_nodes(self):
+        t = Template(exact_match=["released_node_word"], slot_name="x")
+        signature, node_id = t.signature, t.node_id
+        self.assertEqual(
+            Template(
+                exact_match=["released_node_word"], slot_name="x"
+            ).node_id,
+            node_id,
+        )
+        del t
+        gc.collect()
+        self.assertNotIn(signature, _nodes)
+        self.assertNotEqual(
+            Template(
+                exact_match=["released_node_word"], slot_name="x"
+            ).node_id,
+            node_id,
+        )
+
+    def test_shared_subtrees(self):
+        def build(root_word):
+            return Template(
+                children=[
+                    Template(slot_name="who", exact_match=["you"]),
+                    Template(
+                        slot_name="lang", ner_match=["language"], optional=True
+                    ),
+                ],
+                exact_match=[root_word],
+            )
+
+        speak, also_speak, talk = build("speak"), build("speak"), build("talk")
+        self.assertEqual(speak.node_id, also_speak.node_id)
+        self.assertNotEqual(speak.node_id, talk.node_id)
+        self.assertEqual(
+            [c.node_id for c in speak.children],
+            [c.node_id for c in talk.children],
+        )
+
+        sentence = parse_query("Do you speak English?")[0][0].sentence
+        context = MatchContext()
+        results = [
+            t.match_at(sentence, i, context)
+            for t in [speak, talk, also_speak]
+            for i in sentence.preorder
+        ]
+        self.assertEqual(
+            results,
+            [
+                t.match_at(sentence, i)
+                for t in [speak, talk, also_speak]
+                for i in sentence.preorder
+            ],
+        )
+        self.assertEqual(
+            [
+                materialize(x)
+                for x in context.memo[(speak.node_id, sentence.root)]
+            ],
+            [{"who": ["you"], "lang": ["English"]}, {"who": ["you"]}],
+        )
+        self.assertEqual(
+            len([key for key in context.memo if key[0] == speak.node_id]),
+            len(sentence),
+        )
+
+    def test_slot_assignments(self):
+        self.assertEqual(materialize(None), {})
+        self.assertEqual(concat(None, None), None)
+        left = concat(("a", "1"), ("b", "2"))
+        right = concat(("a", "3"), None)
+        both = concat(left, right)
+        self.assertEqual(materialize(both), {"a": ["1", "3"], "b": ["2"]})
+        self.assertEqual(list(materialize(both)), ["a", "b"])
+        self.assertEqual(materialize(left), {"a": ["1"], "b": ["2"]})
+
 
 if __name__ == "__main__":
     unittest.main()